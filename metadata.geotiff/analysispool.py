@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+import logging
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+
+DEFAULT_WORKERS = 1
+DEFAULT_TIMEOUT = 600
+DEFAULT_MAX_RSS_MB = 4096
+
+# how often a running job is checked against its budget, in seconds
+POLL_INTERVAL = 0.2
+
+# imported once in the fork server, so every worker starts with GDAL loaded
+# and its drivers registered
+PRELOAD = ['osgeo.gdal', 'osgeo.ogr', 'osgeo.osr', 'numpy']
+
+
+class JobError(Exception):
+    """An analysis job did not produce a result."""
+
+
+class JobTimeout(JobError):
+    pass
+
+
+class JobMemoryExceeded(JobError):
+    pass
+
+
+class JobFailed(JobError):
+    def __init__(self, message, details=None):
+        JobError.__init__(self, message)
+        self.details = details
+
+
+def _workerLoop(conn):
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        func, args, kwargs = job
+        try:
+            reply = ('ok', func(*args, **kwargs), None)
+        except Exception as e:
+            reply = ('error', '%s: %s' % (type(e).__name__, e), traceback.format_exc())
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # the result could not be pickled
+            conn.send(('error', '%s: %s' % (type(e).__name__, e), traceback.format_exc()))
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_workerLoop, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+
+    def rss(self):
+        """Resident set size in bytes, or None where /proc is not available."""
+        try:
+            with open('/proc/%d/status' % self.process.pid) as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class AnalysisPool:
+    """Pre-forked worker processes that run GDAL/OGR analysis jobs.
+
+    A job is a module level function and its arguments; it runs in an idle
+    worker and its return value (anything picklable, usually a dict) comes
+    back to the caller. Each job has a wall clock budget of timeout seconds
+    and a resident memory budget of max_rss bytes. A worker that goes over
+    either is killed and replaced, and run raises JobTimeout or
+    JobMemoryExceeded; an exception inside the job raises JobFailed.
+    Workers are reused between jobs, so GDAL is imported and its drivers
+    registered once per worker rather than once per file.
+
+    Workers are forked from a fork server started when the pool is created,
+    not from the extractor process, so respawning one later does not copy
+    the threads and sockets of the message consumer. With workers=0 jobs
+    run in the calling process.
+    """
+
+    def __init__(self, workers=None, timeout=None, max_rss=None):
+        self.workers = int(os.getenv('ANALYSIS_WORKERS', DEFAULT_WORKERS)) if workers is None else workers
+        self.timeout = float(os.getenv('ANALYSIS_TIMEOUT', DEFAULT_TIMEOUT)) if timeout is None else timeout
+        if max_rss is None:
+            max_rss = int(os.getenv('ANALYSIS_MAX_RSS_MB', DEFAULT_MAX_RSS_MB)) * 1024 * 1024
+        self.max_rss = max_rss
+        self.logger = logging.getLogger('analysispool')
+        self.idle = queue.Queue()
+        if self.workers <= 0:
+            return
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            self.ctx = multiprocessing.get_context('forkserver')
+            self.ctx.set_forkserver_preload(PRELOAD)
+        else:
+            self.ctx = multiprocessing.get_context('spawn')
+        for _ in range(self.workers):
+            self.idle.put(_Worker(self.ctx))
+
+    def run(self, func, *args, **kwargs):
+        if self.workers <= 0:
+            return func(*args, **kwargs)
+        worker = self.idle.get()
+        try:
+            worker.conn.send((func, args, kwargs))
+            start = time.monotonic()
+            while not worker.conn.poll(POLL_INTERVAL):
+                if not worker.process.is_alive():
+                    code = worker.process.exitcode
+                    worker = self._replace(worker)
+                    raise JobFailed('analysis worker exited with code %s' % code)
+                if self.timeout > 0 and time.monotonic() - start > self.timeout:
+                    worker = self._replace(worker)
+                    raise JobTimeout('analysis took longer than %d seconds' % self.timeout)
+                rss = worker.rss()
+                if self.max_rss > 0 and rss is not None and rss > self.max_rss:
+                    worker = self._replace(worker)
+                    raise JobMemoryExceeded('analysis used more than %d MB of memory' % (self.max_rss // (1024 * 1024)))
+            try:
+                status, value, details = worker.conn.recv()
+            except (EOFError, OSError):
+                # the worker died and its end of the pipe was closed
+                worker.process.join(POLL_INTERVAL)
+                code = worker.process.exitcode
+                worker = self._replace(worker)
+                raise JobFailed('analysis worker exited with code %s' % code)
+        finally:
+            self.idle.put(worker)
+        if status != 'ok':
+            raise JobFailed(value, details)
+        return value
+
+    def _replace(self, worker):
+        self.logger.warning('killing analysis worker %d' % worker.process.pid)
+        worker.kill()
+        return _Worker(self.ctx)
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get().stop()
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def _allocate(megabytes):
+    block = bytearray(megabytes * 1024 * 1024)
+    time.sleep(2 * POLL_INTERVAL)
+    return len(block)
+
+
+def _pid():
+    return os.getpid()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    pool = AnalysisPool(workers=1, timeout=2, max_rss=256 * 1024 * 1024)
+    print('worker pid %d, reused %s' % (pool.run(_pid), pool.run(_pid) == pool.run(_pid)))
+    for func, arg in ((_sleep, 0.5), (_sleep, 5), (_allocate, 512), (_pid, None), (int, 'x')):
+        start = time.monotonic()
+        try:
+            result = pool.run(func, arg) if arg is not None else pool.run(func)
+        except JobError as e:
+            result = '%s: %s' % (type(e).__name__, e)
+        print('%s(%s) -> %s in %.2f s' % (func.__name__, arg, result, time.monotonic() - start))
+    pool.close()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+import json
+import math
+import os
+import sys
+
+import numpy
+from osgeo import gdal, ogr
+
+import rasterstats
+
+# the valid-data mask is built on a grid of at most this many pixels
+DEFAULT_MAX_PIXELS = 512 * 512
+
+# simplification tolerance, in pixels of that grid
+DEFAULT_TOLERANCE = 1.0
+
+# polygons and holes smaller than this many grid pixels are left out
+DEFAULT_MIN_AREA = 4.0
+
+# the footprint never has more vertices than this; past it the tolerance
+# is doubled a few times, then the convex hull or the box is used instead
+DEFAULT_MAX_VERTICES = 1000
+SIMPLIFY_ATTEMPTS = 5
+
+
+def maxPixels():
+    return int(os.getenv('FOOTPRINT_MAX_PIXELS', DEFAULT_MAX_PIXELS))
+
+
+def maxVertices():
+    return int(os.getenv('FOOTPRINT_MAX_VERTICES', DEFAULT_MAX_VERTICES))
+
+
+def vertexCount(footprint):
+    count = 0
+    for i in range(footprint.GetGeometryCount()):
+        polygon = footprint.GetGeometryRef(i)
+        for j in range(polygon.GetGeometryCount()):
+            count += polygon.GetGeometryRef(j).GetPointCount()
+    return count
+
+
+def dropSpecks(footprint, min_area):
+    """footprint without the polygons and holes smaller than min_area."""
+    kept = ogr.Geometry(ogr.wkbMultiPolygon)
+    for i in range(footprint.GetGeometryCount()):
+        polygon = footprint.GetGeometryRef(i)
+        if polygon.GetGeometryCount() == 0 or polygon.GetGeometryRef(0).GetArea() < min_area:
+            continue
+        cleaned = ogr.Geometry(ogr.wkbPolygon)
+        cleaned.AddGeometry(polygon.GetGeometryRef(0).Clone())
+        for j in range(1, polygon.GetGeometryCount()):
+            hole = polygon.GetGeometryRef(j)
+            if hole.GetArea() >= min_area:
+                cleaned.AddGeometry(hole.Clone())
+        kept.AddGeometry(cleaned)
+    return kept
+
+
+def boundVertices(footprint, tolerance, max_vertices):
+    """footprint simplified until it has at most max_vertices vertices."""
+    simplified = footprint
+    for _ in range(SIMPLIFY_ATTEMPTS):
+        candidate = footprint.SimplifyPreserveTopology(tolerance)
+        if candidate is not None and not candidate.IsEmpty():
+            simplified = ogr.ForceToMultiPolygon(candidate)
+        if vertexCount(simplified) <= max_vertices:
+            return simplified
+        tolerance *= 2.0
+    hull = ogr.ForceToMultiPolygon(simplified.ConvexHull())
+    if vertexCount(hull) <= max_vertices:
+        return hull
+    minx, maxx, miny, maxy = simplified.GetEnvelope()
+    ring = ogr.Geometry(ogr.wkbLinearRing)
+    for x, y in ((minx, miny), (maxx, miny), (maxx, maxy), (minx, maxy), (minx, miny)):
+        ring.AddPoint_2D(x, y)
+    box = ogr.Geometry(ogr.wkbPolygon)
+    box.AddGeometry(ring)
+    return ogr.ForceToMultiPolygon(box)
+
+
+def readValidMask(band, max_pixels):
+    """Validity mask of band on a decimated grid, with the grid's geotransform scale.
+
+    Reads the coarsest overview that still has max_pixels pixels and lets
+    GDAL decimate further (nearest neighbour, so nodata is never blended
+    into valid values). Returns (mask, x_scale, y_scale) where the scales
+    are the size of one mask pixel in full resolution pixels.
+    """
+    source = rasterstats.selectOverview(band, max_pixels)
+    factor = max(1.0, math.sqrt(float(source.XSize) * source.YSize / max_pixels))
+    buf_xsize = max(1, int(source.XSize / factor))
+    buf_ysize = max(1, int(source.YSize / factor))
+
+    data = source.ReadAsArray(0, 0, source.XSize, source.YSize, buf_xsize=buf_xsize, buf_ysize=buf_ysize)
+    valid = numpy.ones(data.shape, dtype=bool)
+    if not band.GetMaskFlags() & (gdal.GMF_ALL_VALID | gdal.GMF_NODATA):
+        # per-dataset mask or alpha band
+        mask = source.GetMaskBand().ReadAsArray(0, 0, source.XSize, source.YSize,
+                                                buf_xsize=buf_xsize, buf_ysize=buf_ysize)
+        valid &= mask != 0
+    nodata = band.GetNoDataValue()
+    if data.dtype.kind == 'f':
+        valid &= numpy.isfinite(data)
+    if nodata is not None and not math.isnan(nodata):
+        valid &= data != nodata
+    return valid, float(band.XSize) / buf_xsize, float(band.YSize) / buf_ysize
+
+
+def computeFootprint(dataset, band_index=1, max_pixels=None, tolerance=DEFAULT_TOLERANCE,
+                     min_area=DEFAULT_MIN_AREA, max_vertices=None):
+    """GeoJSON MultiPolygon (dataset CRS) covering the valid pixels of a band.
+
+    Returns None if the band has no valid pixel. A raster without nodata
+    gives its full rectangle without polygonizing anything. Specks and
+    holes below min_area grid pixels are dropped and the outline has at
+    most max_vertices vertices, so a noisy nodata mask stays compact.
+    """
+    if max_pixels is None:
+        max_pixels = maxPixels()
+    if max_vertices is None:
+        max_vertices = maxVertices()
+    band = dataset.GetRasterBand(band_index)
+    valid, x_scale, y_scale = readValidMask(band, max_pixels)
+    if not valid.any():
+        return None
+
+    gt = dataset.GetGeoTransform()
+    grid_gt = (gt[0], gt[1] * x_scale, gt[2] * y_scale, gt[3], gt[4] * x_scale, gt[5] * y_scale)
+    footprint = ogr.Geometry(ogr.wkbMultiPolygon)
+    if valid.all():
+        ring = ogr.Geometry(ogr.wkbLinearRing)
+        for i, j in ((0, 0), (dataset.RasterXSize, 0), (dataset.RasterXSize, dataset.RasterYSize),
+                     (0, dataset.RasterYSize), (0, 0)):
+            ring.AddPoint_2D(gt[0] + gt[1] * i + gt[2] * j, gt[3] + gt[4] * i + gt[5] * j)
+        polygon = ogr.Geometry(ogr.wkbPolygon)
+        polygon.AddGeometry(ring)
+        footprint.AddGeometry(polygon)
+        return json.loads(footprint.ExportToJson())
+
+    rows, cols = valid.shape
+    mem = gdal.GetDriverByName('MEM').Create('', cols, rows, 1, gdal.GDT_Byte)
+    mem.SetGeoTransform(grid_gt)
+    mem_band = mem.GetRasterBand(1)
+    mem_band.WriteArray(valid.astype(numpy.uint8))
+
+    layer_ds = ogr.GetDriverByName('Memory').CreateDataSource('')
+    layer = layer_ds.CreateLayer('footprint', geom_type=ogr.wkbPolygon)
+    layer.CreateField(ogr.FieldDefn('valid', ogr.OFTInteger))
+    # the mask band doubles as the polygonize mask, so only valid areas come out
+    gdal.Polygonize(mem_band, mem_band, layer, 0, [])
+
+    for feature in layer:
+        footprint.AddGeometry(feature.GetGeometryRef().Clone())
+    mem = None
+
+    pixel_area = abs(grid_gt[1] * grid_gt[5] - grid_gt[2] * grid_gt[4])
+    kept = dropSpecks(footprint, pixel_area * min_area)
+    if not kept.IsEmpty():
+        footprint = kept
+    pixel_size = math.hypot(grid_gt[1], grid_gt[4])
+    footprint = boundVertices(footprint, pixel_size * tolerance, max_vertices)
+    return json.loads(footprint.ExportToJson())
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else \
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests', 'inundation-500yr.tif')
+    ds = gdal.Open(source)
+    geometry = computeFootprint(ds)
+    print(json.dumps(geometry))
+    if geometry is not None:
+        print('%d polygons, %d vertices' % (len(geometry['coordinates']),
+                                           sum(len(ring) for polygon in geometry['coordinates'] for ring in polygon)))
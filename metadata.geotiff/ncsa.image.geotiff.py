@@ -3,14 +3,22 @@
 import logging
 import os
 import re
-import gdal
-
-# Geotiff-specific modules: GDAL and pygeoprocessing.
-import pygeoprocessing.geoprocessing as geoprocess
 
 from pyclowder.extractors import Extractor
+from pyclowder.utils import StatusMessage
 import pyclowder.files
 
+import analysispool
+import footprint
+import rasterstats
+import resultcache
+import valuecounts
+from rasterprobe import RasterProbe
+
+# part of the result cache namespace; bump it when the metadata layout or
+# the EPSG lookup changes so results stored by older code are not served
+CACHE_VERSION = 1
+
 # Author: Mostafa Elag, Rui Liu, Yong Wook Kim
 # Date: Feb 2016.
 
@@ -29,6 +37,9 @@ class MetadataGeotiff(Extractor):
         logging.getLogger('pyclowder').setLevel(logging.INFO)
         logging.getLogger('__main__').setLevel(logging.INFO)
 
+        # GDAL runs in worker processes with a time and memory budget, so a
+        # pathological file cannot stall or exhaust the consumer
+        self.analysis = analysispool.AnalysisPool()
 
     """Process the file and upload the metadata."""
 
@@ -40,7 +51,26 @@ class MetadataGeotiff(Extractor):
 
         input_file = resource["local_paths"][0]
         fileid = resource['id']
-        result = self.parse_geotiff(input_file)
+
+        # the same file uploaded to another dataset gets the stored result
+        # every setting that changes the result is part of the namespace
+        cache = resultcache.ResultCache('%s:v%d:stats=%s,%d:classes=%d:footprint=%d,%d' % (
+            self.extractorName, CACHE_VERSION, rasterstats.statisticsMode(), rasterstats.minimumPixels(),
+            valuecounts.maxClasses(), footprint.maxPixels(), footprint.maxVertices()))
+        digest = resultcache.fileDigest(input_file)
+        result = cache.get(digest)
+        if result is None:
+            try:
+                result = self.analysis.run(MetadataGeotiff.parse_geotiff, input_file)
+            except analysispool.JobError as e:
+                connector.status_update(StatusMessage.error, {"type": "file", "id": fileid}, str(e))
+                self.logger.error('[%s] : %s', fileid, e)
+                if getattr(e, 'details', None):
+                    self.logger.debug(e.details)
+                return
+            cache.put(digest, result)
+        else:
+            self.logger.info('[%s] reusing the metadata of an identical file', fileid)
 
         # Context URL
         context_url = "https://clowder.ncsa.illinois.edu/contexts/metadata.jsonld"
@@ -60,47 +90,60 @@ class MetadataGeotiff(Extractor):
         pyclowder.files.upload_metadata(connector, host, secret_key, fileid, metadata)
 
     """Extract and return metadata from the Geotiff file."""
-    def parse_geotiff(self, input_file):
+    @staticmethod
+    def parse_geotiff(input_file):
         # This method was originally written by Dr. Mostafa Elag.
         raster_uri = input_file
-        # Get the bounding box of a raster
-        # bbox_list = geoprocess.get_bounding_box(raster_uri)
-        raster_info = geoprocess.get_raster_info(raster_uri)
-        boundingbox = raster_info.get('bounding_box')
-        bbox_list = [boundingbox[0], boundingbox[3], boundingbox[2], boundingbox[1]]
-        # Get the cell size of a raster
-        cell_size = raster_info.get('pixel_size')
-        # cell_size = geoprocess.get_cell_size_from_uri(raster_uri)
-
-        # Get the projection of a raster as well-known text
-        proj_wkt = raster_info.get('projection_wkt')
-        # proj_wkt = geoprocess.get_dataset_projection_wkt_uri(raster_uri)
-        proj = re.findall('"([^"]*)"', proj_wkt)[0]
-
-        # Get the datatype of a raster
-        dtype = raster_info.get('datatype')
-        # dtype = geoprocess.get_datatype_from_uri(raster_uri)
-
-        # Get dimension and size properties of a raster
-        properties_dict = dict()
-        properties_dict['width'] = raster_info.get('pixel_size')[0]
-        properties_dict['height'] = raster_info.get('pixel_size')[1]
-        properties_dict['x_size'] = raster_info.get('raster_size')[0]
-        properties_dict['y_size'] = raster_info.get('raster_size')[1]
-        # properties_dict = geoprocess.raster_properties()
-        # Get a raster's attribute table
-        attr_dict = {1: 'type1', 2: 'type2'}
-        gtif = gdal.Open(raster_uri)
-        srcband = gtif.GetRasterBand(1)
-        # Get raster statistics
-        stats = srcband.GetStatistics(False, True)
-        rast_stats = dict()
-        rast_stats['max'] = stats[1]
-        rast_stats['min'] = stats[0]
-        rast_stats['average'] = stats[2]
-        rast_stats['st-dev'] = stats[3]
-        #geoprocess.create_rat_uri(raster_uri, attr_dict, column_name)
-        # rat_dict = geoprocess.get_rat_as_dictionary_uri(raster_uri)
+        # size, georeferencing and datatype come from the tiff header; the
+        # raster is opened through GDAL once, for the pixel statistics
+        with RasterProbe(raster_uri) as probe:
+            # Get the bounding box of a raster
+            # bbox_list = geoprocess.get_bounding_box(raster_uri)
+            raster_info = probe.getRasterInfo()
+            boundingbox = raster_info.get('bounding_box')
+            bbox_list = [boundingbox[0], boundingbox[3], boundingbox[2], boundingbox[1]]
+            # Get the cell size of a raster
+            cell_size = raster_info.get('pixel_size')
+            # cell_size = geoprocess.get_cell_size_from_uri(raster_uri)
+
+            # Get the projection of a raster as well-known text
+            proj_wkt = raster_info.get('projection_wkt')
+            # proj_wkt = geoprocess.get_dataset_projection_wkt_uri(raster_uri)
+            proj = re.findall('"([^"]*)"', proj_wkt)[0]
+
+            # Get the datatype of a raster
+            dtype = raster_info.get('datatype')
+            # dtype = geoprocess.get_datatype_from_uri(raster_uri)
+
+            # Get dimension and size properties of a raster
+            properties_dict = dict()
+            properties_dict['width'] = raster_info.get('pixel_size')[0]
+            properties_dict['height'] = raster_info.get('pixel_size')[1]
+            properties_dict['x_size'] = raster_info.get('raster_size')[0]
+            properties_dict['y_size'] = raster_info.get('raster_size')[1]
+            # properties_dict = geoprocess.raster_properties()
+            # Get raster statistics for every band; the first band is also
+            # reported on its own as before. Integer bands with few distinct
+            # values also get class counts and their attribute table names.
+            band_stats = probe.getAllStatistics(value_counts=True)
+            rast_stats = dict(band_stats[0])
+            rast_stats.pop('value_counts', None)
+            bands = []
+            for band_info, stats in zip(probe.getBandInfo(), band_stats):
+                band_entry = {'band': band_info['band'], 'datatype': band_info['datatype'],
+                              'nodata': band_info['nodata'],
+                              'color_interpretation': band_info['color_interpretation']}
+                value_counts = stats.pop('value_counts', None)
+                band_entry['rast_stats'] = stats
+                if value_counts is not None:
+                    band_entry['value_counts'] = value_counts
+                    class_names = probe.getClassNames(band_info['band'])
+                    if class_names is not None:
+                        band_entry['class_names'] = class_names
+                bands.append(band_entry)
+            # outline of the valid pixels, so nodata areas do not match spatial
+            # searches; built on a decimated grid
+            outline = probe.getFootprint()
 
         # Get the number of rows and columns of a raster
         row_col = (properties_dict['y_size'], properties_dict['x_size'])
@@ -112,10 +155,13 @@ class MetadataGeotiff(Extractor):
 
         # Need to add the context and field from the GML
         ''' do we need to call the SAS spatial annotation from here or directly add  the context and fields'''
-        Raster_info = {'GeoJSON': {'type': 'Polygon', 'coordinates': [
-            [[bbox_list[0], bbox_list[3]], [bbox_list[0], bbox_list[1]], [bbox_list[2], bbox_list[1]],
-             [bbox_list[2], bbox_list[3]], [bbox_list[0], bbox_list[3]]]]}, 'box': bbox_list, 'proj': proj,
-                       'properties': properties_dict, 'nrow_col': row_col, 'rast_stats': rast_stats}
+        if outline is None:
+            outline = {'type': 'Polygon', 'coordinates': [
+                [[bbox_list[0], bbox_list[3]], [bbox_list[0], bbox_list[1]], [bbox_list[2], bbox_list[1]],
+                 [bbox_list[2], bbox_list[3]], [bbox_list[0], bbox_list[3]]]]}
+        Raster_info = {'GeoJSON': outline, 'box': bbox_list, 'proj': proj,
+                       'properties': properties_dict, 'nrow_col': row_col, 'rast_stats': rast_stats,
+                       'bands': bands}
 
         return Raster_info
 
@@ -129,15 +175,6 @@ class MetadataGeotiff(Extractor):
         #mm_array = geoprocess.load_memory_mapped_array(raster_uri, temp_file)
 
 
-        # Get list of unique values in raster
-        #unique_vals_list = geoprocess.unique_raster_values_uri(raster_uri)
-
-        # Get dictionary of unique values in raster and their count
-        #unique_vals_count_dict = geoprocess.unique_raster_values_count(raster_uri)
-        #print unique_vals_count_dict
-
-        #defaultdict(<type 'int'>, {0.0: 3, 0.5: 3, 1.0: 3})
-
         # Get the intersection between rasters
         #dataset_1 = gdal.Open(raster_1_uri)
         #dataset_2 = gdal.Open(raster_2_uri)
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from osgeo import gdal, osr
+
+import footprint
+import rasterstats
+import tiffheader
+from valuecounts import ValueCounts, readClassNames
+
+
+class RasterProbe:
+    """Answer every metadata question about a raster from a single GDAL handle.
+
+    Raster info of a GeoTIFF with an EPSG coded CRS is read from its header
+    alone (see tiffheader); the GDAL dataset is only opened, once, when band
+    info or pixel statistics are asked for, or when the header is not enough.
+    """
+
+    def __init__(self, raster_uri):
+        self.raster_uri = raster_uri
+        self.logger = logging.getLogger('rasterprobe')
+        self.header = tiffheader.readHeader(raster_uri)
+        self._dataset = None
+        if self.header is None:
+            # not a tiff, GDAL has to answer everything
+            self._open()
+
+    def _open(self):
+        self._dataset = gdal.OpenEx(self.raster_uri, gdal.OF_RASTER | gdal.OF_READONLY)
+        if self._dataset is None:
+            raise ValueError("could not open raster %s" % self.raster_uri)
+
+    @property
+    def dataset(self):
+        if self._dataset is None:
+            self._open()
+        return self._dataset
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._dataset = None
+
+    def getRasterInfo(self):
+        """Same keys as pygeoprocessing.get_raster_info."""
+        raster_info = self.getHeaderInfo()
+        if raster_info is not None:
+            return raster_info
+        ds = self.dataset
+        geotransform = ds.GetGeoTransform()
+        x_size = ds.RasterXSize
+        y_size = ds.RasterYSize
+        corners_x = [geotransform[0] + geotransform[1] * i + geotransform[2] * j
+                     for i in (0, x_size) for j in (0, y_size)]
+        corners_y = [geotransform[3] + geotransform[4] * i + geotransform[5] * j
+                     for i in (0, x_size) for j in (0, y_size)]
+        first_band = ds.GetRasterBand(1)
+
+        raster_info = dict()
+        raster_info['pixel_size'] = (geotransform[1], geotransform[5])
+        raster_info['raster_size'] = (x_size, y_size)
+        raster_info['mean_pixel_size'] = (abs(geotransform[1]) + abs(geotransform[5])) / 2.0
+        raster_info['geotransform'] = geotransform
+        raster_info['n_bands'] = ds.RasterCount
+        raster_info['nodata'] = [ds.GetRasterBand(i).GetNoDataValue() for i in range(1, ds.RasterCount + 1)]
+        raster_info['datatype'] = first_band.DataType
+        raster_info['block_size'] = first_band.GetBlockSize()
+        raster_info['bounding_box'] = [min(corners_x), min(corners_y), max(corners_x), max(corners_y)]
+        raster_info['projection_wkt'] = ds.GetProjection()
+        raster_info['file_list'] = ds.GetFileList()
+        return raster_info
+
+    def getHeaderInfo(self):
+        """getRasterInfo from the TIFF header only, or None if GDAL is needed."""
+        header = self.header
+        if header is None or header.epsg is None or header.geotransform is None or header.datatype is None:
+            return None
+        srs = osr.SpatialReference()
+        if srs.ImportFromEPSG(header.epsg) != 0:
+            return None
+        geotransform = header.geotransform
+
+        raster_info = dict()
+        raster_info['pixel_size'] = (geotransform[1], geotransform[5])
+        raster_info['raster_size'] = (header.width, header.height)
+        raster_info['mean_pixel_size'] = (abs(geotransform[1]) + abs(geotransform[5])) / 2.0
+        raster_info['geotransform'] = geotransform
+        raster_info['n_bands'] = header.bands
+        raster_info['nodata'] = [header.nodata] * header.bands
+        raster_info['datatype'] = header.datatype
+        raster_info['block_size'] = header.blockSize
+        raster_info['bounding_box'] = header.boundingBox
+        raster_info['projection_wkt'] = srs.ExportToWkt()
+        raster_info['file_list'] = [self.raster_uri] + [self.raster_uri + suffix for suffix in ('.ovr', '.msk', '.aux.xml')
+                                                        if os.path.exists(self.raster_uri + suffix)]
+        return raster_info
+
+    def getBandInfo(self):
+        bands = []
+        for i in range(1, self.dataset.RasterCount + 1):
+            band = self.dataset.GetRasterBand(i)
+            info = dict()
+            info['band'] = i
+            info['datatype'] = gdal.GetDataTypeName(band.DataType)
+            info['nodata'] = band.GetNoDataValue()
+            info['block_size'] = band.GetBlockSize()
+            info['overviews'] = band.GetOverviewCount()
+            info['color_interpretation'] = gdal.GetColorInterpretationName(band.GetColorInterpretation())
+            info['has_color_table'] = band.GetColorTable() is not None
+            bands.append(info)
+        return bands
+
+    def getStatistics(self, band_index=1):
+        # streamed block by block; unlike GetStatistics this never writes
+        # a .aux.xml next to the input
+        return rasterstats.computeBandStatistics(self.dataset.GetRasterBand(band_index)).toDict()
+
+    def getAllStatistics(self, workers=None, mode=None, value_counts=False):
+        """Statistics of every band, in band order.
+
+        In approximate mode each band is summarised from its coarsest overview
+        that still has STATS_MIN_PIXELS pixels. With value_counts, integer
+        bands also get a 'value_counts' table gathered in the same pass
+        (exact mode only, resampled overviews have no meaningful counts).
+        """
+        if mode is None:
+            mode = rasterstats.statisticsMode()
+        if mode == rasterstats.APPROXIMATE:
+            return [rasterstats.computeApproximateStatistics(self.dataset.GetRasterBand(i))
+                    for i in range(1, self.dataset.RasterCount + 1)]
+        if workers is None:
+            workers = rasterstats.defaultWorkers()
+        factory = ValueCounts if value_counts else None
+        if workers <= 1:
+            results = [(i, rasterstats.computeBandStatistics(self.dataset.GetRasterBand(i),
+                                                             sketch=factory() if factory else None))
+                       for i in range(1, self.dataset.RasterCount + 1)]
+        else:
+            # worker threads need their own handles; see computeAllBandStatistics
+            results = rasterstats.computeAllBandStatistics(self.raster_uri, workers, sketch_factory=factory)
+
+        all_stats = []
+        for _, stats in results:
+            rast_stats = stats.toDict()
+            counts = stats.sketch.toDict() if stats.sketch is not None else None
+            if counts is not None:
+                rast_stats['value_counts'] = counts
+            all_stats.append(rast_stats)
+        return all_stats
+
+    def getClassNames(self, band_index=1):
+        return readClassNames(self.dataset.GetRasterBand(band_index))
+
+    def getFootprint(self, band_index=1):
+        """GeoJSON MultiPolygon of the valid pixels, None if disabled or empty."""
+        max_pixels = footprint.maxPixels()
+        if max_pixels <= 0:
+            return None
+        return footprint.computeFootprint(self.dataset, band_index, max_pixels)
+
+
+# ----------------------------------------------------------------------
+# Benchmark: legacy double open vs. single probe.
+# usage: python rasterprobe.py [raster ...]
+# Without arguments runs on tests/inundation-500yr.tif plus synthetic rasters.
+# The legacy arm needs pygeoprocessing, which the extractor no longer
+# installs; without it only the probe is timed.
+
+def _read_io():
+    # bytes and read syscalls issued by this process so far (linux only)
+    counters = {}
+    with open('/proc/self/io') as f:
+        for line in f:
+            key, value = line.split(':')
+            counters[key] = int(value)
+    return counters['rchar'], counters['syscr']
+
+
+def _legacy_geoprocess():
+    try:
+        import pygeoprocessing.geoprocessing as geoprocess
+    except ImportError:
+        return None
+    return geoprocess
+
+
+def _legacy_probe(raster_uri):
+    raster_info = _legacy_geoprocess().get_raster_info(raster_uri)
+    gtif = gdal.Open(raster_uri)
+    stats = gtif.GetRasterBand(1).GetStatistics(False, True)
+    gtif = None
+    return raster_info, stats
+
+
+def _single_probe(raster_uri):
+    with RasterProbe(raster_uri) as probe:
+        return probe.getRasterInfo(), probe.getStatistics()
+
+
+def _synthetic_raster(directory, size, tiled):
+    import numpy
+    path = os.path.join(directory, 'synthetic_%d_%s.tif' % (size, 'tiled' if tiled else 'strip'))
+    options = ['TILED=YES'] if tiled else []
+    ds = gdal.GetDriverByName('GTiff').Create(path, size, size, 1, gdal.GDT_Float32, options)
+    ds.SetGeoTransform((421364.63, 24.0, 0.0, 5099434.5, 0.0, -24.0))
+    ds.SetProjection('EPSG:32610')
+    band = ds.GetRasterBand(1)
+    rows = max(1, (64 << 20) // (size * 4))
+    for yoff in range(0, size, rows):
+        nrows = min(rows, size - yoff)
+        band.WriteArray(numpy.random.random((nrows, size)).astype(numpy.float32), 0, yoff)
+    ds = None
+    return path
+
+
+def _benchmark(raster_uri, repeat=3, legacy=True):
+    arms = [('legacy', _legacy_probe)] if legacy else []
+    arms.append(('probe', _single_probe))
+    results = {}
+    for name, func in arms:
+        best = None
+        for _ in range(repeat):
+            # drop statistics cached in .aux.xml so both paths do the same work
+            if os.path.exists(raster_uri + '.aux.xml'):
+                os.remove(raster_uri + '.aux.xml')
+            rchar, syscr = _read_io()
+            start = time.perf_counter()
+            func(raster_uri)
+            elapsed = time.perf_counter() - start
+            rchar2, syscr2 = _read_io()
+            run = (elapsed, rchar2 - rchar, syscr2 - syscr)
+            if best is None or run[0] < best[0]:
+                best = run
+        results[name] = best
+    print('%s' % raster_uri)
+    for name, _ in arms:
+        elapsed, nbytes, ncalls = results[name]
+        print('  %-7s %9.2f ms %12d bytes read %8d read calls' % (name, elapsed * 1000.0, nbytes, ncalls))
+    if not legacy:
+        return
+    saved = results['legacy'][1] - results['probe'][1]
+    print('  saved   %9.2f ms %12d bytes read %8d read calls' %
+          ((results['legacy'][0] - results['probe'][0]) * 1000.0, saved, results['legacy'][2] - results['probe'][2]))
+
+
+if __name__ == "__main__":
+    gdal.UseExceptions()
+    import shutil
+    workdir = tempfile.mkdtemp()
+    try:
+        if len(sys.argv) > 1:
+            sources = sys.argv[1:]
+        else:
+            sources = [os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests', 'inundation-500yr.tif')]
+        # the benchmark deletes .aux.xml files, which may hold georeferencing
+        # or attribute tables; it only ever works on copies
+        rasters = []
+        for source in sources:
+            copy = os.path.join(workdir, '%d_%s' % (len(rasters), os.path.basename(source)))
+            shutil.copyfile(source, copy)
+            rasters.append(copy)
+        if len(sys.argv) == 1:
+            rasters += [_synthetic_raster(workdir, size, tiled) for size in (2048, 8192) for tiled in (False, True)]
+        legacy = _legacy_geoprocess() is not None
+        if not legacy:
+            print('pygeoprocessing is not installed, skipping the legacy comparison')
+        for raster in rasters:
+            _benchmark(raster, legacy=legacy)
+    finally:
+        shutil.rmtree(workdir)
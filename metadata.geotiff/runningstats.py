@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+import math
+
+import numpy
+
+
+class RunningStats:
+    """Mergeable count / min / max / mean / variance accumulator.
+
+    Each block is reduced with numpy and folded in with Chan's parallel
+    update of Welford's algorithm, so partial results from different blocks,
+    row ranges or threads can be merged without losing precision.
+    An optional sketch (any object with update(values) and merge(other),
+    e.g. a quantile sketch) is fed the same values in the same pass.
+    """
+
+    def __init__(self, sketch=None):
+        self.sketch = sketch
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, values):
+        n = values.size
+        if n == 0:
+            return
+        block_mean = float(values.mean(dtype=numpy.float64))
+        deviation = values.astype(numpy.float64)
+        deviation -= block_mean
+        block_m2 = float(numpy.dot(deviation, deviation))
+        self._combine(n, block_mean, block_m2, float(values.min()), float(values.max()))
+        if self.sketch is not None:
+            self.sketch.update(values)
+
+    def merge(self, other):
+        if other.count:
+            self._combine(other.count, other.mean, other.m2, other.min, other.max)
+            if self.sketch is not None and other.sketch is not None:
+                self.sketch.merge(other.sketch)
+        return self
+
+    def _combine(self, n, mean, m2, minimum, maximum):
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min = min(self.min, minimum)
+        self.max = max(self.max, maximum)
+
+    def toDict(self):
+        """Statistics in the layout of the 'rast_stats' metadata entry."""
+        rast_stats = dict()
+        if self.count == 0:
+            rast_stats['max'] = None
+            rast_stats['min'] = None
+            rast_stats['average'] = None
+            rast_stats['st-dev'] = None
+        else:
+            rast_stats['max'] = self.max
+            rast_stats['min'] = self.min
+            rast_stats['average'] = self.mean
+            # population standard deviation, same as GDAL
+            rast_stats['st-dev'] = math.sqrt(self.m2 / self.count)
+        rast_stats['count'] = self.count
+        return rast_stats
+
+
+def splitRows(band, parts):
+    """Split the rows of a band into at most parts ranges aligned on block rows."""
+    block_y = band.GetBlockSize()[1]
+    block_rows = int(math.ceil(float(band.YSize) / block_y))
+    parts = max(1, min(parts, block_rows))
+    ranges = []
+    for i in range(parts):
+        start = (block_rows * i // parts) * block_y
+        end = min(band.YSize, (block_rows * (i + 1) // parts) * block_y)
+        if end > start:
+            ranges.append((start, end))
+    return ranges
@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+import analysispool
+
+
+@pytest.fixture
+def pool():
+    pool = analysispool.AnalysisPool(workers=1, timeout=1, max_rss=1024 * 1024 * 1024)
+    yield pool
+    pool.close()
+
+
+def test_result_and_worker_reuse(pool):
+    assert pool.run(analysispool._sleep, 0.1) == 0.1
+    pid = pool.run(analysispool._pid)
+    assert pid != os.getpid()
+    assert pool.run(analysispool._pid) == pid
+
+
+def test_timeout_replaces_worker(pool):
+    pid = pool.run(analysispool._pid)
+    with pytest.raises(analysispool.JobTimeout):
+        pool.run(analysispool._sleep, 5)
+    assert pool.run(analysispool._pid) != pid
+
+
+def test_memory_budget_replaces_worker():
+    pool = analysispool.AnalysisPool(workers=1, timeout=10, max_rss=256 * 1024 * 1024)
+    try:
+        pid = pool.run(analysispool._pid)
+        with pytest.raises(analysispool.JobMemoryExceeded):
+            pool.run(analysispool._allocate, 512)
+        assert pool.run(analysispool._pid) != pid
+    finally:
+        pool.close()
+
+
+def test_exception_keeps_worker(pool):
+    pid = pool.run(analysispool._pid)
+    with pytest.raises(analysispool.JobFailed) as failure:
+        pool.run(int, 'x')
+    assert 'ValueError' in str(failure.value)
+    assert 'Traceback' in failure.value.details
+    assert pool.run(analysispool._pid) == pid
+
+
+def test_dead_worker_is_replaced(pool):
+    pid = pool.run(analysispool._pid)
+    with pytest.raises(analysispool.JobFailed, match='exited with code 3'):
+        pool.run(os._exit, 3)
+    assert pool.run(analysispool._pid) != pid
+
+
+def test_in_process_without_workers():
+    pool = analysispool.AnalysisPool(workers=0)
+    assert pool.run(analysispool._pid) == os.getpid()
+    with pytest.raises(ValueError):
+        pool.run(int, 'x')
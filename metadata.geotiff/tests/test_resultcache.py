@@ -0,0 +1,81 @@
+import json
+
+import resultcache
+
+# every stored value below is this many bytes of JSON
+VALUE = {'data': 'x' * 90}
+SIZE = len(json.dumps(VALUE))
+
+
+def test_round_trip_per_namespace(tmp_path):
+    cache = resultcache.ResultCache('a:v1', directory=str(tmp_path))
+    other = resultcache.ResultCache('a:v2', directory=str(tmp_path))
+    assert cache.enabled
+    assert cache.get('digest') is None
+    cache.put('digest', {'epsg': 4326, 'box': [1.0, 2.0]})
+    assert cache.get('digest') == {'epsg': 4326, 'box': [1.0, 2.0]}
+    # a new namespace does not see results stored under the old one
+    assert other.get('digest') is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = resultcache.ResultCache('a', directory=str(tmp_path), max_bytes=3 * SIZE)
+    for digest in 'abc':
+        cache.put(digest, VALUE)
+    # reading a keeps it, so b is the oldest when d goes in
+    assert cache.get('a') == VALUE
+    cache.put('d', VALUE)
+    assert cache.get('b') is None
+    assert [cache.get(digest) for digest in 'acd'] == [VALUE] * 3
+
+
+def test_eviction_is_shared_by_namespaces(tmp_path):
+    first = resultcache.ResultCache('a', directory=str(tmp_path), max_bytes=2 * SIZE)
+    second = resultcache.ResultCache('b', directory=str(tmp_path), max_bytes=2 * SIZE)
+    first.put('x', VALUE)
+    second.put('x', VALUE)
+    second.put('y', VALUE)
+    assert first.get('x') is None
+    assert second.get('x') == VALUE
+
+
+def test_oversized_result_is_not_stored(tmp_path):
+    cache = resultcache.ResultCache('a', directory=str(tmp_path), max_bytes=SIZE - 1)
+    cache.put('a', VALUE)
+    assert cache.get('a') is None
+
+
+def test_disabled(tmp_path, monkeypatch):
+    monkeypatch.setenv('RESULT_CACHE_DIR', '')
+    assert not resultcache.ResultCache('a').enabled
+    cache = resultcache.ResultCache('a', directory=str(tmp_path), max_bytes=0)
+    assert not cache.enabled
+    cache.put('a', VALUE)
+    assert cache.get('a') is None
+
+
+def test_unusable_directory_disables_cache(tmp_path):
+    blocker = tmp_path / 'file'
+    blocker.write_text('not a directory')
+    cache = resultcache.ResultCache('a', directory=str(blocker / 'cache'))
+    assert not cache.enabled
+    assert cache.get('a') is None
+
+
+def test_broken_database_does_not_fail(tmp_path):
+    cache = resultcache.ResultCache('a', directory=str(tmp_path))
+    cache.put('a', VALUE)
+    for name in ('results.sqlite-wal', 'results.sqlite-shm'):
+        if (tmp_path / name).exists():
+            (tmp_path / name).unlink()
+    (tmp_path / 'results.sqlite').write_bytes(b'not a database' * 100)
+    assert cache.get('a') is None
+    cache.put('b', VALUE)
+    assert not resultcache.ResultCache('a', directory=str(tmp_path)).enabled
+
+
+def test_file_digest(tmp_path):
+    path = tmp_path / 'data'
+    path.write_bytes(b'abc')
+    assert resultcache.fileDigest(str(path)) == \
+        'ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad'
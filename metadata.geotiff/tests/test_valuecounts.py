@@ -0,0 +1,91 @@
+import numpy
+import pytest
+
+import valuecounts
+
+
+def expected(values):
+    found, counts = numpy.unique(values, return_counts=True)
+    return dict((str(value), count) for value, count in zip(found.tolist(), counts.tolist()))
+
+
+@pytest.mark.parametrize('dtype', [numpy.uint8, numpy.int8, numpy.uint16, numpy.int16])
+def test_dense_counts(dtype):
+    info = numpy.iinfo(dtype)
+    values = numpy.random.default_rng(0).integers(info.min, info.max, size=5000, endpoint=True).astype(dtype)
+    counts = valuecounts.ValueCounts(max_classes=1 << 17)
+    for block in numpy.array_split(values, 7):
+        counts.update(block)
+    assert counts.toDict() == expected(values)
+
+
+@pytest.mark.parametrize('low,high', [(-50, 50), (0, 1 << 40)])
+def test_sparse_counts(low, high):
+    rng = numpy.random.default_rng(1)
+    values = rng.choice(numpy.array([low, high, low + 7, high - 3], dtype=numpy.int64), size=1000)
+    counts = valuecounts.ValueCounts(max_classes=10)
+    for block in numpy.array_split(values, 5):
+        counts.update(block)
+    assert counts.toDict() == expected(values)
+
+
+def test_merged_counts():
+    rng = numpy.random.default_rng(2)
+    blocks = [rng.integers(0, 20, size=100).astype(numpy.int32) for _ in range(6)]
+    merged = valuecounts.ValueCounts(max_classes=20)
+    for block in blocks:
+        part = valuecounts.ValueCounts(max_classes=20)
+        part.update(block)
+        part.update(block[:0])
+        merged.merge(part)
+    assert merged.toDict() == expected(numpy.concatenate(blocks))
+
+
+def test_sparse_cap():
+    counts = valuecounts.ValueCounts(max_classes=10)
+    counts.update(numpy.arange(10, dtype=numpy.int32))
+    assert len(counts.toDict()) == 10
+    counts.update(numpy.array([10], dtype=numpy.int32))
+    assert counts.overflow
+    assert counts.toDict() is None
+    assert counts.sparse == {}
+    counts.update(numpy.arange(3, dtype=numpy.int32))
+    assert counts.toDict() is None
+
+
+def test_cap_across_merge():
+    first = valuecounts.ValueCounts(max_classes=10)
+    second = valuecounts.ValueCounts(max_classes=10)
+    first.update(numpy.arange(6, dtype=numpy.int32))
+    second.update(numpy.arange(6, 12, dtype=numpy.int32))
+    assert first.merge(second).toDict() is None
+
+    overflowed = valuecounts.ValueCounts(max_classes=1)
+    overflowed.update(numpy.arange(2, dtype=numpy.int32))
+    fresh = valuecounts.ValueCounts(max_classes=10)
+    fresh.update(numpy.arange(2, dtype=numpy.int32))
+    assert fresh.merge(overflowed).toDict() is None
+
+
+def test_dense_cap():
+    counts = valuecounts.ValueCounts(max_classes=100)
+    counts.update(numpy.arange(100, dtype=numpy.uint8))
+    assert len(counts.toDict()) == 100
+    counts.update(numpy.arange(100, 200, dtype=numpy.uint8))
+    assert counts.toDict() is None
+
+
+def test_float_is_not_categorical():
+    counts = valuecounts.ValueCounts()
+    counts.update(numpy.arange(4.0))
+    assert counts.toDict() is None
+    merged = valuecounts.ValueCounts()
+    merged.update(numpy.arange(4, dtype=numpy.int32))
+    assert merged.merge(counts).toDict() is None
+
+
+def test_max_classes_from_environment(monkeypatch):
+    monkeypatch.setenv('VALUE_COUNTS_MAX_CLASSES', '3')
+    counts = valuecounts.ValueCounts()
+    counts.update(numpy.arange(4, dtype=numpy.int64))
+    assert counts.toDict() is None
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+import os
+import struct
+import sys
+
+# TIFF tags needed for georeferencing and the basic raster description
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+BITS_PER_SAMPLE = 258
+ROWS_PER_STRIP = 278
+SAMPLES_PER_PIXEL = 277
+TILE_WIDTH = 322
+TILE_LENGTH = 323
+SAMPLE_FORMAT = 339
+MODEL_PIXEL_SCALE = 33550
+MODEL_TIEPOINT = 33922
+MODEL_TRANSFORMATION = 34264
+GEO_KEY_DIRECTORY = 34735
+GEO_DOUBLE_PARAMS = 34736
+GEO_ASCII_PARAMS = 34737
+GDAL_NODATA = 42113
+
+# GeoKeys
+GT_MODEL_TYPE = 1024
+GT_RASTER_TYPE = 1025
+GT_CITATION = 1026
+GEOGRAPHIC_TYPE = 2048
+GEOG_CITATION = 2049
+PROJECTED_CS_TYPE = 3072
+PCS_CITATION = 3073
+
+MODEL_TYPE_PROJECTED = 1
+MODEL_TYPE_GEOGRAPHIC = 2
+RASTER_PIXEL_IS_POINT = 2
+USER_DEFINED = 32767
+
+# TIFF field type -> (struct code, size in bytes)
+FIELD_TYPES = {
+    1: ('B', 1), 2: ('s', 1), 3: ('H', 2), 4: ('I', 4), 5: ('II', 8),
+    6: ('b', 1), 7: ('B', 1), 8: ('h', 2), 9: ('i', 4), 10: ('ii', 8),
+    11: ('f', 4), 12: ('d', 8), 16: ('Q', 8), 17: ('q', 8), 18: ('Q', 8),
+}
+
+# (SampleFormat, BitsPerSample) -> GDAL data type code
+GDAL_DATATYPES = {
+    (1, 8): 1, (2, 8): 1, (1, 16): 2, (2, 16): 3, (1, 32): 4, (2, 32): 5,
+    (3, 32): 6, (3, 64): 7,
+}
+GDAL_DATATYPE_NAMES = {1: 'Byte', 2: 'UInt16', 3: 'Int16', 4: 'UInt32', 5: 'Int32', 6: 'Float32', 7: 'Float64'}
+
+
+class GeoTiffHeader:
+    """Georeferencing of a GeoTIFF read from its header without GDAL.
+
+    Only the image file header, the first IFD and the values of the tags
+    listed above are read, with a few small seeks, so the cost does not
+    depend on the size of the file. Classic TIFF and BigTIFF are supported.
+    Raises ValueError for anything that is not a TIFF.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.reads = 0
+        with open(path, 'rb') as f:
+            self._f = f
+            self._parse()
+        self._f = None
+
+    def _read(self, offset, size):
+        self._f.seek(offset)
+        self.reads += 1
+        data = self._f.read(size)
+        if len(data) != size:
+            raise ValueError("truncated tiff %s" % self.path)
+        return data
+
+    def _parse(self):
+        head = self._read(0, 16)
+        if head[:2] == b'II':
+            self.order = '<'
+        elif head[:2] == b'MM':
+            self.order = '>'
+        else:
+            raise ValueError("not a tiff file: %s" % self.path)
+        magic = struct.unpack(self.order + 'H', head[2:4])[0]
+        if magic == 42:
+            self.bigtiff = False
+            ifd_offset = struct.unpack(self.order + 'I', head[4:8])[0]
+            count_format, entry_size, value_size = 'H', 12, 4
+        elif magic == 43:
+            self.bigtiff = True
+            ifd_offset = struct.unpack(self.order + 'Q', head[8:16])[0]
+            count_format, entry_size, value_size = 'Q', 20, 8
+        else:
+            raise ValueError("not a tiff file: %s" % self.path)
+
+        count_size = struct.calcsize(count_format)
+        count = struct.unpack(self.order + count_format, self._read(ifd_offset, count_size))[0]
+        entries = self._read(ifd_offset + count_size, count * entry_size)
+        entry_format = self.order + ('HHQ8s' if self.bigtiff else 'HHI4s')
+
+        self.tags = {}
+        for i in range(count):
+            tag, field_type, n, raw = struct.unpack(entry_format, entries[i * entry_size:(i + 1) * entry_size])
+            if tag not in WANTED_TAGS or field_type not in FIELD_TYPES:
+                continue
+            code, size = FIELD_TYPES[field_type]
+            total = size * n
+            if total <= value_size:
+                data = raw[:total]
+            else:
+                offset = struct.unpack(self.order + ('Q' if self.bigtiff else 'I'), raw)[0]
+                data = self._read(offset, total)
+            if code == 's':
+                self.tags[tag] = data.split(b'\0')[0].decode('latin-1') if field_type == 2 else data
+            else:
+                values = struct.unpack(self.order + code * n, data)
+                if field_type in (5, 10):
+                    values = tuple(values[j] / float(values[j + 1]) if values[j + 1] else 0.0
+                                   for j in range(0, len(values), 2))
+                self.tags[tag] = values
+        self.geokeys = self._parseGeoKeys()
+
+    def _parseGeoKeys(self):
+        directory = self.tags.get(GEO_KEY_DIRECTORY)
+        if not directory or len(directory) < 4:
+            return {}
+        doubles = self.tags.get(GEO_DOUBLE_PARAMS, ())
+        ascii = self.tags.get(GEO_ASCII_PARAMS, '')
+        keys = {}
+        for i in range(directory[3]):
+            key, location, count, value = directory[4 + i * 4:8 + i * 4]
+            if location == 0:
+                keys[key] = value
+            elif location == GEO_DOUBLE_PARAMS:
+                keys[key] = doubles[value:value + count] if count > 1 else doubles[value]
+            elif location == GEO_ASCII_PARAMS:
+                keys[key] = ascii[value:value + count].rstrip('|')
+            elif location == GEO_KEY_DIRECTORY:
+                keys[key] = directory[value:value + count]
+        return keys
+
+    def _first(self, tag, default=None):
+        values = self.tags.get(tag)
+        return values[0] if values else default
+
+    @property
+    def width(self):
+        return self._first(IMAGE_WIDTH)
+
+    @property
+    def height(self):
+        return self._first(IMAGE_LENGTH)
+
+    @property
+    def bands(self):
+        return self._first(SAMPLES_PER_PIXEL, 1)
+
+    @property
+    def datatype(self):
+        """GDAL data type code, or None for types not mapped here."""
+        return GDAL_DATATYPES.get((self._first(SAMPLE_FORMAT, 1), self._first(BITS_PER_SAMPLE, 1)))
+
+    @property
+    def blockSize(self):
+        if TILE_WIDTH in self.tags:
+            return [self._first(TILE_WIDTH), self._first(TILE_LENGTH)]
+        return [self.width, min(self.height, self._first(ROWS_PER_STRIP, self.height))]
+
+    @property
+    def nodata(self):
+        value = self.tags.get(GDAL_NODATA)
+        if value is None:
+            return None
+        if isinstance(value, bytes):
+            value = value.split(b'\0')[0].decode('latin-1')
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    @property
+    def isGeo(self):
+        return bool(self.geokeys) or MODEL_TRANSFORMATION in self.tags
+
+    @property
+    def epsg(self):
+        """EPSG code of the CRS, or None if it is user defined or missing."""
+        model_type = self.geokeys.get(GT_MODEL_TYPE)
+        if model_type == MODEL_TYPE_PROJECTED:
+            code = self.geokeys.get(PROJECTED_CS_TYPE)
+        elif model_type == MODEL_TYPE_GEOGRAPHIC:
+            code = self.geokeys.get(GEOGRAPHIC_TYPE)
+        else:
+            code = self.geokeys.get(PROJECTED_CS_TYPE, self.geokeys.get(GEOGRAPHIC_TYPE))
+        if code is None or code == USER_DEFINED or not 1024 <= code < USER_DEFINED:
+            return None
+        return code
+
+    @property
+    def citation(self):
+        for key in (PCS_CITATION, GT_CITATION, GEOG_CITATION):
+            if key in self.geokeys:
+                return self.geokeys[key]
+        return None
+
+    @property
+    def geotransform(self):
+        """GDAL-style geotransform, or None when the file has no georeferencing."""
+        pixel_is_point = self.geokeys.get(GT_RASTER_TYPE) == RASTER_PIXEL_IS_POINT
+        if MODEL_TRANSFORMATION in self.tags:
+            m = self.tags[MODEL_TRANSFORMATION]
+            origin_x, origin_y = m[3], m[7]
+            if pixel_is_point:
+                # GDAL moves the origin half a pixel along both pixel axes
+                origin_x -= (m[0] + m[1]) * 0.5
+                origin_y -= (m[4] + m[5]) * 0.5
+            return (origin_x, m[0], m[1], origin_y, m[4], m[5])
+        scale = self.tags.get(MODEL_PIXEL_SCALE)
+        tiepoint = self.tags.get(MODEL_TIEPOINT)
+        if not scale or not tiepoint or len(tiepoint) < 6:
+            return None
+        i, j, _, x, y, _ = tiepoint[:6]
+        origin_x = x - i * scale[0]
+        origin_y = y + j * scale[1]
+        if pixel_is_point:
+            # same half pixel shift GDAL applies to PixelIsPoint rasters
+            origin_x -= scale[0] * 0.5
+            origin_y += scale[1] * 0.5
+        return (origin_x, scale[0], 0.0, origin_y, 0.0, -scale[1])
+
+    @property
+    def boundingBox(self):
+        """[minx, miny, maxx, maxy] in the raster's CRS."""
+        gt = self.geotransform
+        if gt is None:
+            return None
+        xs = [gt[0] + gt[1] * i + gt[2] * j for i in (0, self.width) for j in (0, self.height)]
+        ys = [gt[3] + gt[4] * i + gt[5] * j for i in (0, self.width) for j in (0, self.height)]
+        return [min(xs), min(ys), max(xs), max(ys)]
+
+
+WANTED_TAGS = frozenset([
+    IMAGE_WIDTH, IMAGE_LENGTH, BITS_PER_SAMPLE, ROWS_PER_STRIP, SAMPLES_PER_PIXEL, TILE_WIDTH, TILE_LENGTH,
+    SAMPLE_FORMAT, MODEL_PIXEL_SCALE, MODEL_TIEPOINT, MODEL_TRANSFORMATION, GEO_KEY_DIRECTORY,
+    GEO_DOUBLE_PARAMS, GEO_ASCII_PARAMS, GDAL_NODATA,
+])
+
+
+def readHeader(path):
+    """GeoTiffHeader for path, or None if it can not be parsed as a TIFF."""
+    try:
+        return GeoTiffHeader(path)
+    except (ValueError, struct.error, OSError):
+        return None
+
+
+if __name__ == "__main__":
+    for source in sys.argv[1:] or [os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests', 'inundation-500yr.tif')]:
+        header = readHeader(source)
+        if header is None:
+            print('%s: not a tiff' % source)
+            continue
+        print('%s: %d reads, bigtiff %s' % (source, header.reads, header.bigtiff))
+        print('  size %s x %s x %s, datatype %s, block %s, nodata %s' %
+              (header.width, header.height, header.bands, GDAL_DATATYPE_NAMES.get(header.datatype),
+               header.blockSize, header.nodata))
+        print('  epsg %s (%s)' % (header.epsg, header.citation))
+        print('  geotransform %s' % (header.geotransform,))
+        print('  bbox %s' % header.boundingBox)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+import os
+
+import numpy
+
+# rasters with more distinct values than this are not treated as categorical
+DEFAULT_MAX_CLASSES = 1024
+
+# integer blocks whose value range fits in this many bins are counted with
+# numpy.bincount, anything wider falls back to numpy.unique
+BINCOUNT_RANGE = 1 << 20
+
+
+def maxClasses():
+    return int(os.getenv('VALUE_COUNTS_MAX_CLASSES', DEFAULT_MAX_CLASSES))
+
+
+class ValueCounts:
+    """Bounded, mergeable pixel value -> count table for integer bands.
+
+    8 and 16 bit data is counted into a dense array covering the whole type
+    range with numpy.bincount, which runs at memory bandwidth and never
+    grows. Wider integer types are counted per block and kept in a dict
+    that is abandoned once it holds more than max_classes values, so memory
+    stays bounded for continuous data. Floating point bands are not
+    categorical and yield no counts.
+
+    Has the update(values) / merge(other) interface of a RunningStats sketch,
+    so counts are gathered in the same (parallel) pass as the statistics.
+    """
+
+    def __init__(self, max_classes=None):
+        self.max_classes = maxClasses() if max_classes is None else max_classes
+        self.applicable = True
+        self.overflow = False
+        self.dense = None
+        self.offset = 0
+        self.sparse = {}
+
+    def update(self, values):
+        if not self.applicable or self.overflow or values.size == 0:
+            return
+        if values.dtype.kind not in 'iu':
+            self.applicable = False
+            return
+        if values.dtype.itemsize <= 2:
+            if self.dense is None:
+                info = numpy.iinfo(values.dtype)
+                self.offset = int(info.min)
+                self.dense = numpy.zeros(int(info.max) - self.offset + 1, dtype=numpy.int64)
+            if self.offset:
+                values = values.astype(numpy.int32) - self.offset
+            self.dense += numpy.bincount(values, minlength=self.dense.size)
+            return
+
+        low = int(values.min())
+        high = int(values.max())
+        if high - low < BINCOUNT_RANGE:
+            counts = numpy.bincount((values - low).astype(numpy.intp))
+            found = numpy.flatnonzero(counts)
+            pairs = zip((found + low).tolist(), counts[found].tolist())
+        else:
+            found, counts = numpy.unique(values, return_counts=True)
+            pairs = zip(found.tolist(), counts.tolist())
+        self._add(pairs)
+
+    def merge(self, other):
+        if not other.applicable:
+            self.applicable = False
+        if other.overflow:
+            self._overflow()
+        if not self.applicable or self.overflow:
+            return self
+        if other.dense is not None:
+            if self.dense is None:
+                self.dense = other.dense.copy()
+                self.offset = other.offset
+            else:
+                self.dense += other.dense
+        self._add(other.sparse.items())
+        return self
+
+    def _add(self, pairs):
+        for value, count in pairs:
+            self.sparse[value] = self.sparse.get(value, 0) + count
+        if len(self.sparse) > self.max_classes:
+            self._overflow()
+
+    def _overflow(self):
+        self.overflow = True
+        self.sparse = {}
+
+    def toDict(self):
+        """Value -> count with string keys, or None if the band is not categorical."""
+        if not self.applicable or self.overflow:
+            return None
+        counts = dict(self.sparse)
+        if self.dense is not None:
+            found = numpy.flatnonzero(self.dense)
+            for value, count in zip((found + self.offset).tolist(), self.dense[found].tolist()):
+                counts[value] = counts.get(value, 0) + count
+        if len(counts) > self.max_classes:
+            return None
+        return dict((str(value), counts[value]) for value in sorted(counts))
+
+
+def readClassNames(band):
+    """Class names from the band's raster attribute table, keyed like toDict."""
+    # the counting above is plain numpy; only this needs GDAL
+    from osgeo import gdal
+
+    rat = band.GetDefaultRAT()
+    if rat is None:
+        return None
+    value_column = None
+    name_column = None
+    for i in range(rat.GetColumnCount()):
+        usage = rat.GetUsageOfCol(i)
+        if usage in (gdal.GFU_MinMax, gdal.GFU_Min) and value_column is None:
+            value_column = i
+        elif usage == gdal.GFU_Name and name_column is None:
+            name_column = i
+    if name_column is None:
+        return None
+    names = dict()
+    for row in range(rat.GetRowCount()):
+        value = rat.GetValueAsInt(row, value_column) if value_column is not None else row
+        names[str(value)] = rat.GetValueAsString(row, name_column)
+    return names
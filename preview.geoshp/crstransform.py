@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+import sys
+import threading
+import time
+
+import numpy
+from osgeo import osr
+
+WEB_MERCATOR = 3857
+WGS84 = 4326
+
+
+def spatialReference(crs):
+    """osr.SpatialReference of an EPSG code (int) or any osr user input (WKT, 'EPSG:n').
+
+    Axes are always in x/y (longitude/latitude) order, as in GDAL 2.
+    """
+    srs = osr.SpatialReference()
+    if isinstance(crs, int):
+        result = srs.ImportFromEPSG(crs)
+    else:
+        result = srs.SetFromUserInput(str(crs))
+    if result != 0:
+        raise ValueError('unknown coordinate reference system %s' % crs)
+    if hasattr(srs, 'SetAxisMappingStrategy'):
+        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return srs
+
+
+class Transformer:
+    """Transformation between two coordinate reference systems.
+
+    An osr.CoordinateTransformation must not be used from two threads at
+    once, so every thread gets its own, built on first use and kept for
+    the life of the process.
+    """
+
+    def __init__(self, source, target):
+        self.source = source
+        self.target = target
+        self.local = threading.local()
+
+    @property
+    def transformation(self):
+        ct = getattr(self.local, 'ct', None)
+        if ct is None:
+            ct = osr.CoordinateTransformation(spatialReference(self.source), spatialReference(self.target))
+            self.local.ct = ct
+        return ct
+
+    def transform_points(self, points):
+        """Transform an (N, 2) or (N, 3) array of x, y[, z] in one call.
+
+        Returns an array of the same shape. Points that can not be
+        transformed come back as inf.
+        """
+        points = numpy.asarray(points, dtype=numpy.float64)
+        if len(points) == 0:
+            return points.copy()
+        result = numpy.array(self.transformation.TransformPoints(points.tolist()), dtype=numpy.float64)
+        return result[:, :points.shape[1]]
+
+    def transform_point(self, x, y):
+        return tuple(self.transform_points([[x, y]])[0])
+
+
+_registry = dict()
+_lock = threading.Lock()
+
+
+def getTransformer(source, target):
+    """Process wide Transformer from source to target, see spatialReference for the CRS forms."""
+    key = (source, target)
+    transformer = _registry.get(key)
+    if transformer is None:
+        with _lock:
+            transformer = _registry.setdefault(key, Transformer(source, target))
+    return transformer
+
+
+if __name__ == "__main__":
+    # usage: python crstransform.py [source_epsg]
+    # compares building a transformation per call with the registry
+    source = int(sys.argv[1]) if len(sys.argv) > 1 else 32610
+    points = [[421364.63, 5089450.5], [430724.63, 5099434.5]]
+    repeat = 1000
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        ct = osr.CoordinateTransformation(spatialReference(source), spatialReference(WEB_MERCATOR))
+        for x, y in points:
+            ct.TransformPoint(x, y)
+    per_call = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        getTransformer(source, WEB_MERCATOR).transform_points(points)
+    registry = (time.perf_counter() - start) / repeat
+
+    print(getTransformer(source, WEB_MERCATOR).transform_points(points))
+    print('new transformation per call %.1f us, registry %.1f us' % (per_call * 1e6, registry * 1e6))
@@ -1,9 +1,158 @@
-from geoserver.catalog import Catalog
+from geoserver.catalog import Catalog, FailedRequestError
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os.path
 import tempfile
 import urllib.parse as urlparse
+import atexit
+import collections
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# stores and resources this client publishes
+STORE_PATH = 'datastores'
+RESOURCE_PATH = 'featuretypes'
+
+# a store is deleted with its feature types and layers
+DELETE_PARAMS = {'recurse': 'true'}
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 300
+
+# retried connection attempts; a request that reached geoserver is not
+# sent again, since upload bodies are streamed from files
+CONNECT_RETRIES = 3
+
+
+def poolSize():
+    return int(os.getenv('GEOSERVER_POOL_SIZE', DEFAULT_POOL_SIZE))
+
+
+def timeouts():
+    """(connect, read) timeout of geoserver requests, in seconds."""
+    return (float(os.getenv('GEOSERVER_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)),
+            float(os.getenv('GEOSERVER_READ_TIMEOUT', DEFAULT_READ_TIMEOUT)))
+
+
+class _TimeoutSession(requests.Session):
+    """Session that applies a default timeout to every request."""
+
+    def __init__(self, timeout):
+        requests.Session.__init__(self)
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return requests.Session.request(self, method, url, **kwargs)
+
+
+_sessions = dict()
+_sessionsLock = threading.Lock()
+
+
+def getSession(username, password):
+    """Process wide keep-alive session with a connection pool for a geoserver account."""
+    key = (username, password)
+    with _sessionsLock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _TimeoutSession(timeouts())
+            session.auth = (username, password)
+            # only failed connections are retried, never reads or error statuses
+            retries = Retry(total=None, connect=CONNECT_RETRIES, read=False, status=0, other=0)
+            adapter = HTTPAdapter(pool_maxsize=poolSize(), max_retries=retries)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[key] = session
+    return session
+
+
+DEFAULT_WORKSPACE_TTL = 600
+
+# workspaces known to exist, as (rest url, name) -> time last confirmed
+_knownWorkspaces = dict()
+_workspacesLock = threading.Lock()
+
+
+def workspaceTtl():
+    """Seconds a workspace is trusted to exist without asking geoserver."""
+    return float(os.getenv('GEOSERVER_WORKSPACE_TTL', DEFAULT_WORKSPACE_TTL))
+
+
+def forgetWorkspace(restserver, workspace):
+    with _workspacesLock:
+        _knownWorkspaces.pop((restserver.rstrip('/'), workspace), None)
+
+
+DEFAULT_LAYER_INDEX_SIZE = 10000
+
+# layer names of stores, as (rest url, workspace, store) -> layer name,
+# least recently used first
+_layerIndex = collections.OrderedDict()
+_layerIndexLock = threading.Lock()
+
+
+def layerIndexSize():
+    """Stores whose layer name is remembered; 0 turns the index off."""
+    return int(os.getenv('GEOSERVER_LAYER_INDEX_SIZE', DEFAULT_LAYER_INDEX_SIZE))
+
+
+def indexedLayer(restserver, workspace, storename):
+    key = (restserver.rstrip('/'), workspace, storename)
+    with _layerIndexLock:
+        layername = _layerIndex.get(key)
+        if layername is not None:
+            _layerIndex.move_to_end(key)
+    return layername
+
+
+def indexLayer(restserver, workspace, storename, layername):
+    size = layerIndexSize()
+    if size <= 0:
+        return
+    key = (restserver.rstrip('/'), workspace, storename)
+    with _layerIndexLock:
+        _layerIndex[key] = layername
+        _layerIndex.move_to_end(key)
+        while len(_layerIndex) > size:
+            _layerIndex.popitem(last=False)
+
+
+def forgetLayer(restserver, workspace, storename):
+    with _layerIndexLock:
+        _layerIndex.pop((restserver.rstrip('/'), workspace, storename), None)
+
+
+DEFAULT_REMOVE_DELAY = 2.0
+
+
+def removeDelay():
+    """Seconds removal events are collected before their stores are deleted."""
+    return float(os.getenv('GEOSERVER_REMOVE_DELAY', DEFAULT_REMOVE_DELAY))
+
+
+def hrefWorkspace(href):
+    """Workspace name in the REST url of a store or resource."""
+    parts = href.split('/')
+    return parts[parts.index('workspaces') + 1]
+
+
+class PublishContext:
+    """What one publish has looked up: the resource, the layer and its name.
+
+    A Client is shared by all messages of the process; anything that
+    belongs to a single upload lives here instead.
+    """
+
+    def __init__(self):
+        self.resource = None
+        self.layer = None
+        self.layerName = None
 
 
 class Client:
@@ -13,11 +162,10 @@ class Client:
         self.wmsserver = urlparse.urljoin(geoserver, 'wms')
         self.username = username
         self.password = password
-        self.catalog = Catalog(self.restserver, self.username, self.password) 
-        self.tempDir = tempfile.mkdtemp()
-        self.resource = None
-        self.layer = None
-        self.layerName = None
+        self.session = getSession(self.username, self.password)
+        self.catalog = Catalog(self.restserver, self.username, self.password)
+        # gsconfig has no way to pass a session in; share the pooled one
+        self.catalog._session = self.session
         logging.basicConfig(format="%(asctime)-15s %(name)-10s %(levelname)-7s : %(message)s", level=logging.WARN)
         self.logger = logging.getLogger("gsclient")
         self.logger.setLevel(logging.DEBUG)
@@ -25,49 +173,133 @@ class Client:
         logging.getLogger('pyclowder').setLevel(logging.DEBUG)
         logging.getLogger('__main__').setLevel(logging.DEBUG)
 
+    def ensureWorkspace(self, workspace, geoserver_rest=None, secret_key=None):
+        """True when workspace exists on geoserver, creating it if needed.
+
+        A workspace created or seen in the last GEOSERVER_WORKSPACE_TTL
+        seconds costs no request; otherwise it is created with a single
+        POST, and one that exists already (409) counts as created.
+        """
+        rest = (geoserver_rest or self.restserver).rstrip('/')
+        key = (rest, workspace)
+        with _workspacesLock:
+            seen = _knownWorkspaces.get(key)
+        if seen is not None and time.monotonic() - seen < workspaceTtl():
+            self.logger.debug("workspace %s exists already" % workspace)
+            return True
+
+        params = {'key': secret_key} if secret_key else None
+        new_worksp = "<workspace><name>" + workspace + "</name></workspace>"
+        response = self.session.post(rest + '/workspaces', params=params, headers={"Content-type": "text/xml"}, data=new_worksp)
+        # created by another process, or before a restart
+        exists = response.status_code == 409 or (response.status_code in (401, 403, 500) and 'exist' in response.text.lower())
+        if response.status_code != 201 and not exists:
+            self.logger.error("could not create workspace %s: %s %s" % (workspace, response.status_code, response.text))
+            return False
+        with _workspacesLock:
+            _knownWorkspaces[key] = time.monotonic()
+        return True
+
+    def forgetWorkspace(self, workspace, geoserver_rest=None):
+        """Drop workspace from the cache, after a 404 or when it was deleted."""
+        forgetWorkspace(geoserver_rest or self.restserver, workspace)
+
+    def storeUrl(self, workspace, storename):
+        return urlparse.urljoin(self.restserver, "workspaces/" + workspace + "/" + STORE_PATH + "/" + storename)
+
+    def deleteStore(self, workspace, storename):
+        """Delete a store with everything published from it, in one request.
+
+        There is no catalog reload; geoserver updates its catalog as part
+        of the delete. A store that is gone already counts as deleted.
+        """
+        forgetLayer(self.restserver, workspace, storename)
+        response = self.session.delete(self.storeUrl(workspace, storename), params=DELETE_PARAMS)
+        if response.status_code == 404:
+            # the workspace may be gone as well; ask geoserver next time
+            self.forgetWorkspace(workspace)
+            self.logger.debug("store %s:%s does not exist" % (workspace, storename))
+            return True
+        if response.status_code != 200:
+            self.logger.error("could not delete store %s:%s: %s %s" % (workspace, storename, response.status_code, response.text))
+            return False
+        self.logger.debug("deleted store %s:%s" % (workspace, storename))
+        return True
+
+    def resourceUrl(self, workspace, storename, name=None):
+        """REST url of the resource name of a store, or of the list of its resources."""
+        path = "workspaces/" + workspace + "/" + STORE_PATH + "/" + storename + "/" + RESOURCE_PATH
+        if name is None:
+            return urlparse.urljoin(self.restserver, path + ".xml")
+        return urlparse.urljoin(self.restserver, path + "/" + name + ".xml")
+
     ## this method assume that there is 1 store per layer
-    def getResourceByStoreName(self, storename, workspace):
-        if self.resource != None:
+    def getResourceByStoreName(self, storename, workspace, context=None):
+        """Resource published by a store, fetched by its REST path.
+
+        The resource is named after its store, which costs one request;
+        otherwise the resources of that one store are listed first.
+        """
+        if context is None:
+            context = PublishContext()
+        if context.resource != None:
             self.logger.debug("resource instance found; no need to fetch")
-            return self.resource
-        self.logger.debug("catalog.get_store called")
-        store = self.catalog.get_store(storename, workspace)
-        self.logger.debug("catalog.get_resources called based on store")
-        resources = self.catalog.get_resources(store=store)
-        self.logger.debug("fetched resources from server")
-        if resources == None: 
-            return None
-        else:
-            self.resource = resources[0]
-            return self.resource
+            return context.resource
+        name = storename
+        layername = indexedLayer(self.restserver, workspace, storename)
+        if layername is not None:
+            name = layername.split(':')[-1]
+        try:
+            context.resource = self.catalog.get_resource_by_url(self.resourceUrl(workspace, storename, name))
+        except FailedRequestError:
+            self.logger.debug("no resource %s; listing the resources of store %s" % (name, storename))
+            try:
+                listing = self.catalog.get_xml(self.resourceUrl(workspace, storename))
+            except FailedRequestError:
+                return None
+            names = [node.findtext("name") for node in listing if node.findtext("name")]
+            if not names:
+                return None
+            context.resource = self.catalog.get_resource_by_url(self.resourceUrl(workspace, storename, names[0]))
+        return context.resource
 
     def getLayers(self):
         layers = self.catalog.get_layers()
         return layers
 
-    def getLayerByStoreName(self, storename):
+    def getLayerByStoreName(self, storename, workspace=None):
+        """Layer of a store, fetched by name instead of scanning every layer.
+
+        Without a workspace geoserver resolves the bare store name.
+        """
         self.logger.debug("getLayerbystore name started")
-        layers = self.catalog.get_layers()
-    
-        for layer in layers:
-            if layer.resource.store.name == storename:
-                self.logger.debug("found the layer by store name")
-                return layer
-        return None
-
-    def getLayerByResource(self, resource):
-        if self.layer != None:
+        if workspace is None:
+            return self.catalog.get_layer(storename)
+        layer = self.catalog.get_layer(indexedLayer(self.restserver, workspace, storename) or workspace + ':' + storename)
+        if layer is None:
+            # named differently from its store; go through the resource
+            forgetLayer(self.restserver, workspace, storename)
+            context = PublishContext()
+            resource = self.getResourceByStoreName(storename, workspace, context)
+            if resource is None:
+                return None
+            layer = self.getLayerByResource(resource, context)
+        if layer is not None:
+            self.logger.debug("found the layer by store name")
+            indexLayer(self.restserver, workspace, storename, layer.name)
+        return layer
+
+    def getLayerByResource(self, resource, context=None):
+        if context is None:
+            context = PublishContext()
+        if context.layer != None:
             self.logger.debug("layer instance found; no need to fetch")
-            return self.layer
-            
+            return context.layer
+
         self.logger.debug("get Layer by Resource started...")
-        layers = self.catalog.get_layers(resource)
-        self.logger.debug("fetched layers from the server")
-        if layers == None: 
-            return None
-        else:
-            self.layer = layers[0]
-            return self.layer
+        # a layer is named after its resource
+        context.layer = self.catalog.get_layer(hrefWorkspace(resource.href) + ':' + resource.name)
+        return context.layer
 
     def mintMetadataWithoutGeoserver(self, workspace, filename, extent):
         self.logger.debug("Creating wms metadata ... ")
@@ -81,28 +313,30 @@ class Client:
         self.logger.debug('[DONE]')
         return metadata
 
-    def mintMetadata(self, workspace, storename, extent):
+    def mintMetadata(self, workspace, storename, extent, context=None):
+        if context is None:
+            context = PublishContext()
         self.logger.debug("Creating wms metadata ... ") 
         metadata = {}
         layername = None
-        if self.layerName == None:
-            if self.layer == None:
+        if context.layerName == None:
+            if context.layer == None:
                 self.logger.debug("getResourceByStoreName..")
-                resource = self.getResourceByStoreName(storename, workspace)
+                resource = self.getResourceByStoreName(storename, workspace, context)
                 self.logger.debug("getLayerByResource ...")
-                layer = self.getLayerByResource(resource)
+                layer = self.getLayerByResource(resource, context)
                                 #layername = layer.name 
                 self.logger.debug("done getting layer name")
                 if layer == None: 
                     self.logger.debug('No layer found [DONE]')
                     return metadata
                 else:
-                    layername = layer.name
+                    layername = layer.name.split(':')[-1]
             else:
-                layername = self.layer.name
-                self.layerName = self.layer.name
+                layername = context.layer.name.split(':')[-1]
+                context.layerName = layername
         else:
-            layername = self.layerName
+            layername = context.layerName
         # generate metadata 
         wmsLayerName = workspace + ':' + layername
         metadata['WMS Layer Name'] = wmsLayerName
@@ -112,56 +346,56 @@ class Client:
         self.logger.debug('[DONE]')
         return metadata
 
-    def uploadShapefile(self, geoserver_url, workspace, storename, filename, projection, secret_key, proxy_on):
+    def uploadShapefile(self, geoserver_url, workspace, storename, filename, projection, secret_key, proxy_on, context=None):
+        if context is None:
+            context = PublishContext()
         self.logger.debug("Uploading shapefile" + filename +"...")
 
-        if (proxy_on.lower() == 'true'):
-            self.logger.debug("proxy set to on ....")
-            # TODO activate proxy_on method if the proxy in clowder works
-            return self.geoserver_manipulation_proxy_off(geoserver_url, workspace, storename, filename, projection)
-            # return self.geoserver_manipulation_proxy_on(geoserver_url, workspace, storename, filename, projection, secret_key)
-        else:
-            return self.geoserver_manipulation_proxy_off(geoserver_url, workspace, storename, filename, projection)
-
-    def geoserver_manipulation_proxy_off(self, geoserver_url, workspace, storename, filename, projection):
+        try:
+            if (proxy_on.lower() == 'true'):
+                self.logger.debug("proxy set to on ....")
+                # TODO activate proxy_on method if the proxy in clowder works
+                return self.geoserver_manipulation_proxy_off(geoserver_url, workspace, storename, filename, projection, context)
+                # return self.geoserver_manipulation_proxy_on(geoserver_url, workspace, storename, filename, projection, secret_key)
+            else:
+                return self.geoserver_manipulation_proxy_off(geoserver_url, workspace, storename, filename, projection, context)
+        finally:
+            # gsconfig keeps every document it fetched; one publish needs
+            # them, a long running client must not
+            self.catalog._cache.clear()
+
+    def geoserver_manipulation_proxy_off(self, geoserver_url, workspace, storename, filename, projection, context=None):
+        if context is None:
+            context = PublishContext()
         self.logger.debug("start geoserver manipulation....")
         # create workspace if not present
-        is_workspace = False
-
         self.logger.debug("checking workspace %s" % workspace)
-        response_worksp = requests.get(self.restserver + 'workspaces/' + workspace, auth=(self.username, self.password))
-        if response_worksp.status_code != 200:
-            new_worksp = "<workspace><name>" + workspace + "</name></workspace>"
-            response_worksp = requests.post(self.restserver + 'workspaces',
-                                            headers={"Content-type": "text/xml"},
-                                            auth=(self.username, self.password), data=new_worksp)
-            if response_worksp.status_code == 201:
-                is_workspace = True
-        else:
-            is_workspace = True
+        is_workspace = self.ensureWorkspace(workspace)
 
         if is_workspace:
             url = self.restserver+"workspaces/"+workspace+"/datastores/" + storename + "/file.shp"
             response = None
             self.logger.debug("put file to geosever %s" % url)
             with open(filename, 'rb') as f:
-                response = requests.put(url, headers={'content-type':'application/zip'}, auth=(self.username, self.password),data=f)
+                response = self.session.put(url, headers={'content-type':'application/zip'},data=f)
             self.logger.debug(str(response.status_code) + " " + response.text)
 
+            if response.status_code == 404:
+                # the workspace was removed behind our back
+                self.forgetWorkspace(workspace)
             if response.status_code != 201:
                 self.logger.debug("[DONE]")
                 return False
 
-            self.set_projection(storename, workspace, projection)
+            self.set_projection(storename, workspace, projection, context)
 
             return True
         else:
             return False
 
-    def geoserver_manipulation_proxy_on(self, geoserver_url, workspace, storename, filename, projection, secret_key):
-        # create workspace if not present
-        is_workspace = False
-
+    def geoserver_manipulation_proxy_on(self, geoserver_url, workspace, storename, filename, projection, secret_key, context=None):
+        if context is None:
+            context = PublishContext()
         # this is a direct method, if the proxy works, this should go through proxy
         last_charactor = geoserver_url[-1]
         if last_charactor == '/':
@@ -169,99 +403,130 @@ class Client:
         else:
             geoserver_rest = geoserver_url + '/rest'
 
-        response_worksp = requests.get(geoserver_rest + '/workspaces/' + workspace + '?key=' + secret_key, auth=(self.username, self.password))
-        if response_worksp.status_code != 200:
-            new_worksp = "<workspace><name>" + workspace + "</name></workspace>"
-            response_worksp = requests.post(geoserver_rest + '/workspaces' + '?key=' + secret_key, headers={"Content-type": "text/xml"},
-                                            auth=(self.username, self.password), data=new_worksp)
-            if response_worksp.status_code == 201:
-                is_workspace = True
-        else:
-            is_workspace = True
+        # create workspace if not present
+        is_workspace = self.ensureWorkspace(workspace, geoserver_rest, secret_key)
 
         if is_workspace:
             url = geoserver_rest + "/workspaces/" + workspace + "/datastores/" + storename + "/file.shp"
             response = None
             with open(filename, 'rb') as f:
-                response = requests.put(url + '?key=' + secret_key, headers={'content-type': 'application/zip'}, data=f)
+                response = self.session.put(url + '?key=' + secret_key, headers={'content-type': 'application/zip'}, data=f)
             self.logger.debug(str(response.status_code) + " " + response.text)
 
+            if response.status_code == 404:
+                # the workspace was removed behind our back
+                self.forgetWorkspace(workspace, geoserver_rest)
             if response.status_code != 201:
                 self.logger.debug("[DONE]")
                 return False
 
-            self.set_projection(storename, workspace, projection)
+            self.set_projection(storename, workspace, projection, context)
 
             return True
         else:
             return False
 
-    def set_projection(self,storename, workspace, projection):
-        resource = self.getResourceByStoreName(storename, workspace)
+    def set_projection(self,storename, workspace, projection, context=None):
+        if context is None:
+            context = PublishContext()
+        resource = self.getResourceByStoreName(storename, workspace, context)
 
         if resource.projection == None:
             self.logger.debug('Setting projection' + projection)
             resource.projection = projection
             self.catalog.save(resource)
         self.logger.debug("[DONE]")
-        self.layerName = storename
+        context.layerName = storename
+        indexLayer(self.restserver, workspace, storename, workspace + ':' + storename)
 
-    def createThumbnail(self, workspace, storename, extent, width, height):
+    def createThumbnail(self, workspace, storename, extent, width, height, context=None):
+        if context is None:
+            context = PublishContext()
         self.logger.debug('Creating Thumbnail ...')
         layername = None
-        if self.layerName == None:
-            if self.layer == None:
+        if context.layerName == None:
+            if context.layer == None:
                 self.logger.debug("getResourceByStoreName..")
-                resource = self.getResourceByStoreName(storename, workspace)
+                resource = self.getResourceByStoreName(storename, workspace, context)
                 self.logger.debug("getLayerByResource ...")
-                layer = self.getLayerByResource(resource)
+                layer = self.getLayerByResource(resource, context)
                 self.logger.debug("done getting layer name")
                 if layer == None: 
                     self.logger.debug('No layer found [DONE]')
                     return metadata
                 else:
-                    layername = layer.name
+                    layername = layer.name.split(':')[-1]
             else:
                 self.logger.debug("layer instance found: no need to fetch")
-                layername = self.layer.name
-                self.layerName = self.layer.name
+                layername = context.layer.name.split(':')[-1]
+                context.layerName = layername
         else:
             self.logger.debug("layerName instance found: no need to fetch")
-            layername = self.layerName
+            layername = context.layerName
             #wmsLayerName = workspace+":"+layer.name
             wmsLayerName = workspace+":"+layername
         url = self.wmsserver+"?request=GetMap&layers="+wmsLayerName+"&bbox="+extent+"&width="+width+"&height="+height+"&srs=EPSG:3857&format=image%2Fpng"
 
-        r = requests.get(url, stream=True)
-        path=os.path.join(self.tempDir,'tmp.png')
+        r = self.session.get(url, stream=True)
 
         if r.status_code == 200:
-            tmp = r.headers['content-disposition']
-            tmplist = tmp.split(';')
-            for t in tmplist:
-                if t.strip().find('filename=') != -1:
-                    path = os.path.join(self.tempDir, t.strip().split('=')[1])
-            with open(path, 'wb') as f:
+            # the client lives as long as the process, so the png is not
+            # kept here; the caller removes the returned file
+            fd, path = tempfile.mkstemp(suffix='.png')
+            with os.fdopen(fd, 'wb') as f:
                 for chunk in r.iter_content():
                     f.write(chunk)
             self.logger.debug('[DONE]')
             return path
         else:
+            r.close()
             self.logger.debug('can not create thumbnail [DONE]')
             return ''
 
 
-    def __del__(self):
-        # delete the temp dir
-        if self.tempDir != None:
-            try:
-                import shutil
-                self.logger.debug( "Deleting temp dir "+ self.tempDir)
-                shutil.rmtree(self.tempDir)
-                self.logger.debug("Deleted Temp file")
-            except OSError as exc:
-                if exc.errno != errno.ENOENT:
-                    raise
+class RemovalQueue:
+    """Stores of removed files, deleted in batches.
+
+    Removing a dataset sends one event per file. Stores queued within
+    GEOSERVER_REMOVE_DELAY seconds of each other are deleted together,
+    each once, in parallel over the connection pool of the client.
+    """
+
+    def __init__(self, client, delay=None):
+        self.client = client
+        self.delay = removeDelay() if delay is None else delay
+        self.logger = logging.getLogger("gsclient")
+        # workspace -> names of the stores to delete
+        self.pending = dict()
+        self.lock = threading.Lock()
+        self.timer = None
+        atexit.register(self.flush)
+
+    def add(self, workspace, storename):
+        if self.delay <= 0:
+            self.client.deleteStore(workspace, storename)
+            return
+        with self.lock:
+            self.pending.setdefault(workspace, set()).add(storename)
+            if self.timer is None:
+                self.timer = threading.Timer(self.delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        """Delete the queued stores now; returns how many were deleted."""
+        with self.lock:
+            pending, self.pending = self.pending, dict()
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        stores = [(workspace, storename) for workspace, names in pending.items() for storename in sorted(names)]
+        if not stores:
+            return 0
+        with ThreadPoolExecutor(max_workers=max(1, min(poolSize(), len(stores)))) as executor:
+            deleted = sum(executor.map(lambda store: self.client.deleteStore(*store), stores))
+        self.logger.info("deleted %d of %d stores" % (deleted, len(stores)))
+        return deleted
 
 
 if __name__ == "__main__":
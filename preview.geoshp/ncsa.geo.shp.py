@@ -16,9 +16,13 @@ from pyclowder.utils import StatusMessage
 from pyclowder.utils import CheckMessage
 import pyclowder.files
 
+import analysispool
 import gsclient as gs
+import resultcache
 import zipshputils as zs
-from geoserver.catalog import Catalog
+
+# bump when the cached projection and extent change shape
+CACHE_VERSION = 1
 
 class ExtractorsGeoshpPreview(Extractor):
     def __init__(self):
@@ -35,6 +39,12 @@ class ExtractorsGeoshpPreview(Extractor):
         self.proxy_on = os.getenv('PROXY_ON', 'false')
 
         self.datasetid = None
+        # OGR runs in worker processes with a time and memory budget
+        self.analysis = analysispool.AnalysisPool()
+        # one GeoServer client, and its connection pool, for all messages
+        self.gsclient = None
+        # removed files whose stores are deleted in batches
+        self.removals = None
         self.logger = logging.getLogger('geoshp preview')
         self.logger.setLevel(logging.DEBUG)
         # setup logging for the exctractor
@@ -59,12 +69,13 @@ class ExtractorsGeoshpPreview(Extractor):
 
                 storename = filename + '_' + str(fileid)
                 self.logger.debug("geoserver store name %s" % storename)
-                layername = self.gs_workspace + ':' + storename
+                workspace = self.geoserverWorkspace(resource)
+                layername = workspace + ':' + storename
                 self.logger.debug("geoserver layer name %s" % layername)
 
                 logger.debug('remove layername %s' % layername)
                 logger.debug("CheckMessage.ignore: activity %s for fileid %s " % (action, str(fileid)))
-                self.remove_geoserver_layer(storename, layername)
+                self.remove_geoserver_layer(workspace, storename)
                 logger.debug("activity %s for fileid %s is done" % (action, str(fileid)))
                 return CheckMessage.ignore
         return CheckMessage.download
@@ -81,10 +92,7 @@ class ExtractorsGeoshpPreview(Extractor):
             fileid = resource['id']
 
             # get variable for geoserver workspace. This is a datasets' id
-            try:
-                parentid = resource['parent']['id']
-            except:
-                parentid = "no_datasets"
+            parentid = self.geoserverWorkspace(resource)
             self.gs_workspace = parentid
             self.logger.debug("geoserver workspace id: %s" % parentid)
 
@@ -142,28 +150,24 @@ class ExtractorsGeoshpPreview(Extractor):
             except Exception:
                 pass
 
-    def remove_geoserver_layer(self, storename, layername):
-        self.logger.debug("start removing the geoserver layer")
-        last_charactor = self.geoServer[-1]
-        if last_charactor == '/':
-            geoserver_rest = self.geoServer + 'rest'
-        else:
-            geoserver_rest = self.geoServer + '/rest'
-        cat = Catalog(geoserver_rest, username=self.gs_username, password=self.gs_password)
-        # worksp = cat.get_workspace(gs_workspace)
-        store = cat.get_store(storename)
-        self.logger.debug("store name %s" % store)
-        layer = cat.get_layer(layername)
-        self.logger.debug("layer name %s" % layer)
+    def geoserverWorkspace(self, resource):
+        """GeoServer workspace of a file: the id of its dataset."""
         try:
-            self.logger.debug("deleting the layer...")
-            cat.delete(layer)
-            cat.reload()
-            self.logger.debug("deleting the store...")
-            cat.delete(store)
-            cat.reload
-        except Exception:
-            self.logger.error("Failed to remove from geoserver")
+            return resource['parent']['id']
+        except (KeyError, TypeError):
+            return "no_datasets"
+
+    def geoserverClient(self):
+        """The GeoServer client of this process, created on first use and kept for every message."""
+        if self.gsclient is None:
+            self.gsclient = gs.Client(self.geoServer, self.gs_username, self.gs_password)
+        return self.gsclient
+
+    def remove_geoserver_layer(self, workspace, storename):
+        """Queue the store of a removed file, and its layer, for deletion."""
+        if self.removals is None:
+            self.removals = gs.RemovalQueue(self.geoserverClient())
+        self.removals.add(workspace, storename)
 
     def extractZipShp(self, inputfile, fileid, filename, secret_key):
         self.logger.debug("start zip shp extraction....")
@@ -178,7 +182,20 @@ class ExtractorsGeoshpPreview(Extractor):
         uploadfile = inputfile
         combined_name = filename + "_" + storename
 
-        zipshp = zs.Utils(uploadfile)
+        # projection and extent of a file with the same contents are reused
+        cache = resultcache.ResultCache('%s:v%d' % (self.extractorName, CACHE_VERSION))
+        digest = resultcache.fileDigest(uploadfile)
+        cached = cache.get(digest)
+        if cached is None:
+            try:
+                cached = self.analysis.run(zs.probeZipShp, uploadfile)
+            except analysispool.JobError as e:
+                msg['errorMsg'].append(str(e))
+                return msg
+            cache.put(digest, cached)
+
+        # unpacks the archive again here for the upload, without any OGR work
+        zipshp = zs.Utils(uploadfile, cached=cached)
         if not zipshp.hasError():
             msg['isZipShp'] = True
             result = subprocess.check_output(['file', '-b', '--mime-type', inputfile], stderr=subprocess.STDOUT)
@@ -192,7 +209,7 @@ class ExtractorsGeoshpPreview(Extractor):
             self.logger.debug("finished creating zip file %s" % uploadfile)
 
             # TODO if the proxy is working, gsclient host should be changed to proxy server
-            gsclient = gs.Client(self.geoServer, self.gs_username, self.gs_password)
+            gsclient = self.geoserverClient()
 
             if self.proxy_on.lower() == 'true':
                 parsed_uri = urlparse(self.geoServer)
@@ -1,7 +1,4 @@
 #!/usr/bin/python
-import json
-import urllib
-from osgeo import osr
 from osgeo import ogr
 import tempfile
 import subprocess
@@ -11,10 +8,13 @@ import os.path
 import time
 import logging
 
+import epsgresolver
+import extentengine
+
 class Utils:
     zipUtil = "/usr/bin/7z"
 
-    def __init__(self, shpzipfile, zipUtil="/usr/bin/7z"):
+    def __init__(self, shpzipfile, zipUtil="/usr/bin/7z", cached=None):
         self.zipUtil = zipUtil
         self.shpzipfile = shpzipfile
 
@@ -56,7 +56,12 @@ class Utils:
 
         self.no_proj = 'no_proj'
         
-        if not self.checkZipShp():
+        if not self.checkZipShp() and cached is not None:
+            # projection and extent of an identical file, see resultcache
+            self.zipShpProp['epsg'] = cached['epsg']
+            self.zipShpProp['extent'] = cached['extent']
+            self.zipShpProp['hasError'] = cached['hasError']
+        elif not self.zipShpProp['hasError']:
             # find projection
             epsg_code = self.findProjection()
             if epsg_code == self.no_proj:
@@ -92,6 +97,11 @@ class Utils:
     def hasError(self):
         return self.zipShpProp['hasError']
 
+    def cacheEntry(self):
+        # the OGR/OSR results, reusable for a file with the same contents
+        return {'epsg': self.zipShpProp['epsg'], 'extent': self.zipShpProp['extent'],
+                'hasError': self.zipShpProp['hasError']}
+
     def getEpsg(self):
         return self.zipShpProp['epsg']
 
@@ -174,37 +184,15 @@ class Utils:
         prj_file = open(self.zipShpProp['prjFile'], 'r')
         prj_txt = prj_file.read()
         prj_file.close()
-        prj_code = 'None'
-
-        try:
-            srs = osr.SpatialReference()
-            # check if the projection is not working projection
-            epsg_no = self.checkSpecialProjection(prj_txt)
-            if epsg_no > 0:
-                logging.debug("the projection does not work correctly")
-                return self.no_proj
-            srs.ImportFromESRI([prj_txt])
-            srs.AutoIdentifyEPSG()
-            prj_code=srs.GetAuthorityCode(None)
-
-        except:
-            prj_code = 'None'
-    
-        if str(prj_code).strip() != 'None':
-            return prj_code
-
-        query = urllib.urlencode({'exact':True,'error':True,'mode':'wkt','terms':prj_txt})
-
-        try:
-            webres = urllib.urlopen('http://prj2epsg.org/search.json', query.encode())
-            jres = json.loads(webres.read().decode())
-            if len(jres['codes']) > 0: 
-                prj_code = jres['codes'][0]['code']
-            else: 
-                prj_code = 'None'
-        except:
+        # check if the projection is not working projection
+        epsg_no = self.checkSpecialProjection(prj_txt)
+        if epsg_no > 0:
+            logging.debug("the projection does not work correctly")
+            return self.no_proj
+
+        prj_code = epsgresolver.resolveEpsg(prj_txt)
+        if prj_code is None:
             prj_code = 'None'
-        
         return prj_code
 
     def checkSpecialProjection(self, prj_txt):
@@ -225,54 +213,14 @@ class Utils:
             return 'None'
 
         shpfile = ogr.Open(self.zipShpProp['shpFile'])
-        osrs = osr.SpatialReference()
-        osrs.ImportFromEPSG(int(self.zipShpProp['epsg']))
-        dsrs = osr.SpatialReference()
-        dsrs.ImportFromEPSG(3857) # google projeciton in epsg code
-        ct = osr.CoordinateTransformation(osrs, dsrs)
         layer = shpfile.GetLayer(0)
         a = layer.GetExtent()
-        proj = layer.GetSpatialRef()
-        if proj.GetAttrValue("AUTHORITY", 1) == '4326':
-            a = self.validateBbox(a)
-        ab = ct.TransformPoint(a[2], a[0],0)
-        cd = ct.TransformPoint(a[3], a[1],0)
-        r= [ab[0], ab[1], cd[0], cd[1]]
-
-        return ','.join(map(str,r))
-
-    def validateBbox(self, intuple):
-        lst = list(intuple)
-        tuple_changed = False
-        if intuple[0] <= 180 and intuple[0] > 179:
-            lst[0] = 179
-            tuple_changed = True
-        if intuple[0] >= -180 and intuple[0] < -179:
-            lst[0] = -179
-            tuple_changed = True
-        if intuple[1] <= 180 and intuple[1] > 179:
-            lst[1] = 179
-            tuple_changed = True
-        if intuple[1] >= -180 and intuple[1] < -179:
-            lst[1] = -179
-            tuple_changed = True
-        if intuple[2] <= 90 and intuple[2] > 89:
-            lst[2] = 89
-            tuple_changed = True
-        if intuple[2] >= -90 and intuple[2] < -89:
-            lst[2] = -89
-            tuple_changed = True
-        if intuple[3] <= 90 and intuple[3] > 89:
-            lst[3] = 89
-            tuple_changed = True
-        if intuple[3] >= -90 and intuple[3] < -89:
-            lst[3] = -89
-            tuple_changed = True
-
-        if tuple_changed:
-            return tuple(lst)
-        else:
-            return intuple
+        # GetExtent is (minx, maxx, miny, maxy)
+        extent = extentengine.boxExtent(int(self.zipShpProp['epsg']), a[0], a[2], a[1], a[3])
+        if extent is None:
+            self.logger.debug('findExtent: the extent could not be reprojected')
+            return 'None'
+        return ','.join(map(str, extent['3857']))
 
     def createZip(self, destinationDir, newname):
         if self.zipShpProp['hasError']:
@@ -293,6 +241,11 @@ class Utils:
         return self.zipShpProp['targetZip']
 
 
+def probeZipShp(shpzipfile):
+    """Analysis job (see analysispool): projection and extent as Utils.cacheEntry."""
+    return Utils(shpzipfile).cacheEntry()
+
+
 if __name__ == "__main__":
     source  = "gltg.7z"
     zipshp = Utils(source)
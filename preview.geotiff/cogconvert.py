@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+import logging
+import os
+import sys
+import time
+
+from osgeo import gdal
+
+DEFAULT_BLOCKSIZE = 512
+DEFAULT_COMPRESS = 'DEFLATE'
+
+# codecs that only work on 8 bit data
+BYTE_ONLY_CODECS = ('JPEG', 'WEBP')
+
+# lossless codecs that gain from horizontal differencing
+PREDICTOR_CODECS = ('DEFLATE', 'LZW', 'ZSTD', 'LZMA')
+
+
+def cogEnabled():
+    return os.getenv('COG_ENABLED', 'false').lower() == 'true'
+
+
+def cogOptions(datatype, blocksize=None, compress=None):
+    """COG driver creation options for a raster of the given GDAL datatype."""
+    if blocksize is None:
+        blocksize = int(os.getenv('COG_BLOCKSIZE', DEFAULT_BLOCKSIZE))
+    if compress is None:
+        compress = os.getenv('COG_COMPRESS', DEFAULT_COMPRESS)
+    compress = compress.upper()
+    if compress in BYTE_ONLY_CODECS and datatype != gdal.GDT_Byte:
+        logging.getLogger('cogconvert').debug('%s needs 8 bit data, using %s' % (compress, DEFAULT_COMPRESS))
+        compress = DEFAULT_COMPRESS
+    options = ['BLOCKSIZE=%d' % blocksize, 'COMPRESS=%s' % compress, 'BIGTIFF=IF_SAFER',
+               'NUM_THREADS=ALL_CPUS', 'OVERVIEWS=AUTO']
+    if compress in PREDICTOR_CODECS:
+        options.append('PREDICTOR=YES')
+    return options
+
+
+def isCog(ds):
+    return ds.GetMetadataItem('LAYOUT', 'IMAGE_STRUCTURE') == 'COG'
+
+
+def convertToCog(source, destination, blocksize=None, compress=None):
+    """Rewrite source as a tiled, compressed COG with internal overviews.
+
+    Returns the sizes of both files and the conversion time, or None when
+    source already is a COG and was left alone.
+    """
+    ds = gdal.Open(source)
+    if ds is None:
+        raise ValueError("could not open raster %s" % source)
+    if isCog(ds):
+        return None
+    options = cogOptions(ds.GetRasterBand(1).DataType, blocksize, compress)
+    start = time.perf_counter()
+    result = gdal.Translate(destination, ds, format='COG', creationOptions=options)
+    if result is None:
+        raise RuntimeError("could not write COG %s" % destination)
+    result = None
+    ds = None
+    report = dict()
+    report['options'] = options
+    report['source_bytes'] = os.path.getsize(source)
+    report['cog_bytes'] = os.path.getsize(destination)
+    report['seconds'] = time.perf_counter() - start
+    return report
+
+
+if __name__ == "__main__":
+    # usage: python cogconvert.py input.tif output.tif
+    gdal.UseExceptions()
+    report = convertToCog(sys.argv[1], sys.argv[2])
+    if report is None:
+        print('%s is a COG already' % sys.argv[1])
+    else:
+        print('%s: %d bytes -> %s: %d bytes (%.1f %%) in %.2f s' % (
+            sys.argv[1], report['source_bytes'], sys.argv[2], report['cog_bytes'],
+            100.0 * report['cog_bytes'] / max(1, report['source_bytes']), report['seconds']))
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from functools import lru_cache
+
+from osgeo import osr
+
+LOOKUP_CACHE_SIZE = 1024
+
+# lowest confidence of an osr FindMatches candidate that is accepted
+MIN_CONFIDENCE = 90
+
+_AUTHORITY = re.compile(r',(AUTHORITY|ID)\[[^\[\]]*\]')
+_NUMBER = re.compile(r'(?<![A-Z0-9_.])[-+]?(\d+\.?\d*|\.\d+)(E[-+]?\d+)?(?![A-Z0-9_])')
+
+
+def indexPath():
+    return os.getenv('EPSG_INDEX_PATH', os.path.join(tempfile.gettempdir(), 'geo-epsg-index', 'epsg-index.sqlite'))
+
+
+def projDatabase():
+    """Path of the PROJ database, proj.db, or None if it can not be found."""
+    paths = []
+    if hasattr(osr, 'GetPROJSearchPaths'):
+        paths.extend(osr.GetPROJSearchPaths() or [])
+    for name in ('PROJ_DATA', 'PROJ_LIB'):
+        if os.getenv(name):
+            paths.extend(os.getenv(name).split(os.pathsep))
+    paths.extend(['/usr/share/proj', '/usr/local/share/proj'])
+    for path in paths:
+        candidate = os.path.join(path, 'proj.db')
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def normalizeWkt(wkt):
+    """WKT with authority clauses, case, whitespace and number formatting removed.
+
+    GDAL, ArcGIS and other writers differ in exactly these, so two WKT
+    strings of the same definition normalize to the same text. Quoted names
+    only lose their case.
+    """
+    parts = wkt.strip().upper().split('"')
+    for i in range(0, len(parts), 2):
+        part = ''.join(parts[i].split())
+        parts[i] = _NUMBER.sub(lambda m: '%.10g' % float(m.group(0)), part)
+    return _AUTHORITY.sub('', '"'.join(parts))
+
+
+def wktKey(wkt):
+    return hashlib.sha1(normalizeWkt(wkt).encode('utf-8')).digest()
+
+
+def _epsgCodes(proj_db):
+    db = sqlite3.connect('file:%s?mode=ro' % proj_db, uri=True)
+    try:
+        rows = db.execute("SELECT code FROM projected_crs WHERE auth_name = 'EPSG' AND deprecated = 0 "
+                          "UNION SELECT code FROM geodetic_crs WHERE auth_name = 'EPSG' AND deprecated = 0 "
+                          "AND type = 'geographic 2D'").fetchall()
+    finally:
+        db.close()
+    return sorted(int(row[0]) for row in rows if str(row[0]).isdigit())
+
+
+def _wktVariants(code):
+    """GDAL and ESRI dialect WKT of an EPSG code."""
+    srs = osr.SpatialReference()
+    if srs.ImportFromEPSG(code) != 0:
+        return []
+    variants = [srs.ExportToWkt()]
+    esri = srs.Clone()
+    if esri.MorphToESRI() == 0:
+        variants.append(esri.ExportToWkt())
+    return variants
+
+
+def buildIndex(path=None, proj_db=None):
+    """Write the normalized WKT -> EPSG index of every EPSG CRS in proj.db to path.
+
+    The index is written to a temporary file and moved in place, so
+    processes reading an older index are not disturbed.
+    """
+    path = indexPath() if path is None else path
+    proj_db = projDatabase() if proj_db is None else proj_db
+    if proj_db is None:
+        raise ValueError('could not find proj.db')
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    (fd, tmppath) = tempfile.mkstemp(dir=directory, suffix='.sqlite')
+    os.close(fd)
+    db = sqlite3.connect(tmppath)
+    try:
+        with db:
+            db.execute('CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            db.execute('CREATE TABLE wkt (key BLOB PRIMARY KEY, epsg INTEGER NOT NULL) WITHOUT ROWID')
+            db.execute("INSERT INTO meta VALUES ('source', ?)", (_sourceVersion(proj_db),))
+            for code in _epsgCodes(proj_db):
+                for wkt in _wktVariants(code):
+                    # the lowest code wins when two definitions coincide
+                    db.execute('INSERT OR IGNORE INTO wkt VALUES (?, ?)', (wktKey(wkt), code))
+    finally:
+        db.close()
+    os.replace(tmppath, path)
+    return path
+
+
+def _sourceVersion(proj_db):
+    stat = os.stat(proj_db)
+    return '%s:%d:%d' % (proj_db, stat.st_size, int(stat.st_mtime))
+
+
+class EpsgIndex:
+    """Read only view of the on disk index, built on first use.
+
+    The index is rebuilt when proj.db changes. If it can not be built,
+    lookups return None and resolve falls back to osr.
+    """
+
+    def __init__(self, path=None):
+        self.path = indexPath() if path is None else path
+        self.logger = logging.getLogger('epsgresolver')
+        self.db = None
+        proj_db = projDatabase()
+        try:
+            if proj_db is not None and not self._current(proj_db):
+                start = time.perf_counter()
+                buildIndex(self.path, proj_db)
+                self.logger.info('built EPSG index %s in %.1f s' % (self.path, time.perf_counter() - start))
+            if os.path.isfile(self.path):
+                self.db = sqlite3.connect('file:%s?mode=ro' % self.path, uri=True, check_same_thread=False)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            self.logger.warning('EPSG index disabled: %s' % e)
+            self.db = None
+
+    def _current(self, proj_db):
+        if not os.path.isfile(self.path):
+            return False
+        try:
+            db = sqlite3.connect('file:%s?mode=ro' % self.path, uri=True)
+            try:
+                row = db.execute("SELECT value FROM meta WHERE name = 'source'").fetchone()
+            finally:
+                db.close()
+        except sqlite3.Error:
+            return False
+        return row is not None and row[0] == _sourceVersion(proj_db)
+
+    def lookup(self, wkt):
+        if self.db is None:
+            return None
+        try:
+            row = self.db.execute('SELECT epsg FROM wkt WHERE key = ?', (wktKey(wkt),)).fetchone()
+        except sqlite3.Error as e:
+            self.logger.warning('EPSG index lookup failed: %s' % e)
+            return None
+        return row[0] if row is not None else None
+
+
+_index = None
+
+
+def _sharedIndex():
+    global _index
+    if _index is None:
+        _index = EpsgIndex()
+    return _index
+
+
+def _identify(wkt):
+    """EPSG code osr derives from the WKT, or None."""
+    srs = osr.SpatialReference()
+    if srs.ImportFromWkt(wkt) != 0 and srs.ImportFromESRI([wkt]) != 0:
+        return None
+    srs.AutoIdentifyEPSG()
+    code = srs.GetAuthorityCode(None)
+    if code is not None:
+        return int(code)
+    if hasattr(srs, 'FindMatches'):
+        for match, confidence in srs.FindMatches():
+            if confidence >= MIN_CONFIDENCE and match.GetAuthorityName(None) == 'EPSG':
+                return int(match.GetAuthorityCode(None))
+    return None
+
+
+@lru_cache(maxsize=LOOKUP_CACHE_SIZE)
+def resolveEpsg(wkt):
+    """EPSG code of a WKT or ESRI .prj definition as a string, or None.
+
+    Looks the normalized text up in the local index first and asks osr
+    only when it is not there. No network access.
+    """
+    if not wkt or not wkt.strip():
+        return None
+    code = _sharedIndex().lookup(wkt)
+    if code is None:
+        try:
+            code = _identify(wkt)
+        except RuntimeError:
+            code = None
+    return str(code) if code is not None else None
+
+
+if __name__ == "__main__":
+    # usage: python epsgresolver.py [--build] [file.prj ...]
+    logging.basicConfig(level=logging.INFO)
+    if '--build' in sys.argv:
+        print('index written to %s' % buildIndex())
+    repeat = 10000
+    for source in [a for a in sys.argv[1:] if a != '--build']:
+        with open(source) as f:
+            text = f.read()
+        start = time.perf_counter()
+        code = _sharedIndex().lookup(text)
+        indexed = time.perf_counter() - start
+        start = time.perf_counter()
+        _identify(text)
+        identified = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(repeat):
+            resolveEpsg(text)
+        cached = (time.perf_counter() - start) / repeat
+        print('%s: EPSG %s, index %.1f us, osr %.1f us, cached %.2f us' % (
+            source, resolveEpsg(text), indexed * 1e6, identified * 1e6, cached * 1e6))
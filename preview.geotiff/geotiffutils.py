@@ -1,20 +1,53 @@
 #!/usr/bin/python
-import json
 import logging
-import urllib
+from functools import cached_property
 
+import numpy
 from osgeo import osr, gdal
 
+import epsgresolver
+import extentengine
+import rasterstats
+import tiffheader
+from quantilesketch import KLLSketch
+
+# the color ramp spans the 2nd to 98th percentile of the first band,
+# with breaks at equal-count percentiles in between
+RAMP_LOW = 0.02
+RAMP_HIGH = 0.98
+RAMP_ENTRIES = 9
+
 
 class Utils:
+    """Projection, extent and style of a GeoTIFF from a single dataset handle.
+
+    Georeferencing comes from the tiff header where possible. Otherwise the
+    file is opened through GDAL once, on first use, and that handle serves
+    every method; SRS, geotransform, size, band info and color table are
+    read from it once and cached. Use as a context manager, or call close(),
+    to release the handle deterministically.
+    """
 
-    def __init__(self, geotifffile, rasterStyleTemplate):
+    def __init__(self, geotifffile, rasterStyleTemplate, cached=None):
         self.geotiff = geotifffile
         self.rasterStyleTemplate = rasterStyleTemplate
         self.epsg = 'UNKNOWN'
         self.extent = 'UNKNOWN'
-        self.isGeotiff = self.checkGeotiff()
         self.logger = logging.getLogger('geotiff')
+        self._dataset = None
+        self._openFailed = False
+        self.opens = 0
+        if cached is not None:
+            # probe results of a file with the same contents, see resultcache
+            self.header = None
+            self.isGeotiff = cached['isGeotiff']
+            self.epsg = cached['epsg']
+            self.extent = cached['extent']
+            return
+        # projection and extent are read from the tiff header when it carries
+        # an EPSG code, so GDAL only opens the file for the style statistics
+        self.header = tiffheader.readHeader(geotifffile)
+        self.isGeotiff = self.checkGeotiff()
         
         if self.isGeotiff:
             tmpEpsg = self.findProjection()
@@ -30,6 +63,70 @@ class Utils:
                 else:
                     self.extent = 'UNKNOWN'
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._dataset = None
+
+    @property
+    def dataset(self):
+        """The GDAL dataset, opened on first use; None if GDAL can not read the file."""
+        if self._dataset is None and not self._openFailed:
+            self.opens += 1
+            try:
+                self._dataset = gdal.Open(self.geotiff)
+            except RuntimeError:
+                self._dataset = None
+            self._openFailed = self._dataset is None
+        return self._dataset
+
+    @cached_property
+    def hasHeaderGeoreference(self):
+        header = self.header
+        return header is not None and header.epsg is not None and header.geotransform is not None
+
+    @cached_property
+    def projectionRef(self):
+        return self.dataset.GetProjectionRef() if self.dataset is not None else ''
+
+    @cached_property
+    def crs(self):
+        """EPSG code from the header, else the WKT of the dataset; the crstransform registry key."""
+        if self.hasHeaderGeoreference:
+            return self.header.epsg
+        return self.projectionRef
+
+    @cached_property
+    def geotransform(self):
+        if self.hasHeaderGeoreference:
+            return self.header.geotransform
+        return self.dataset.GetGeoTransform()
+
+    @cached_property
+    def rasterSize(self):
+        if self.hasHeaderGeoreference:
+            return self.header.width, self.header.height
+        return self.dataset.RasterXSize, self.dataset.RasterYSize
+
+    @cached_property
+    def bandInfo(self):
+        """Band count, first band nodata and the color interpretation of every band."""
+        ds = self.dataset
+        info = dict()
+        info['count'] = ds.RasterCount
+        info['nodata'] = ds.GetRasterBand(1).GetNoDataValue()
+        info['color_interpretation'] = [ds.GetRasterBand(i).GetColorInterpretation()
+                                        for i in range(1, ds.RasterCount + 1)]
+        return info
+
+    @cached_property
+    def colorTable(self):
+        return self.dataset.GetRasterBand(1).GetColorTable()
+
     def hasError(self):
         if (not self.isGeotiff) or  self.epsg == 'UNKNOWN' or self.extent == 'UNKNOWN':
             return True
@@ -42,52 +139,24 @@ class Utils:
     def getExtent(self):
         return self.extent
 
+    def cacheEntry(self):
+        return {'isGeotiff': self.isGeotiff, 'epsg': self.epsg, 'extent': self.extent}
+
 
     def checkGeotiff(self):
-        isGeo = True
-        try:
-            ds = gdal.Open(self.geotiff)
-            if ds.GetProjectionRef() == '': 
-                isGeo = False
-        except:
-            isGeo = False
-        ds = None
-        return isGeo
+        if self.header is not None and self.header.isGeo:
+            return True
+        return self.projectionRef != ''
         
     def findProjection(self):
         if not self.isGeotiff:
             self.logger.debug('findProjection: it is not a geotiff')
             return 'None'
-        prj_txt=''
-        prj_code=''
-        try:
-            ds = gdal.Open(self.geotiff)
-            prj_txt = ds.GetProjectionRef()
-            srs = osr.SpatialReference()
-            srs.ImportFromWkt(prj_txt)
-            srs.AutoIdentifyEPSG()
-            prj_code=srs.GetAuthorityCode(None)
-        except:
-            prj_code='None'
-
-        # close geotiff file
-        ds = None
-
-        if str(prj_code).strip() != 'None':
-            return prj_code
-
-        query = urllib.urlencode({'exact':True,'error':True,'mode':'wkt','terms':prj_txt})
-
-        try:
-            webres = urllib.urlopen('http://prj2epsg.org/search.json', query.encode())
-            jres = json.loads(webres.read().decode())
-            if len(jres['codes']) > 0:
-                self.logger.debug(jres['codes'][0]['code'])
-            else:
-                self.logger.debug('None')
-        except:
-            self.logger.debug('None')
-        
+        if self.header is not None and self.header.epsg is not None:
+            return str(self.header.epsg)
+        prj_code = epsgresolver.resolveEpsg(self.projectionRef)
+        if prj_code is None:
+            return 'None'
         return prj_code
 
     def findExtent(self):
@@ -98,70 +167,49 @@ class Utils:
             self.logger.debug('findExtent: unknown projection; could not calculate extent')
             return 'None'
 
-        GOOGLE = 3857
-        ds = gdal.Open(self.geotiff)
-
-        dsGtrn = ds.GetGeoTransform()
-        # quick fix to avoid wrong bounding box calculation when the input extent is world wide
-        dsGtrn = self.validateBbox(dsGtrn)
-        osrs = osr.SpatialReference()
-        osrs.ImportFromWkt(ds.GetProjectionRef())
-        dsrs = osr.SpatialReference()
-        dsrs.ImportFromEPSG(GOOGLE)
-        ct = osr.CoordinateTransformation(osrs, dsrs)
-        ll = ct.TransformPoint(dsGtrn[0], dsGtrn[3])
-        ur = ct.TransformPoint(dsGtrn[0] + dsGtrn[1] * ds.RasterXSize + dsGtrn[2] * ds.RasterYSize,  dsGtrn[3] + dsGtrn[4] * ds.RasterXSize + dsGtrn[5] *ds.RasterYSize)
-        r = [0. for x in range(4)]
-        if ll[0] < ur[0]:
-            r[0] = ll[0]
-            r[2] = ur[0]
-        else: 
-            r[0] = ur[0]
-            r[2] = ll[0]
-        if ll[1] < ur[1]:
-            r[1] = ll[1]
-            r[3] = ur[1]
-        else: 
-            r[1] = ur[1]
-            r[3] = ll[1]
-
-        ds = None
-        return ','.join(map(str, r))
-
-    def validateBbox(self, intuple):
-        lst = list(intuple)
-        tuple_changed = False
-
-        if intuple[0] <= 180 and intuple[0] > 179:
-            lst[0] = 179
-            tuple_changed = True
-        if intuple[0] >= -180 and intuple[0] < -179:
-            lst[0] = -179
-            tuple_changed = True
-        if intuple[3] <= 90 and intuple[3] > 89:
-            lst[3] = 89
-            tuple_changed = True
-        if intuple[3] >= -90 and intuple[3] < -89:
-            lst[3] = -89
-            tuple_changed = True
-
-        if tuple_changed:
-            return tuple(lst)
-        else:
-            return intuple
+        xSize, ySize = self.rasterSize
+        extent = extentengine.rasterExtent(self.crs, self.geotransform, xSize, ySize)
+        if extent is None:
+            self.logger.debug('findExtent: the outline could not be reprojected')
+            return 'None'
+        return ','.join(map(str, extent['3857']))
+
+    def isRGB(self):
+        interpretation = self.bandInfo['color_interpretation'][:3]
+        return interpretation == [gdal.GCI_RedBand, gdal.GCI_GreenBand, gdal.GCI_BlueBand]
 
     def createStyle(self):
         if not self.isGeotiff:
             self.logger.debug('createStyle: it is not a geotiff')
             return 'None'
-        ds = gdal.Open(self.geotiff)
-        band = ds.GetRasterBand(1)
-        nodataValue = band.GetNoDataValue()
-        stat = band.GetStatistics(True, True)
-        if not stat:
+        if self.isRGB():
+            # a single band color ramp would render rgb imagery as grey;
+            # geoserver's default raster style composites the bands instead
+            self.logger.debug('createStyle: rgb image, using the default style')
+            return 'None'
+        band = self.dataset.GetRasterBand(1)
+        nodataValue = self.bandInfo['nodata']
+        # one streaming pass fills the statistics and a quantile sketch. the
+        # ramp only needs approximate values unless configured otherwise;
+        # they come from the overviews built before publishing
+        if rasterstats.statisticsMode(rasterstats.APPROXIMATE) == rasterstats.APPROXIMATE:
+            source = rasterstats.selectOverview(band, rasterstats.minimumPixels())
+            self.logger.debug('statistics from %d x %d pixels' % (source.XSize, source.YSize))
+            stat = rasterstats.computeBandStatistics(source, sketch=KLLSketch())
+        else:
+            # on the shared handle; a dataset is not safe to read from
+            # several threads, so this pass is not split
+            stat = rasterstats.computeBandStatistics(band, sketch=KLLSketch())
+        source = None
+        band = None
+        if not stat.count:
             return 'None'
-        minValue = stat[2] - stat[3]*2 
-        maxValue = stat[2] + stat[3]*2
+        # percentile ramp with equal-count breaks; mean +/- 2 sigma is thrown
+        # off by skewed data
+        breaks = stat.sketch.quantiles(numpy.linspace(RAMP_LOW, RAMP_HIGH, RAMP_ENTRIES))
+        breaks = numpy.unique(breaks)
+        minValue = float(breaks[0])
+        maxValue = float(breaks[-1])
         self.logger.debug('nodata ' + str(nodataValue))
         self.logger.debug('min ' + str(minValue))
         self.logger.debug('max ' + str(maxValue))
@@ -170,6 +218,11 @@ class Utils:
 
         minline = '<ColorMapEntry color="#000000" quantity="'+str(minValue)+'" label="min" />\n'
         maxline = '<ColorMapEntry color="#FFFFFF" quantity="'+str(maxValue)+'" label="max" />\n'
+        rampline = ''
+        for i in range(1, len(breaks) - 1):
+            grey = int(round(255.0 * i / (len(breaks) - 1)))
+            rampline += '<ColorMapEntry color="#%02X%02X%02X" quantity="%s" />\n' % (grey, grey, grey, float(breaks[i]))
+        rampline = minline + rampline + maxline
         colormaplines = ''
 
         validNoData = True
@@ -183,24 +236,91 @@ class Utils:
         if not validNoData:
             nodataLine = '<!-- nodata value or nodata value is in range of valid data range -->\n'
             colormaplines += nodataLine
-            colormaplines += minline
-            colormaplines += maxline
+            colormaplines += rampline
         else:
             nodataLine = '<ColorMapEntry color="#000000" quantity="'+str(nodataValue)+'" label="nodata" opacity="0.0" />\n'
             if nodataValue <= minValue:
                 colormaplines += nodataLine
-                colormaplines += minline
-                colormaplines += maxline
+                colormaplines += rampline
             if nodataValue >= maxValue:
-                colormaplines += minline
-                colormaplines += maxline
+                colormaplines += rampline
                 colormaplines += nodataLine
         
         style = style.replace('<<<colormap>>>', colormaplines)
         return style
             
 
+def probeGeotiff(geotifffile, rasterStyleTemplate):
+    """Analysis job (see analysispool): projection and extent as Utils.cacheEntry."""
+    with Utils(geotifffile, rasterStyleTemplate) as geo:
+        return geo.cacheEntry()
+
+
+def styleGeotiff(geotifffile, rasterStyleTemplate, probe):
+    """Analysis job: style for the file, None if it has a color table of its own."""
+    with Utils(geotifffile, rasterStyleTemplate, probe) as geo:
+        if geo.colorTable is not None:
+            geo.logger.debug("Geotiff has the style already")
+            return None
+        return geo.createStyle()
+
+
+# ----------------------------------------------------------------------
+# Benchmark: one GDAL open per method (and one more for the color table in
+# the extractor) vs. the shared handle.
+# usage: python geotiffutils.py [raster ...]
+
+class _CountingOpen:
+    def __init__(self, open_function):
+        self.open_function = open_function
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+        return self.open_function(*args)
+
+
+def _legacyQueries(geotifffile):
+    ds = gdal.Open(geotifffile)
+    ds.GetProjectionRef()
+    ds = gdal.Open(geotifffile)
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(ds.GetProjectionRef())
+    srs.AutoIdentifyEPSG()
+    ds = gdal.Open(geotifffile)
+    ds.GetGeoTransform()
+    ds.GetProjectionRef()
+    ds = gdal.Open(geotifffile)
+    ds.GetRasterBand(1).GetNoDataValue()
+    ds = gdal.Open(geotifffile)
+    ds.GetRasterBand(1).GetColorTable()
+    ds = None
+
+
+def _sharedQueries(geotifffile):
+    with Utils(geotifffile, None) as geo:
+        geo.bandInfo
+        geo.colorTable
+
+
 if __name__ == "__main__":
-    source = "jong.tif"
-    geo = Utils(source)
-    print(geo.createStyle())
+    import os
+    import sys
+    import time
+
+    sources = sys.argv[1:] or [os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests', 'inundation-500yr.tif')]
+    repeat = 200
+    counter = _CountingOpen(gdal.Open)
+    gdal.Open = counter
+    for source in sources:
+        results = dict()
+        for name, func in (('legacy', _legacyQueries), ('shared', _sharedQueries)):
+            counter.count = 0
+            start = time.perf_counter()
+            for _ in range(repeat):
+                func(source)
+            results[name] = ((time.perf_counter() - start) / repeat, counter.count / float(repeat))
+        print(source)
+        for name in ('legacy', 'shared'):
+            print('  %-7s %8.3f ms %4.1f opens per file' % (name, results[name][0] * 1000.0, results[name][1]))
+        print('  saved   %8.3f ms per file' % ((results['legacy'][0] - results['shared'][0]) * 1000.0))
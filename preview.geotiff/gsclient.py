@@ -1,10 +1,183 @@
-import errno
+import hashlib
 from urllib.parse import urljoin
-from geoserver.catalog import Catalog
+from geoserver.catalog import Catalog, FailedRequestError
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os.path
+import posixpath
+import shutil
 import tempfile
+import atexit
+import collections
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# stores and resources this client publishes
+STORE_PATH = 'coveragestores'
+RESOURCE_PATH = 'coverages'
+
+# a store is deleted with its coverages and layers, and the files
+# geoserver keeps for it
+DELETE_PARAMS = {'recurse': 'true', 'purge': 'all'}
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 300
+
+# retried connection attempts; a request that reached geoserver is not
+# sent again, since upload bodies are streamed from files
+CONNECT_RETRIES = 3
+
+
+def poolSize():
+    return int(os.getenv('GEOSERVER_POOL_SIZE', DEFAULT_POOL_SIZE))
+
+
+def timeouts():
+    """(connect, read) timeout of geoserver requests, in seconds."""
+    return (float(os.getenv('GEOSERVER_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)),
+            float(os.getenv('GEOSERVER_READ_TIMEOUT', DEFAULT_READ_TIMEOUT)))
+
+
+class _TimeoutSession(requests.Session):
+    """Session that applies a default timeout to every request."""
+
+    def __init__(self, timeout):
+        requests.Session.__init__(self)
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return requests.Session.request(self, method, url, **kwargs)
+
+
+_sessions = dict()
+_sessionsLock = threading.Lock()
+
+
+def getSession(username, password):
+    """Process wide keep-alive session with a connection pool for a geoserver account."""
+    key = (username, password)
+    with _sessionsLock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _TimeoutSession(timeouts())
+            session.auth = (username, password)
+            # only failed connections are retried, never reads or error statuses
+            retries = Retry(total=None, connect=CONNECT_RETRIES, read=False, status=0, other=0)
+            adapter = HTTPAdapter(pool_maxsize=poolSize(), max_retries=retries)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[key] = session
+    return session
+
+
+DEFAULT_WORKSPACE_TTL = 600
+
+# workspaces known to exist, as (rest url, name) -> time last confirmed
+_knownWorkspaces = dict()
+_workspacesLock = threading.Lock()
+
+
+def workspaceTtl():
+    """Seconds a workspace is trusted to exist without asking geoserver."""
+    return float(os.getenv('GEOSERVER_WORKSPACE_TTL', DEFAULT_WORKSPACE_TTL))
+
+
+def forgetWorkspace(restserver, workspace):
+    with _workspacesLock:
+        _knownWorkspaces.pop((restserver.rstrip('/'), workspace), None)
+
+
+DEFAULT_LAYER_INDEX_SIZE = 10000
+
+# layer names of stores, as (rest url, workspace, store) -> layer name,
+# least recently used first
+_layerIndex = collections.OrderedDict()
+_layerIndexLock = threading.Lock()
+
+
+def layerIndexSize():
+    """Stores whose layer name is remembered; 0 turns the index off."""
+    return int(os.getenv('GEOSERVER_LAYER_INDEX_SIZE', DEFAULT_LAYER_INDEX_SIZE))
+
+
+def indexedLayer(restserver, workspace, storename):
+    key = (restserver.rstrip('/'), workspace, storename)
+    with _layerIndexLock:
+        layername = _layerIndex.get(key)
+        if layername is not None:
+            _layerIndex.move_to_end(key)
+    return layername
+
+
+def indexLayer(restserver, workspace, storename, layername):
+    size = layerIndexSize()
+    if size <= 0:
+        return
+    key = (restserver.rstrip('/'), workspace, storename)
+    with _layerIndexLock:
+        _layerIndex[key] = layername
+        _layerIndex.move_to_end(key)
+        while len(_layerIndex) > size:
+            _layerIndex.popitem(last=False)
+
+
+def forgetLayer(restserver, workspace, storename):
+    with _layerIndexLock:
+        _layerIndex.pop((restserver.rstrip('/'), workspace, storename), None)
+
+
+DEFAULT_REMOVE_DELAY = 2.0
+
+
+def removeDelay():
+    """Seconds removal events are collected before their stores are deleted."""
+    return float(os.getenv('GEOSERVER_REMOVE_DELAY', DEFAULT_REMOVE_DELAY))
+
+
+def hrefWorkspace(href):
+    """Workspace name in the REST url of a store or resource."""
+    parts = href.split('/')
+    return parts[parts.index('workspaces') + 1]
+
+
+# styles known to exist on a server, as (rest url, style name); styles are
+# named by their content, so an entry only goes stale when the style is
+# deleted on the server, which set_resources notices when assigning it
+_knownStyles = set()
+
+
+def sharedDir():
+    """Directory shared with GeoServer, as the extractor sees it; '' when there is none."""
+    return os.getenv('GEOSERVER_SHARED_DIR', '')
+
+
+def sharedDirRemote():
+    """The shared directory as GeoServer sees it."""
+    return os.getenv('GEOSERVER_SHARED_DIR_REMOTE') or sharedDir()
+
+
+def styleName(styleStr):
+    """GeoServer style name of an SLD body, the same for identical styles."""
+    return 'raster_' + hashlib.sha256(styleStr.encode('utf-8')).hexdigest()[:32]
+
+
+class PublishContext:
+    """What one publish has looked up: the resource, the layer and its name.
+
+    A Client is shared by all messages of the process; anything that
+    belongs to a single upload lives here instead.
+    """
+
+    def __init__(self):
+        self.resource = None
+        self.layer = None
+        self.layerName = None
+
 
 class Client:
     
@@ -14,57 +187,140 @@ class Client:
         self.cswserver = urljoin(geoserver, 'csw')
         self.username = username
         self.password = password
-        self.catalog = Catalog(self.restserver, self.username, self.password) 
-        self.tempDir = tempfile.mkdtemp()
-        self.resource = None
-        self.layer = None
-        self.layerName = None
+        self.session = getSession(self.username, self.password)
+        self.catalog = Catalog(self.restserver, self.username, self.password)
+        # gsconfig has no way to pass a session in; share the pooled one
+        self.catalog._session = self.session
         logging.basicConfig(format="%(asctime)-15s %(name)-10s %(levelname)-7s : %(message)s", level=logging.WARN)
         self.logger = logging.getLogger("gsclient")
 
+    def ensureWorkspace(self, workspace, geoserver_rest=None, secret_key=None):
+        """True when workspace exists on geoserver, creating it if needed.
+
+        A workspace created or seen in the last GEOSERVER_WORKSPACE_TTL
+        seconds costs no request; otherwise it is created with a single
+        POST, and one that exists already (409) counts as created.
+        """
+        rest = (geoserver_rest or self.restserver).rstrip('/')
+        key = (rest, workspace)
+        with _workspacesLock:
+            seen = _knownWorkspaces.get(key)
+        if seen is not None and time.monotonic() - seen < workspaceTtl():
+            self.logger.debug("workspace %s exists already" % workspace)
+            return True
+
+        params = {'key': secret_key} if secret_key else None
+        new_worksp = "<workspace><name>" + workspace + "</name></workspace>"
+        response = self.session.post(rest + '/workspaces', params=params, headers={"Content-type": "text/xml"}, data=new_worksp)
+        # created by another process, or before a restart
+        exists = response.status_code == 409 or (response.status_code in (401, 403, 500) and 'exist' in response.text.lower())
+        if response.status_code != 201 and not exists:
+            self.logger.error("could not create workspace %s: %s %s" % (workspace, response.status_code, response.text))
+            return False
+        with _workspacesLock:
+            _knownWorkspaces[key] = time.monotonic()
+        return True
+
+    def forgetWorkspace(self, workspace, geoserver_rest=None):
+        """Drop workspace from the cache, after a 404 or when it was deleted."""
+        forgetWorkspace(geoserver_rest or self.restserver, workspace)
+
+    def storeUrl(self, workspace, storename):
+        return urljoin(self.restserver, "workspaces/" + workspace + "/" + STORE_PATH + "/" + storename)
+
+    def deleteStore(self, workspace, storename):
+        """Delete a store with everything published from it, in one request.
+
+        There is no catalog reload; geoserver updates its catalog as part
+        of the delete. A store that is gone already counts as deleted.
+        """
+        forgetLayer(self.restserver, workspace, storename)
+        response = self.session.delete(self.storeUrl(workspace, storename), params=DELETE_PARAMS)
+        if response.status_code == 404:
+            # the workspace may be gone as well; ask geoserver next time
+            self.forgetWorkspace(workspace)
+            self.logger.debug("store %s:%s does not exist" % (workspace, storename))
+            return True
+        if response.status_code != 200:
+            self.logger.error("could not delete store %s:%s: %s %s" % (workspace, storename, response.status_code, response.text))
+            return False
+        self.logger.debug("deleted store %s:%s" % (workspace, storename))
+        return True
+
+    def resourceUrl(self, workspace, storename, name=None):
+        """REST url of the resource name of a store, or of the list of its resources."""
+        path = "workspaces/" + workspace + "/" + STORE_PATH + "/" + storename + "/" + RESOURCE_PATH
+        if name is None:
+            return urljoin(self.restserver, path + ".xml")
+        return urljoin(self.restserver, path + "/" + name + ".xml")
+
     ## this method assume that there is 1 store per layer
-    def getResourceByStoreName(self, storename, workspace):
-        if self.resource != None:
+    def getResourceByStoreName(self, storename, workspace, context=None):
+        """Resource published by a store, fetched by its REST path.
+
+        The resource is named after its store, which costs one request;
+        otherwise the resources of that one store are listed first.
+        """
+        if context is None:
+            context = PublishContext()
+        if context.resource != None:
             self.logger.debug("resource instance found; no need to fetch")
-            return self.resource
-        self.logger.debug("catalog.get_store called")
-        store = self.catalog.get_store(storename, workspace)
-        self.logger.debug("catalog.get_resources called based on store")
-        resources = self.catalog.get_resources(store=store)
-        self.logger.debug("fetched resources from server")
-        if resources == None: 
-            return None
-        else:
-            self.resource = resources[0]
-            return self.resource
+            return context.resource
+        name = storename
+        layername = indexedLayer(self.restserver, workspace, storename)
+        if layername is not None:
+            name = layername.split(':')[-1]
+        try:
+            context.resource = self.catalog.get_resource_by_url(self.resourceUrl(workspace, storename, name))
+        except FailedRequestError:
+            self.logger.debug("no resource %s; listing the resources of store %s" % (name, storename))
+            try:
+                listing = self.catalog.get_xml(self.resourceUrl(workspace, storename))
+            except FailedRequestError:
+                return None
+            names = [node.findtext("name") for node in listing if node.findtext("name")]
+            if not names:
+                return None
+            context.resource = self.catalog.get_resource_by_url(self.resourceUrl(workspace, storename, names[0]))
+        return context.resource
 
     def getLayers(self):
         layers = self.catalog.get_layers()
         return layers
 
-    def getLayerByStoreName(self, storename):
+    def getLayerByStoreName(self, storename, workspace=None):
+        """Layer of a store, fetched by name instead of scanning every layer.
+
+        Without a workspace geoserver resolves the bare store name.
+        """
         self.logger.debug("getLayerbystore name started")
-        layers = self.catalog.get_layers()
-    
-        for layer in layers:
-            if layer.resource.store.name == storename:
-                self.logger.debug("found the layer by store name")
-                return layer
-        return None
-
-    def getLayerByResource(self, resource):
-        if self.layer != None:
+        if workspace is None:
+            return self.catalog.get_layer(storename)
+        layer = self.catalog.get_layer(indexedLayer(self.restserver, workspace, storename) or workspace + ':' + storename)
+        if layer is None:
+            # named differently from its store; go through the resource
+            forgetLayer(self.restserver, workspace, storename)
+            context = PublishContext()
+            resource = self.getResourceByStoreName(storename, workspace, context)
+            if resource is None:
+                return None
+            layer = self.getLayerByResource(resource, context)
+        if layer is not None:
+            self.logger.debug("found the layer by store name")
+            indexLayer(self.restserver, workspace, storename, layer.name)
+        return layer
+
+    def getLayerByResource(self, resource, context=None):
+        if context is None:
+            context = PublishContext()
+        if context.layer != None:
             self.logger.debug("layer instance found; no need to fetch")
-            return self.layer
-            
+            return context.layer
+
         self.logger.debug("get Layer by Resource started...")
-        layers = self.catalog.get_layers(resource)
-        self.logger.debug("fetched layers from the server")
-        if layers == None: 
-            return None
-        else:
-            self.layer = layers[0]
-            return self.layer
+        # a layer is named after its resource
+        context.layer = self.catalog.get_layer(hrefWorkspace(resource.href) + ':' + resource.name)
+        return context.layer
 
     def mintMetadataWithoutGeoserver(self, workspace, filename, extent):
         self.logger.debug("Creating wms metadata ... ")
@@ -78,28 +334,30 @@ class Client:
         self.logger.debug('[DONE]')
         return metadata
 
-    def mintMetadata(self, workspace, storename, extent):
+    def mintMetadata(self, workspace, storename, extent, context=None):
+        if context is None:
+            context = PublishContext()
         self.logger.debug("Creating wms metadata ... ") 
         metadata = {}
         layername = None
-        if self.layerName == None:
-            if self.layer == None:
+        if context.layerName == None:
+            if context.layer == None:
                 self.logger.debug("getResourceByStoreName..")
-                resource = self.getResourceByStoreName(storename, workspace)
+                resource = self.getResourceByStoreName(storename, workspace, context)
                 self.logger.debug("getLayerByResource ...")
-                layer = self.getLayerByResource(resource)
+                layer = self.getLayerByResource(resource, context)
                                 #layername = layer.name 
                 self.logger.debug("done getting layer name")
                 if layer == None: 
                     self.logger.debug('No layer found [DONE]')
                     return metadata
                 else:
-                    layername = layer.name
+                    layername = layer.name.split(':')[-1]
             else:
-                layername = self.layer.name
-                self.layerName = self.layer.name
+                layername = context.layer.name.split(':')[-1]
+                context.layerName = layername
         else:
-            layername = self.layerName
+            layername = context.layerName
         # generate metadata 
         wmsLayerName = workspace + ':' + layername
         metadata['WMS Layer Name'] = wmsLayerName
@@ -108,23 +366,29 @@ class Client:
         self.logger.debug('[DONE]')
         return metadata
 
-    def uploadGeotiff(self, geoserver_url, workspace, storename, filename, title, styleStr, projection, secret_key, proxy_on):
+    def uploadGeotiff(self, geoserver_url, workspace, storename, filename, title, styleStr, projection, secret_key, proxy_on, context=None):
+        if context is None:
+            context = PublishContext()
         self.logger.debug("Uploading geotiff" + filename + "...")
         # TODO need to check the coverage name to avoid duplication
 
-        if (proxy_on.lower() == 'true'):
-            # TODO activate proxy_on method if the proxy in clowder works
-            return self.geoserver_manipulation_proxy_off(geoserver_url, workspace, storename, filename, title, styleStr,
-                                                         projection)
-            # return self.geoserver_manipulation_proxy_on(geoserver_url, workspace, storename, filename, title, styleStr, projection, secret_key)
-        else:
-            return self.geoserver_manipulation_proxy_off(geoserver_url, workspace, storename, filename, title, styleStr, projection)
+        try:
+            if (proxy_on.lower() == 'true'):
+                # TODO activate proxy_on method if the proxy in clowder works
+                return self.geoserver_manipulation_proxy_off(geoserver_url, workspace, storename, filename, title, styleStr,
+                                                             projection, context)
+                # return self.geoserver_manipulation_proxy_on(geoserver_url, workspace, storename, filename, title, styleStr, projection, secret_key)
+            else:
+                return self.geoserver_manipulation_proxy_off(geoserver_url, workspace, storename, filename, title, styleStr, projection, context)
+        finally:
+            # gsconfig keeps every document it fetched; one publish needs
+            # them, a long running client must not
+            self.catalog._cache.clear()
 
     def geoserver_manipulation_proxy_on(self, geoserver_url, workspace, storename, filename, title, styleStr,
-                                         projection, secret_key):
-        # create workspace if not present
-        is_workspace = False
-
+                                         projection, secret_key, context=None):
+        if context is None:
+            context = PublishContext()
         # this is a direct method, if the proxy works, this should go through proxy
         last_charactor = geoserver_url[-1]
         if last_charactor == '/':
@@ -132,15 +396,8 @@ class Client:
         else:
             geoserver_rest = geoserver_url + '/rest'
 
-        response_worksp = requests.get(geoserver_rest + '/workspaces/' + workspace  + '?key=' + secret_key, auth=(self.username, self.password))
-        if response_worksp.status_code != 200:
-            new_worksp = "<workspace><name>" + workspace + "</name></workspace>"
-            response_worksp = requests.post(geoserver_rest + '/workspaces' + '?key=' + secret_key, headers={"Content-type": "text/xml"},
-                                            auth=(self.username, self.password), data=new_worksp)
-            if response_worksp.status_code == 201:
-                is_workspace = True
-        else:
-            is_workspace = True
+        # create workspace if not present
+        is_workspace = self.ensureWorkspace(workspace, geoserver_rest, secret_key)
 
         # upload geotiff
         if is_workspace:
@@ -149,52 +406,98 @@ class Client:
             response = None
             self.logger.debug(url)
             with open(filename, 'rb') as f:
-                response = requests.put(url + '?key=' + secret_key, headers={'content-type': 'image/tiff'},
-                                            auth=(self.username, self.password), data=f)
+                response = self.session.put(url + '?key=' + secret_key, headers={'content-type': 'image/tiff'}, data=f)
 
-            return self.set_resources(response, storename, workspace, projection, styleStr)
+            return self.set_resources(response, storename, workspace, projection, styleStr, context)
         else:
             return False
 
-    def geoserver_manipulation_proxy_off(self, geoserver_url, workspace, storename, filename, title, styleStr, projection):
+    def geoserver_manipulation_proxy_off(self, geoserver_url, workspace, storename, filename, title, styleStr, projection, context=None):
+        if context is None:
+            context = PublishContext()
         # create workspace if not present
-        is_workspace = False
-
-        response_worksp = requests.get(self.restserver + '/workspaces/' + workspace, auth=(self.username, self.password))
-        if response_worksp.status_code != 200:
-            new_worksp = "<workspace><name>" + workspace + "</name></workspace>"
-            response_worksp = requests.post(self.restserver + '/workspaces', headers={"Content-type": "text/xml"},
-                                            auth=(self.username, self.password), data=new_worksp)
-            if response_worksp.status_code == 201:
-                is_workspace = True
-        else:
-            is_workspace = True
+        is_workspace = self.ensureWorkspace(workspace)
 
         # upload geotiff
         if is_workspace:
-            url = self.restserver + "/workspaces/" + workspace + "/coveragestores/" + storename + "/file.geotiff" + "?coverageName=" + storename
+            # a file in the shared directory is registered in place, others
+            # are streamed to geoserver
+            response = self.publishShared(workspace, storename, filename)
+            if response is None:
+                url = self.restserver + "/workspaces/" + workspace + "/coveragestores/" + storename + "/file.geotiff" + "?coverageName=" + storename
 
-            response = None
-            self.logger.debug(url)
-            with open(filename, 'rb') as f:
-                response = requests.put(url, headers={'content-type': 'image/tiff'},
-                                            auth=(self.username, self.password), data=f)
+                self.logger.debug(url)
+                with open(filename, 'rb') as f:
+                    response = self.session.put(url, headers={'content-type': 'image/tiff'}, data=f)
 
-            return self.set_resources(response, storename, workspace, projection, styleStr)
+            return self.set_resources(response, storename, workspace, projection, styleStr, context)
         else:
             return False
 
-    def set_resources(self, response, storename, workspace, projection, styleStr):
+    def shareGeotiff(self, workspace, storename, filename):
+        """Hard link (or copy) filename into the shared directory.
+
+        Returns the path of the shared file, or None if there is no shared
+        directory or the file could not be placed there.
+        """
+        local = sharedDir()
+        if not local or not os.path.isdir(local):
+            return None
+        target = os.path.join(local, workspace, storename + ".tif")
+        partial = target + ".partial"
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.link(filename, partial)
+            except OSError:
+                # another file system, or no hard links
+                shutil.copyfile(filename, partial)
+            os.replace(partial, target)
+        except OSError as e:
+            self.logger.warning("could not share %s: %s" % (filename, e))
+            if os.path.exists(partial):
+                os.remove(partial)
+            return None
+        return target
+
+    def publishShared(self, workspace, storename, filename):
+        """Register filename with external.geotiff from the shared directory.
+
+        Returns the response of geoserver, or None if the file has to be
+        uploaded instead.
+        """
+        target = self.shareGeotiff(workspace, storename, filename)
+        if target is None:
+            return None
+        remote = posixpath.join(sharedDirRemote(), workspace, storename + ".tif")
+        url = self.restserver + "/workspaces/" + workspace + "/coveragestores/" + storename + "/external.geotiff" + "?coverageName=" + storename
+        self.logger.debug(url)
+        response = self.session.put(url, headers={'content-type': 'text/plain'}, data='file:' + remote)
+        if response.status_code != 201:
+            # geoserver does not see the directory; fall back to the upload
+            self.logger.warning("external.geotiff failed, uploading instead: %s %s" % (response.status_code, response.text))
+            os.remove(target)
+            return None
+        self.logger.debug("registered shared file " + remote)
+        return response
+
+    def set_resources(self, response, storename, workspace, projection, styleStr, context=None):
+        if context is None:
+            context = PublishContext()
 
         self.logger.debug(str(response.status_code) + " " + response.text)
 
+        if response.status_code == 404:
+            # the workspace was removed behind our back
+            self.forgetWorkspace(workspace)
         if response.status_code != 201:
             self.logger.error(response.text)
             self.logger.debug("[DONE]")
             return False
-        self.layerName = storename
+        context.layerName = storename
+        indexLayer(self.restserver, workspace, storename, workspace + ':' + storename)
 
-        resource = self.getResourceByStoreName(storename, workspace)
+        resource = self.getResourceByStoreName(storename, workspace, context)
 
         # setting projection
         if resource.projection == None:
@@ -203,105 +506,149 @@ class Client:
             self.catalog.save(resource)
 
         if styleStr is not None:
-            if self.uploadRasterStyle(storename, styleStr):
+            stylename = self.uploadRasterStyle(styleStr)
+            if stylename is not None:
                 self.logger.debug('Setting style')
-                self.setStyle(self.layerName, storename)
+                try:
+                    self.setStyle(workspace + ':' + context.layerName, stylename, context)
+                except FailedRequestError:
+                    # the style was deleted on the server after this process
+                    # uploaded it; upload it again and retry once
+                    self.logger.warning("could not set style %s, uploading it again" % stylename)
+                    _knownStyles.discard((self.restserver, stylename))
+                    if self.uploadRasterStyle(styleStr) is not None:
+                        self.setStyle(workspace + ':' + context.layerName, stylename, context)
 
             self.logger.debug("style set: [DONE]")
 
         return True
 
-    def uploadRasterStyle(self, storename, styleStr):
-        if styleStr == 'None': 
-            return False
-        sldFileName = os.path.join(self.tempDir, storename + ".sld")
-        sldFile = open(sldFileName, 'w')
-        sldFile.write(styleStr)
-        sldFile.close()
+    def uploadRasterStyle(self, styleStr):
+        """Name of a global style with the SLD body styleStr, uploaded if needed; None on failure.
 
-        url = self.restserver+"/styles"
-        self.logger.debug(url)
-        response = requests.post(url, headers={'content-type':'text/xml'}, auth=(self.username, self.password), data="<style><name>" + storename + "</name><filename>" + storename + ".sld</filename></style>")
-        if response.status_code != 201:
-            self.logger.debug('error' + response.text)
-            return False
+        Identical styles share one name, so a style already uploaded by
+        this process costs no request and a new one a single POST.
+        """
+        if styleStr == 'None':
+            return None
+        stylename = styleName(styleStr)
+        if (self.restserver, stylename) in _knownStyles:
+            self.logger.debug("style %s exists already" % stylename)
+            return stylename
 
-        with open(sldFileName, 'rb') as f:
-            response = requests.put(url +"/" + storename, headers={'content-type': 'application/vnd.ogc.sld+xml'}, auth=(self.username, self.password), data=f)
+        url = self.restserver + "/styles"
+        self.logger.debug(url)
+        response = self.session.post(url, params={'name': stylename}, headers={'content-type': 'application/vnd.ogc.sld+xml'}, data=styleStr.encode('utf-8'))
         self.logger.debug(response.status_code)
-        self.logger.debug(response.text)
+        # uploaded by another process, or before a restart
+        exists = response.status_code in (403, 409) and 'exist' in response.text.lower()
+        if response.status_code != 201 and not exists:
+            self.logger.debug('error' + response.text)
+            return None
         self.logger.debug("uploaded the raster style")
-        if response.status_code == 200:
-            return True
-        else: 
-            return False
+        _knownStyles.add((self.restserver, stylename))
+        return stylename
 
-    def setStyle(self, layername, stylename):
+    def setStyle(self, layername, stylename, context=None):
+        if context is None:
+            context = PublishContext()
         layer = None
-        if self.layer != None:
-            layer = self.layer
+        if context.layer != None:
+            layer = context.layer
         else:
             self.logger.debug("getting a layer by name")
             layer = self.catalog.get_layer(layername)
         layer.default_style = stylename
         self.catalog.save(layer)
 
-    def createThumbnail(self, workspace, storename, extent, width, height):
+    def createThumbnail(self, workspace, storename, extent, width, height, context=None):
+        if context is None:
+            context = PublishContext()
         self.logger.debug('Creating Thumbnail ...')
         layername = None
-        if self.layerName == None:
-            if self.layer == None:
+        if context.layerName == None:
+            if context.layer == None:
                 self.logger.debug("getResourceByStoreName..")
-                resource = self.getResourceByStoreName(storename, workspace)
+                resource = self.getResourceByStoreName(storename, workspace, context)
                 self.logger.debug("getLayerByResource ...")
-                layer = self.getLayerByResource(resource)
+                layer = self.getLayerByResource(resource, context)
                 self.logger.debug("done getting layer name")
                 if layer == None: 
                     self.logger.debug('No layer found [DONE]')
                     return ''
                 else:
-                    layername = layer.name
+                    layername = layer.name.split(':')[-1]
             else:
                 self.logger.debug("layer instance found: no need to fetch")
-                layername = self.layer.name
-                self.layerName = self.layer.name
+                layername = context.layer.name.split(':')[-1]
+                context.layerName = layername
         else:
             self.logger.debug("layerName instance found: no need to fetch")
-            layername = self.layerName
+            layername = context.layerName
             #wmsLayerName = workspace+":"+layer.name
             wmsLayerName = workspace+":"+layername
         url = self.wmsserver+"?request=GetMap&layers="+wmsLayerName+"&bbox="+extent+"&width="+width+"&height="+height+"&srs=EPSG:3857&format=image%2Fpng"
 
-        r = requests.get(url, stream=True)
-        path=os.path.join(self.tempDir,'tmp.png')
+        r = self.session.get(url, stream=True)
 
         if r.status_code == 200:
-            tmp = r.headers['content-disposition']
-            tmplist = tmp.split(';')
-            for t in tmplist:
-                if t.strip().find('filename=') != -1:
-                    path = os.path.join(self.tempDir, t.strip().split('=')[1])
-            with open(path, 'wb') as f:
+            # the client lives as long as the process, so the png is not
+            # kept here; the caller removes the returned file
+            fd, path = tempfile.mkstemp(suffix='.png')
+            with os.fdopen(fd, 'wb') as f:
                 for chunk in r.iter_content():
                     f.write(chunk)
             self.logger.debug('[DONE]')
             return path
         else:
+            r.close()
             self.logger.debug('can not create thumbnail [DONE]')
             return ''
 
 
-    def __del__(self):
-        # delete the temp dir
-        if self.tempDir != None:
-            try:
-                import shutil
-                self.logger.debug( "Deleting temp dir "+ self.tempDir)
-                shutil.rmtree(self.tempDir)
-                self.logger.debug("Deleted Temp file")
-            except OSError as exc:
-                if exc.errno != errno.ENOENT:
-                    raise
+class RemovalQueue:
+    """Stores of removed files, deleted in batches.
+
+    Removing a dataset sends one event per file. Stores queued within
+    GEOSERVER_REMOVE_DELAY seconds of each other are deleted together,
+    each once, in parallel over the connection pool of the client.
+    """
+
+    def __init__(self, client, delay=None):
+        self.client = client
+        self.delay = removeDelay() if delay is None else delay
+        self.logger = logging.getLogger("gsclient")
+        # workspace -> names of the stores to delete
+        self.pending = dict()
+        self.lock = threading.Lock()
+        self.timer = None
+        atexit.register(self.flush)
+
+    def add(self, workspace, storename):
+        if self.delay <= 0:
+            self.client.deleteStore(workspace, storename)
+            return
+        with self.lock:
+            self.pending.setdefault(workspace, set()).add(storename)
+            if self.timer is None:
+                self.timer = threading.Timer(self.delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        """Delete the queued stores now; returns how many were deleted."""
+        with self.lock:
+            pending, self.pending = self.pending, dict()
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        stores = [(workspace, storename) for workspace, names in pending.items() for storename in sorted(names)]
+        if not stores:
+            return 0
+        with ThreadPoolExecutor(max_workers=max(1, min(poolSize(), len(stores)))) as executor:
+            deleted = sum(executor.map(lambda store: self.client.deleteStore(*store), stores))
+        self.logger.info("deleted %d of %d stores" % (deleted, len(stores)))
+        return deleted
 
 
 if __name__ == "__main__":
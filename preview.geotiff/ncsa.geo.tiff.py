@@ -2,20 +2,29 @@
 
 import logging
 import os
+import shutil
 import subprocess
 import tempfile
+import time
 from urllib.parse import urlparse, urljoin
 
 from pyclowder.extractors import Extractor
 from pyclowder.utils import StatusMessage
 from pyclowder.utils import CheckMessage
 import pyclowder.files
-from osgeo import gdal
 
+import analysispool
+import cogconvert
 import geotiffutils as gu
 import gsclient as gs
+import overviewplanner
+import quicklook
+import rasterstats
+import resultcache
+import tilepyramid
 
-from geoserver.catalog import Catalog
+# bump when the cached probe (projection, extent, style) changes shape
+CACHE_VERSION = 1
 
 
 class ExtractorsGeotiffPreview(Extractor):
@@ -33,6 +42,14 @@ class ExtractorsGeotiffPreview(Extractor):
         self.proxy_url = os.getenv('PROXY_URL', 'http://localhost:9000/api/proxy/')
         self.proxy_on = os.getenv('PROXY_ON', 'false')
         self.raster_style = "rasterTemplate.xml"
+        # GDAL runs in worker processes with a time and memory budget
+        self.analysis = analysispool.AnalysisPool()
+        # tile batches render in parallel in a pool of their own
+        self.tilePool = None
+        # one GeoServer client, and its connection pool, for all messages
+        self.gsclient = None
+        # removed files whose stores are deleted in batches
+        self.removals = None
 
         # setup logging for the exctractor
         logging.getLogger('pyclowder').setLevel(logging.DEBUG)
@@ -55,11 +72,12 @@ class ExtractorsGeotiffPreview(Extractor):
                     logger.warn('can not get filename for fileid %s' % str(fileid))
 
                 storename = filename + '_' + str(fileid)
-                layername = self.gs_workspace + ':' + storename
+                workspace = self.geoserverWorkspace(resource)
+                layername = workspace + ':' + storename
 
                 logger.debug('remove layername %s' % layername)
                 logger.debug("CheckMessage.ignore: activity %s for fileid %s " % (action, str(fileid)))
-                self.remove_geoserver_layer(storename, layername)
+                self.remove_geoserver_layer(workspace, storename)
 
                 logger.debug("activity %s for fileid %s is done" % (action, str(fileid)))
                 return CheckMessage.ignore
@@ -86,18 +104,32 @@ class ExtractorsGeotiffPreview(Extractor):
         fileid = resource['id']
 
         # get variable for geoserver workspace. This is a dataset's parent id
-        try:
-            parentid = resource['parent']['id']
-        except:
-            parentid = "no_datasets"
+        parentid = self.geoserverWorkspace(resource)
         self.gs_workspace = parentid
 
         tmpfile = None
+        result = None
 
         try:
             # call actual program
             result = self.extractGeotiff(inputfile, fileid, filename, secret_key)
 
+            # the thumbnail is rendered locally, so it is there even if
+            # geoserver failed
+            if result.get('Quicklook'):
+                try:
+                    pyclowder.files.upload_preview(connector, host, secret_key, fileid, result['Quicklook'], None, 'image/png')
+                    self.logger.debug("upload quicklook preview")
+                except Exception:
+                    self.logger.exception("Error uploading quicklook preview")
+            if result.get('Tile Pyramid'):
+                try:
+                    pyclowder.files.upload_preview(connector, host, secret_key, fileid, result['Tile Pyramid'], None,
+                                                   'application/x-sqlite3')
+                    self.logger.debug("upload tile pyramid preview")
+                except Exception:
+                    self.logger.exception("Error uploading tile pyramid preview")
+
             if not result['WMS Layer URL'] or not result['WMS Service URL'] or not result['WMS Layer URL']:
                 self.logger.info('[%s], inputfile: %s has empty result', fileid, inputfile)
 
@@ -150,26 +182,89 @@ class ExtractorsGeotiffPreview(Extractor):
                 self.logger.debug("delete tmpfile: " + tmpfile)
             except:
                 pass
-
-    def remove_geoserver_layer(self, storename, layername):
-        last_charactor = self.geoServer[-1]
-        if last_charactor == '/':
-            geoserver_rest = self.geoServer + 'rest'
-        else:
-            geoserver_rest = self.geoServer + '/rest'
-        cat = Catalog(geoserver_rest, username=self.gs_username, password=self.gs_password)
-        # worksp = cat.get_workspace(gs_workspace)
-        store = cat.get_store(storename)
-        layer = cat.get_layer(layername)
+            for preview in ('Quicklook', 'Tile Pyramid'):
+                if result is not None and result.get(preview):
+                    try:
+                        os.remove(result[preview])
+                    except OSError:
+                        pass
+
+    def geoserverWorkspace(self, resource):
+        """GeoServer workspace of a file: the id of its dataset."""
         try:
-            cat.delete(layer)
-            cat.reload()
-            cat.delete(store)
-            cat.reload()
-        except:
-            self.logger.error("Failed to remove from geoserver")
+            return resource['parent']['id']
+        except (KeyError, TypeError):
+            return "no_datasets"
+
+    def geoserverClient(self):
+        """The GeoServer client of this process, created on first use and kept for every message."""
+        if self.gsclient is None:
+            self.gsclient = gs.Client(self.geoServer, self.gs_username, self.gs_password)
+        return self.gsclient
+
+    def remove_geoserver_layer(self, workspace, storename):
+        """Queue the store of a removed file, and its layer, for deletion."""
+        if self.removals is None:
+            self.removals = gs.RemovalQueue(self.geoserverClient())
+        self.removals.add(workspace, storename)
+
+    def buildOverviews(self, fileid, inputfile):
+        if os.getenv("GDALADDO_LEVELS") or os.getenv("GDALADDO_ARGS"):
+            # an explicit gdaladdo configuration overrides the planner
+            subprocess.check_call(['/usr/bin/gdaladdo'] +
+                                  os.getenv("GDALADDO_ARGS", "").split() +
+                                  [inputfile] +
+                                  os.getenv("GDALADDO_LEVELS", "2").split())
+            return
+        # levels, resampling and compression chosen for this raster
+        plan = self.analysis.run(overviewplanner.buildOverviews, inputfile)
+        self.logger.info('[%s] overviews %s %s %s: %d -> %d bytes in %.2f s', fileid, plan['levels'],
+                         plan['resampling'], plan['config'].get('COMPRESS_OVERVIEW'),
+                         plan['bytes_before'], plan['bytes_after'], plan['seconds'])
+
+    def renderQuicklook(self, fileid, inputfile, style):
+        """PNG thumbnail of inputfile in the layer style, or None if it could not be rendered."""
+        (fd, pngfile) = tempfile.mkstemp(suffix='.png')
+        os.close(fd)
+        try:
+            report = self.analysis.run(quicklook.renderQuicklook, inputfile, pngfile, style)
+        except analysispool.JobError as e:
+            self.logger.warning('[%s] quicklook failed: %s', fileid, e)
+            os.remove(pngfile)
+            return None
+        self.logger.info('[%s] quicklook %d x %d in %.2f s', fileid, report['width'], report['height'], report['seconds'])
+        return pngfile
+
+    def buildTilePyramid(self, fileid, inputfile, filename, style):
+        """MBTiles file with the low zoom tiles of inputfile, or None if it could not be built."""
+        if self.tilePool is None:
+            self.tilePool = analysispool.AnalysisPool(workers=tilepyramid.tileWorkers())
+        (fd, mbtiles) = tempfile.mkstemp(suffix='.mbtiles')
+        os.close(fd)
+        os.remove(mbtiles)
+        try:
+            report = tilepyramid.buildPyramid(self.tilePool, inputfile, mbtiles, style, filename,
+                                              workers=self.tilePool.workers)
+        except (analysispool.JobError, OSError, ValueError) as e:
+            self.logger.warning('[%s] tile pyramid failed: %s', fileid, e)
+            if os.path.exists(mbtiles):
+                os.remove(mbtiles)
+            return None
+        self.logger.info('[%s] tile pyramid zoom 0-%d: %d of %d tiles, %d bytes in %.2f s', fileid, report['maxzoom'],
+                         report['tiles'], report['planned'], report['bytes'], report['seconds'])
+        return mbtiles
 
     def extractGeotiff(self, inputfile, fileid, filename, secret_key):
+        # the optional cloud optimized copy is written to its own temp dir,
+        # which is removed once the copy is uploaded
+        cogdir = tempfile.mkdtemp() if cogconvert.cogEnabled() else None
+        try:
+            return self.publishGeotiff(inputfile, fileid, filename, secret_key, cogdir)
+        finally:
+            if cogdir is not None:
+                shutil.rmtree(cogdir, ignore_errors=True)
+
+    def publishGeotiff(self, inputfile, fileid, filename, secret_key, cogdir=None):
         storeName = fileid
         msg = {}
         msg['errorMsg'] = []
@@ -177,20 +272,58 @@ class ExtractorsGeotiffPreview(Extractor):
         msg['WMS Service URL'] = ''
         msg['WMS Layer URL'] = ''
         msg['isGeotiff'] = False
+        msg['Quicklook'] = None
+        msg['Tile Pyramid'] = None
 
         uploadfile = inputfile
 
-        geotiffUtil = gu.Utils(uploadfile, self.raster_style)
+        # projection, extent and style of a file with the same contents are
+        # reused instead of being computed again
+        # approximate statistics read the planned overviews, whose sizes
+        # follow the tile size
+        cache = resultcache.ResultCache('%s:v%d:stats=%s,%d:ramp=%s,%s,%d:tiles=%d:cog=%s' % (
+            self.extractorName, CACHE_VERSION, rasterstats.statisticsMode(rasterstats.APPROXIMATE),
+            rasterstats.minimumPixels(), gu.RAMP_LOW, gu.RAMP_HIGH, gu.RAMP_ENTRIES, overviewplanner.tileSize(),
+            cogdir is not None))
+        digest = resultcache.fileDigest(uploadfile)
+        cached = cache.get(digest)
+        probe = cached
+        if probe is None:
+            try:
+                probe = self.analysis.run(gu.probeGeotiff, uploadfile, self.raster_style)
+            except analysispool.JobError as e:
+                msg['errorMsg'].append(str(e))
+                return msg
+
+        geotiffUtil = gu.Utils(uploadfile, self.raster_style, probe)
 
         if not geotiffUtil.hasError():
-            subprocess.check_call(['/usr/bin/gdaladdo'] +
-                                  os.getenv("GDALADDO_ARGS", "").split() +
-                                  [inputfile] +
-                                  os.getenv("GDALADDO_LEVELS", "2").split())
+            if cogdir is not None:
+                # tiled, compressed copy with internal overviews, which
+                # geoserver serves faster and which is smaller to upload
+                cogfile = os.path.join(cogdir, os.path.basename(inputfile))
+                try:
+                    report = self.analysis.run(cogconvert.convertToCog, inputfile, cogfile)
+                except analysispool.JobError as e:
+                    msg['errorMsg'].append(str(e))
+                    return msg
+                if report is None:
+                    self.logger.info('[%s] is a cloud optimized geotiff already', fileid)
+                else:
+                    self.logger.info('[%s] COG %s: %d -> %d bytes (%.1f %%) in %.2f s', fileid,
+                                     ' '.join(report['options']), report['source_bytes'], report['cog_bytes'],
+                                     100.0 * report['cog_bytes'] / max(1, report['source_bytes']), report['seconds'])
+                    uploadfile = cogfile
+            else:
+                try:
+                    self.buildOverviews(fileid, inputfile)
+                except analysispool.JobError as e:
+                    msg['errorMsg'].append(str(e))
+                    return msg
 
             msg['isGeotiff'] = True
             # TODO if the proxy is working, gsclient host should be changed to proxy server
-            gsclient = gs.Client(self.geoServer, self.gs_username, self.gs_password)
+            gsclient = self.geoserverClient()
 
             if self.proxy_on.lower() == 'true':
                 parsed_uri = urlparse(self.geoServer)
@@ -202,21 +335,30 @@ class ExtractorsGeotiffPreview(Extractor):
             epsg = "EPSG:" + str(geotiffUtil.getEpsg())
             style = None
 
-            # check if the input geotiff has a style,
-            # you can do this by checking if there is any color table
-            uploadfile_dataset = gdal.Open(uploadfile)
-            uploadfile_band = uploadfile_dataset.GetRasterBand(1)
-            color_table = uploadfile_band.GetColorTable()
-            if color_table is not None:
-                self.logger.debug("Geotiff has the style already")
+            if cached is not None:
+                style = cached['style']
             else:
-                style = geotiffUtil.createStyle()
+                # a geotiff with a color table has its style already
+                try:
+                    style = self.analysis.run(gu.styleGeotiff, uploadfile, self.raster_style, probe)
+                except analysispool.JobError as e:
+                    msg['errorMsg'].append(str(e))
+                    return msg
                 self.logger.debug("style created")
+                entry = geotiffUtil.cacheEntry()
+                entry['style'] = style
+                cache.put(digest, entry)
+
+            if quicklook.quicklookEnabled():
+                msg['Quicklook'] = self.renderQuicklook(fileid, uploadfile, style)
 
             # merge file name and id and make a new store name
             combined_name = filename + "_" + storeName
 
+            start = time.perf_counter()
             success = gsclient.uploadGeotiff(geoserver_rest, self.gs_workspace, combined_name, uploadfile, filename, style, epsg, secret_key, self.proxy_on)
+            self.logger.info('[%s] uploaded %d bytes in %.2f s', fileid, os.path.getsize(uploadfile),
+                             time.perf_counter() - start)
 
             if success:
                 self.logger.debug("upload geotiff successfully")
@@ -240,7 +382,13 @@ class ExtractorsGeotiffPreview(Extractor):
                         msg['WMS Layer URL'] = metadata['WMS Layer URL']
             else:
                 msg['errorMsg'].append("Fail to upload the file to geoserver")
+
+            if tilepyramid.pyramidEnabled():
+                msg['Tile Pyramid'] = self.buildTilePyramid(fileid, uploadfile, filename, style)
         else:
+            if cached is None:
+                cache.put(digest, geotiffUtil.cacheEntry())
+
             if not geotiffUtil.isGeotiff:
                 msg['isGeotiff'] = False
                 msg['errorMsg'].append("Normal TIFF file")
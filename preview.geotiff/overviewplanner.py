@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+import os
+import sys
+import time
+
+from osgeo import gdal
+
+# overviews stop once the whole raster fits in a tile of this size
+DEFAULT_TILE_SIZE = 256
+
+JPEG_QUALITY = '75'
+
+
+def tileSize():
+    return int(os.getenv('OVERVIEW_TILE_SIZE', DEFAULT_TILE_SIZE))
+
+
+def planLevels(xsize, ysize, tile_size=None):
+    """Power of two decimation factors down to a single tile.
+
+    A raster that already fits in one tile gets no overviews at all.
+    """
+    if tile_size is None:
+        tile_size = tileSize()
+    levels = []
+    factor = 2
+    while max(xsize, ysize) / float(factor // 2) > tile_size:
+        levels.append(factor)
+        factor *= 2
+    return levels
+
+
+def isRGB(ds):
+    if ds.RasterCount not in (3, 4):
+        return False
+    interpretation = [ds.GetRasterBand(i).GetColorInterpretation() for i in range(1, 4)]
+    return interpretation == [gdal.GCI_RedBand, gdal.GCI_GreenBand, gdal.GCI_BlueBand]
+
+
+def planOverviews(ds, tile_size=None):
+    """Levels, resampling and compression suited to the raster.
+
+    Paletted rasters and rasters with an attribute table are categorical
+    and resampled with NEAREST, so no invented classes appear. 8 bit RGB imagery is averaged
+    and stored as JPEG (YCbCr); JPEG cannot hold an alpha band, so RGBA
+    falls back to DEFLATE. Everything else, in particular 16 bit and
+    floating point data that JPEG would reject or damage, is averaged and
+    stored losslessly with DEFLATE and the matching predictor.
+    """
+    band = ds.GetRasterBand(1)
+    datatype = band.DataType
+    plan = dict()
+    plan['levels'] = planLevels(ds.RasterXSize, ds.RasterYSize, tile_size)
+    config = {'COMPRESS_OVERVIEW': 'DEFLATE'}
+    if band.GetColorTable() is not None or band.GetDefaultRAT() is not None:
+        plan['resampling'] = 'NEAREST'
+    elif datatype == gdal.GDT_Byte and isRGB(ds):
+        plan['resampling'] = 'AVERAGE'
+        if ds.RasterCount == 3:
+            config = {'COMPRESS_OVERVIEW': 'JPEG', 'JPEG_QUALITY_OVERVIEW': JPEG_QUALITY,
+                      'PHOTOMETRIC_OVERVIEW': 'YCBCR', 'INTERLEAVE_OVERVIEW': 'PIXEL'}
+        else:
+            config['PREDICTOR_OVERVIEW'] = '2'
+    elif datatype in (gdal.GDT_Float32, gdal.GDT_Float64):
+        plan['resampling'] = 'AVERAGE'
+        config['PREDICTOR_OVERVIEW'] = '3'
+    else:
+        plan['resampling'] = 'AVERAGE'
+        config['PREDICTOR_OVERVIEW'] = '2'
+    # multithreaded compression, and resampling on GDAL 3.2 or later
+    config['GDAL_NUM_THREADS'] = 'ALL_CPUS'
+    plan['config'] = config
+    return plan
+
+
+def buildOverviews(path, tile_size=None):
+    """Build the planned internal overviews of path in place.
+
+    Returns the plan together with the build time and the file size before
+    and after. Rasters that already have overviews are left alone.
+    """
+    ds = gdal.Open(path, gdal.GA_Update)
+    if ds is None:
+        raise ValueError("could not open raster %s" % path)
+    plan = planOverviews(ds, tile_size)
+    plan['bytes_before'] = os.path.getsize(path)
+    plan['seconds'] = 0.0
+    if ds.GetRasterBand(1).GetOverviewCount() > 0 or not plan['levels']:
+        plan['levels'] = []
+        plan['bytes_after'] = plan['bytes_before']
+        return plan
+
+    previous = dict((key, gdal.GetConfigOption(key)) for key in plan['config'])
+    for key, value in plan['config'].items():
+        gdal.SetConfigOption(key, value)
+    try:
+        start = time.perf_counter()
+        if ds.BuildOverviews(plan['resampling'], plan['levels']) != 0:
+            raise RuntimeError("could not build overviews of %s" % path)
+        ds = None
+        plan['seconds'] = time.perf_counter() - start
+    finally:
+        for key, value in previous.items():
+            gdal.SetConfigOption(key, value)
+    plan['bytes_after'] = os.path.getsize(path)
+    return plan
+
+
+if __name__ == "__main__":
+    # usage: python overviewplanner.py raster.tif [...]
+    # prints the plan; with --build the overviews are written as well
+    gdal.UseExceptions()
+    build = '--build' in sys.argv
+    for source in [a for a in sys.argv[1:] if a != '--build']:
+        if build:
+            plan = buildOverviews(source)
+        else:
+            plan = planOverviews(gdal.Open(source))
+        print('%s: %s' % (source, plan))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+import math
+
+import numpy
+
+
+class KLLSketch:
+    """Mergeable streaming quantile sketch (Karnin, Lang, Liberty 2016).
+
+    Items are kept in a stack of compactors; the item at level h stands for
+    2**h input values. A full compactor is sorted and every other item is
+    promoted to the next level, starting at an offset that alternates
+    between compactions. Large numpy batches are first reduced to about k
+    evenly spaced order statistics at the matching level, picked with
+    numpy.partition in O(n log k) rather than a sort of the whole block.
+    Nothing is random: the same values fed in the same order always give
+    the same quantiles. Sketches built by different workers over different
+    blocks merge into the sketch of the union.
+    """
+
+    def __init__(self, k=800):
+        self.k = k
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.compactors = [numpy.empty(0)]
+        # offset of the next compaction at each level, 0 or 1
+        self.offsets = [0]
+
+    def capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return max(2, int(math.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def update(self, values):
+        values = numpy.asarray(values).ravel()
+        n = values.size
+        if n == 0:
+            return
+        self.count += n
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        level = 0
+        while (n >> level) > self.k:
+            level += 1
+        if level == 0:
+            sample = values.astype(numpy.float64)
+        else:
+            # the middle item of every run of stride items in sorted order,
+            # each worth stride values
+            stride = 1 << level
+            items = max(1, int(round(float(n) / stride)))
+            ranks = ((numpy.arange(items) + 0.5) * n / items).astype(numpy.int64)
+            sample = numpy.partition(values, ranks)[ranks].astype(numpy.float64)
+        self._insert(level, sample)
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        for level, items in enumerate(other.compactors):
+            if items.size:
+                self._insert(level, items, compress=False)
+        self._compress()
+        return self
+
+    def _insert(self, level, items, compress=True):
+        while len(self.compactors) <= level:
+            self.compactors.append(numpy.empty(0))
+            self.offsets.append(0)
+        self.compactors[level] = numpy.concatenate((self.compactors[level], items))
+        if compress:
+            self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self.compactors):
+            items = self.compactors[level]
+            if items.size >= self.capacity(level):
+                items = numpy.sort(items)
+                # an odd item out stays behind at this level
+                keep = items[-1:] if items.size % 2 else items[:0]
+                paired = items[:items.size - keep.size]
+                promoted = paired[self.offsets[level]::2]
+                self.offsets[level] ^= 1
+                self.compactors[level] = keep
+                if level + 1 == len(self.compactors):
+                    self.compactors.append(numpy.empty(0))
+                    self.offsets.append(0)
+                self.compactors[level + 1] = numpy.concatenate((self.compactors[level + 1], promoted))
+            level += 1
+
+    def _weighted(self):
+        items = numpy.concatenate(self.compactors)
+        weights = numpy.concatenate([numpy.full(c.size, 1 << level, dtype=numpy.float64)
+                                     for level, c in enumerate(self.compactors)])
+        order = numpy.argsort(items, kind='mergesort')
+        return items[order], numpy.cumsum(weights[order])
+
+    def quantiles(self, fractions):
+        """Estimated values at the given fractions (0..1) of the distribution."""
+        fractions = numpy.asarray(fractions, dtype=numpy.float64)
+        if self.count == 0:
+            return numpy.full(fractions.shape, numpy.nan)
+        items, cumulative = self._weighted()
+        ranks = fractions * cumulative[-1]
+        index = numpy.minimum(numpy.searchsorted(cumulative, ranks, side='left'), items.size - 1)
+        result = items[index]
+        # the extremes are tracked exactly
+        result = numpy.where(fractions <= 0.0, self.min, result)
+        result = numpy.where(fractions >= 1.0, self.max, result)
+        return numpy.clip(result, self.min, self.max)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+import os
+import sys
+import time
+import xml.etree.ElementTree as ElementTree
+
+import numpy
+from osgeo import gdal
+
+# longest side of the thumbnail, in pixels
+DEFAULT_SIZE = 512
+
+# percentiles for stretching imagery that has no style
+STRETCH_LOW = 2.0
+STRETCH_HIGH = 98.0
+
+
+def quicklookEnabled():
+    return os.getenv('QUICKLOOK_ENABLED', 'true').lower() == 'true'
+
+
+def quicklookSize():
+    return int(os.getenv('QUICKLOOK_SIZE', DEFAULT_SIZE))
+
+
+def thumbnailSize(xsize, ysize, size):
+    scale = min(1.0, float(size) / max(xsize, ysize))
+    return max(1, int(round(xsize * scale))), max(1, int(round(ysize * scale)))
+
+
+def overviewIndex(band, xsize, ysize):
+    """Index of the smallest overview at least xsize x ysize, or None for the band itself."""
+    selected = None
+    pixels = band.XSize * band.YSize
+    for i in range(band.GetOverviewCount()):
+        overview = band.GetOverview(i)
+        if overview.XSize >= xsize and overview.YSize >= ysize and overview.XSize * overview.YSize < pixels:
+            selected = i
+            pixels = overview.XSize * overview.YSize
+    return selected
+
+
+def readBand(band, index, xsize, ysize):
+    source = band if index is None else band.GetOverview(index)
+    return source.ReadAsArray(0, 0, source.XSize, source.YSize, buf_xsize=xsize, buf_ysize=ysize)
+
+
+def colorMap(styleStr):
+    """Quantities and RGBA colors of the ColorMapEntry elements of an SLD, in order."""
+    root = ElementTree.fromstring(styleStr.encode('utf-8') if isinstance(styleStr, str) else styleStr)
+    quantities = []
+    colors = []
+    for entry in root.iter():
+        if not entry.tag.endswith('ColorMapEntry'):
+            continue
+        color = entry.get('color', '#000000').lstrip('#')
+        opacity = float(entry.get('opacity', '1.0'))
+        quantities.append(float(entry.get('quantity')))
+        colors.append([int(color[0:2], 16), int(color[2:4], 16), int(color[4:6], 16), int(round(255 * opacity))])
+    return numpy.array(quantities, dtype=numpy.float64), numpy.array(colors, dtype=numpy.float64).reshape(-1, 4)
+
+
+def applyColorMap(values, quantities, colors):
+    """RGBA of values on the ramp, interpolated between entries as GeoServer does."""
+    order = numpy.argsort(quantities, kind='stable')
+    quantities = quantities[order]
+    colors = colors[order]
+    rgba = numpy.empty(values.shape + (4,), dtype=numpy.uint8)
+    for channel in range(4):
+        rgba[..., channel] = numpy.interp(values, quantities, colors[:, channel]).round().astype(numpy.uint8)
+    return rgba
+
+
+def stretchRange(values, valid):
+    """(low, high) percentiles of the valid values, or None when there are none."""
+    if not valid.any():
+        return None
+    low, high = numpy.percentile(values[valid], [STRETCH_LOW, STRETCH_HIGH])
+    if high <= low:
+        high = low + 1
+    return float(low), float(high)
+
+
+def stretch(values, valid, limits=None):
+    """values scaled to bytes between limits, by default the percentiles of values itself."""
+    if limits is None:
+        limits = stretchRange(values, valid)
+    if limits is None:
+        return numpy.zeros(values.shape, dtype=numpy.uint8)
+    low, high = limits
+    return (numpy.clip((values - low) / (high - low), 0.0, 1.0) * 255.0).round().astype(numpy.uint8)
+
+
+def validMask(band, values):
+    valid = numpy.isfinite(values) if values.dtype.kind == 'f' else numpy.ones(values.shape, dtype=bool)
+    nodata = band.GetNoDataValue()
+    if nodata is not None:
+        valid &= values != nodata
+    return valid
+
+
+def stretchLimits(ds, size=DEFAULT_SIZE):
+    """Stretch limits of the first three bands of ds, read from an overview.
+
+    Parts of a raster rendered separately, such as tiles, are stretched
+    with the limits of the whole raster so that they match.
+    """
+    xsize, ysize = thumbnailSize(ds.RasterXSize, ds.RasterYSize, size)
+    limits = []
+    for i in range(1, min(ds.RasterCount, 3) + 1):
+        band = ds.GetRasterBand(i)
+        values = readBand(band, overviewIndex(band, xsize, ysize), xsize, ysize)
+        limits.append(stretchRange(values, validMask(band, values)))
+    return limits
+
+
+def render(ds, styleStr, xsize, ysize, limits=None):
+    """RGBA array of ds at xsize x ysize, styled like the GeoServer layer.
+
+    limits (see stretchLimits) fixes the stretch of unstyled bands; by
+    default each band is stretched over its own values.
+    """
+    if limits is None:
+        limits = [None, None, None]
+    band = ds.GetRasterBand(1)
+    index = overviewIndex(band, xsize, ysize)
+    values = readBand(band, index, xsize, ysize)
+    valid = validMask(band, values)
+    colortable = band.GetColorTable()
+    interpretation = [ds.GetRasterBand(i).GetColorInterpretation() for i in range(1, min(ds.RasterCount, 3) + 1)]
+
+    if colortable is not None:
+        lut = numpy.array([colortable.GetColorEntry(i) for i in range(colortable.GetCount())], dtype=numpy.uint8)
+        rgba = lut[numpy.clip(values.astype(numpy.int64), 0, len(lut) - 1)]
+    elif styleStr and styleStr != 'None':
+        quantities, colors = colorMap(styleStr)
+        rgba = applyColorMap(values.astype(numpy.float64), quantities, colors)
+    elif interpretation == [gdal.GCI_RedBand, gdal.GCI_GreenBand, gdal.GCI_BlueBand]:
+        rgba = numpy.empty(values.shape + (4,), dtype=numpy.uint8)
+        for i in range(3):
+            if i > 0:
+                band = ds.GetRasterBand(i + 1)
+                values = readBand(band, index, xsize, ysize)
+                valid &= validMask(band, values)
+            rgba[..., i] = values if values.dtype == numpy.uint8 else stretch(values, valid, limits[i])
+        rgba[..., 3] = 255
+        if ds.RasterCount > 3 and ds.GetRasterBand(4).GetColorInterpretation() == gdal.GCI_AlphaBand:
+            rgba[..., 3] = readBand(ds.GetRasterBand(4), index, xsize, ysize)
+    else:
+        grey = stretch(values, valid, limits[0])
+        rgba = numpy.stack((grey, grey, grey, numpy.full(grey.shape, 255, dtype=numpy.uint8)), axis=-1)
+    rgba[..., 3] = numpy.where(valid, rgba[..., 3], 0)
+    return rgba
+
+
+def writePng(rgba, destination):
+    height, width = rgba.shape[:2]
+    mem = gdal.GetDriverByName('MEM').Create('', width, height, 4, gdal.GDT_Byte)
+    for i in range(4):
+        mem.GetRasterBand(i + 1).WriteArray(rgba[..., i])
+    png = gdal.GetDriverByName('PNG').CreateCopy(destination, mem)
+    if png is None:
+        raise RuntimeError("could not write %s" % destination)
+    png = None
+    mem = None
+
+
+def renderQuicklook(source, destination, styleStr, size=None):
+    """Write a PNG thumbnail of source, at most size pixels on its longest side.
+
+    Reads the smallest overview that still covers the thumbnail and colors
+    it with the ramp of styleStr (see geotiffutils.Utils.createStyle), the
+    color table of the raster, or its RGB bands. Returns the thumbnail size
+    and the render time.
+    """
+    if size is None:
+        size = quicklookSize()
+    start = time.perf_counter()
+    ds = gdal.Open(source)
+    if ds is None:
+        raise ValueError("could not open raster %s" % source)
+    xsize, ysize = thumbnailSize(ds.RasterXSize, ds.RasterYSize, size)
+    writePng(render(ds, styleStr, xsize, ysize), destination)
+    ds = None
+    return {'width': xsize, 'height': ysize, 'seconds': time.perf_counter() - start}
+
+
+if __name__ == "__main__":
+    # usage: python quicklook.py raster.tif output.png [style.sld]
+    gdal.UseExceptions()
+    style = None
+    if len(sys.argv) > 3:
+        with open(sys.argv[3]) as f:
+            style = f.read()
+    print(renderQuicklook(sys.argv[1], sys.argv[2], style))
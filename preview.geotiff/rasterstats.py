@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+from osgeo import gdal, gdal_array
+
+from runningstats import RunningStats, splitRows
+
+EXACT = 'exact'
+APPROXIMATE = 'approximate'
+
+# approximate mode reads the coarsest overview with at least this many pixels
+DEFAULT_MIN_PIXELS = 1024 * 1024
+DEFAULT_HISTOGRAM_BINS = 256
+
+# upper bound for a single read window, counted in float64 working-copy
+# bytes; memory use stays at this size whatever the size of the raster
+DEFAULT_WINDOW_BYTES = 16 * 1024 * 1024
+
+def planWindows(band, window_bytes=DEFAULT_WINDOW_BYTES, row_start=0, row_end=None):
+    """Yield (xoff, yoff, xsize, ysize) read windows in natural block order.
+
+    Windows are aligned on block boundaries. Strip-organised files get several
+    strips per window and tiled files get several tiles per window, up to
+    window_bytes, so per-call overhead stays small without loading more than
+    one window at a time.
+    """
+    xsize = band.XSize
+    ysize = band.YSize if row_end is None else min(row_end, band.YSize)
+    block_x, block_y = band.GetBlockSize()
+    # every window is converted to float64 while reducing, so size for that
+    itemsize = max(8, gdal.GetDataTypeSize(band.DataType) // 8)
+    block_bytes = max(1, block_x * block_y * itemsize)
+
+    if block_x >= xsize:
+        win_x = xsize
+        win_y = block_y * max(1, window_bytes // max(1, xsize * block_y * itemsize))
+    else:
+        blocks_per_row = int(math.ceil(float(xsize) / block_x))
+        win_x = block_x * max(1, min(blocks_per_row, window_bytes // block_bytes))
+        win_y = block_y
+
+    for yoff in range(row_start, ysize, win_y):
+        height = min(win_y, ysize - yoff)
+        for xoff in range(0, xsize, win_x):
+            yield xoff, yoff, min(win_x, xsize - xoff), height
+
+
+class BlockReader:
+    """Read windows of one band into reusable numpy buffers.
+
+    Only a handful of buffer shapes exist (full windows plus the right and
+    bottom edges), so after the first row of windows pixels are read without
+    allocating. The validity masks built by read() and the copy of the valid
+    pixels returned by values() are still allocated for every window, so
+    they are bounded by the window size, not by the size of the raster.
+    """
+
+    def __init__(self, band):
+        self.band = band
+        self.dtype = numpy.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(band.DataType))
+        self.nodata = band.GetNoDataValue()
+        self.is_float = self.dtype.kind == 'f'
+        flags = band.GetMaskFlags()
+        self.mask_band = None
+        if not flags & (gdal.GMF_ALL_VALID | gdal.GMF_NODATA):
+            # per-dataset mask or alpha band
+            self.mask_band = band.GetMaskBand()
+        if self.nodata is not None and not self.is_float:
+            info = numpy.iinfo(self.dtype)
+            if not (info.min <= self.nodata <= info.max) or self.nodata != int(self.nodata):
+                # nodata value that cannot occur in this datatype
+                self.nodata = None
+        self._buffers = {}
+        self._mask_buffers = {}
+
+    def _buffer(self, cache, shape, dtype):
+        buf = cache.get(shape)
+        if buf is None:
+            buf = numpy.empty(shape, dtype=dtype)
+            cache[shape] = buf
+        return buf
+
+    def read(self, xoff, yoff, xsize, ysize):
+        """Return the window as an array plus a validity mask (None if all valid)."""
+        shape = (ysize, xsize)
+        data = self._buffer(self._buffers, shape, self.dtype)
+        self.band.ReadAsArray(xoff, yoff, xsize, ysize, buf_obj=data)
+
+        valid = None
+        if self.mask_band is not None:
+            mask = self._buffer(self._mask_buffers, shape, numpy.uint8)
+            self.mask_band.ReadAsArray(xoff, yoff, xsize, ysize, buf_obj=mask)
+            valid = mask != 0
+        if self.nodata is not None:
+            if self.is_float and math.isnan(self.nodata):
+                nodata_valid = ~numpy.isnan(data)
+            else:
+                nodata_valid = data != self.nodata
+            valid = nodata_valid if valid is None else valid & nodata_valid
+        if self.is_float and (self.nodata is None or not math.isnan(self.nodata)):
+            finite = numpy.isfinite(data)
+            if not finite.all():
+                valid = finite if valid is None else valid & finite
+        return data, valid
+
+    def values(self, xoff, yoff, xsize, ysize):
+        """Return the valid pixels of the window as a flat array."""
+        data, valid = self.read(xoff, yoff, xsize, ysize)
+        if valid is None:
+            return data.ravel()
+        return data[valid]
+
+
+def computeBandStatistics(band, window_bytes=DEFAULT_WINDOW_BYTES, row_start=0, row_end=None, sketch=None):
+    """Exact statistics of one band (or a row range of it) in one streaming pass."""
+    stats = RunningStats(sketch)
+    reader = BlockReader(band)
+    for window in planWindows(band, window_bytes, row_start, row_end):
+        stats.update(reader.values(*window))
+    return stats
+
+
+def defaultWorkers():
+    return int(os.getenv('STATS_WORKERS', os.cpu_count() or 1))
+
+
+def computeAllBandStatistics(raster_uri, workers=None, window_bytes=DEFAULT_WINDOW_BYTES, bands=None,
+                             sketch_factory=None):
+    """Exact statistics for every band, split by band and row range over a thread pool.
+
+    GDAL releases the GIL while decoding blocks, so threads scale with cores.
+    Dataset handles are not thread safe; each worker thread opens its own and
+    the partial results of each band are merged at the end. With a
+    sketch_factory every partial result carries its own sketch and the
+    sketches are merged along with the statistics.
+    Returns a list of (band index, RunningStats) in band order.
+    """
+    def newSketch():
+        return sketch_factory() if sketch_factory is not None else None
+
+    if workers is None:
+        workers = defaultWorkers()
+    ds = gdal.Open(raster_uri)
+    if ds is None:
+        raise ValueError("could not open raster %s" % raster_uri)
+    if bands is None:
+        bands = list(range(1, ds.RasterCount + 1))
+    if not bands:
+        return []
+
+    if workers <= 1:
+        try:
+            return [(i, computeBandStatistics(ds.GetRasterBand(i), window_bytes, sketch=newSketch())) for i in bands]
+        finally:
+            ds = None
+
+    # enough row ranges per band to keep every worker busy
+    parts = max(1, int(math.ceil(2.0 * workers / len(bands))))
+    jobs = [(i, start, end) for i in bands for start, end in splitRows(ds.GetRasterBand(i), parts)]
+    ds = None
+
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+
+    def run(job):
+        band_index, start, end = job
+        handle = getattr(local, 'dataset', None)
+        if handle is None:
+            handle = gdal.Open(raster_uri)
+            local.dataset = handle
+            with handles_lock:
+                handles.append(handle)
+        return band_index, computeBandStatistics(handle.GetRasterBand(band_index), window_bytes, start, end,
+                                                 newSketch())
+
+    merged = dict((i, RunningStats(newSketch())) for i in bands)
+    try:
+        with ThreadPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            for band_index, stats in executor.map(run, jobs):
+                merged[band_index].merge(stats)
+    finally:
+        del handles[:]
+    return [(i, merged[i]) for i in bands]
+
+
+def statisticsMode(default=EXACT):
+    mode = os.getenv('STATS_MODE', default).lower()
+    if mode not in (EXACT, APPROXIMATE):
+        raise ValueError("STATS_MODE must be '%s' or '%s', not '%s'" % (EXACT, APPROXIMATE, mode))
+    return mode
+
+
+def minimumPixels():
+    return int(os.getenv('STATS_MIN_PIXELS', DEFAULT_MIN_PIXELS))
+
+
+def selectOverview(band, min_pixels):
+    """Return the coarsest overview of band with at least min_pixels pixels.
+
+    Falls back to the band itself when no overview is large enough.
+    """
+    selected = band
+    for i in range(band.GetOverviewCount()):
+        overview = band.GetOverview(i)
+        pixels = overview.XSize * overview.YSize
+        if min_pixels <= pixels < selected.XSize * selected.YSize:
+            selected = overview
+    return selected
+
+
+def computeHistogram(band, minimum, maximum, bins=DEFAULT_HISTOGRAM_BINS, window_bytes=DEFAULT_WINDOW_BYTES):
+    counts = numpy.zeros(bins, dtype=numpy.int64)
+    if minimum is None or maximum is None:
+        return counts
+    if maximum <= minimum:
+        maximum = minimum + 1
+    reader = BlockReader(band)
+    for window in planWindows(band, window_bytes):
+        counts += numpy.histogram(reader.values(*window), bins=bins, range=(minimum, maximum))[0]
+    return counts
+
+
+def computeApproximateStatistics(band, min_pixels=None, bins=DEFAULT_HISTOGRAM_BINS):
+    """Statistics and histogram of band taken from its coarsest usable overview.
+
+    The result records the overview that was read ('sampling_level' is its
+    decimation factor, 1 means full resolution) and the precision of the
+    estimate: the sampled fraction of pixels and the standard error of the
+    mean. Overview pixels are resampled, so min and max are estimates too.
+    """
+    if min_pixels is None:
+        min_pixels = minimumPixels()
+    source = selectOverview(band, min_pixels)
+    stats = computeBandStatistics(source)
+    result = stats.toDict()
+
+    histogram = computeHistogram(source, result['min'], result['max'], bins)
+    result['histogram'] = {'min': result['min'], 'max': result['max'], 'counts': histogram.tolist()}
+
+    sampling_level = float(band.XSize) / source.XSize
+    result['approximate'] = source is not band
+    result['sampling_level'] = sampling_level
+    precision = dict()
+    precision['sampled_pixels'] = source.XSize * source.YSize
+    precision['sample_fraction'] = float(source.XSize * source.YSize) / (band.XSize * band.YSize)
+    if stats.count:
+        precision['mean_standard_error'] = result['st-dev'] / math.sqrt(stats.count)
+    else:
+        precision['mean_standard_error'] = None
+    result['precision'] = precision
+    return result
+
+
+def computeStatistics(raster_uri, band_index=1, window_bytes=DEFAULT_WINDOW_BYTES):
+    ds = gdal.Open(raster_uri)
+    if ds is None:
+        raise ValueError("could not open raster %s" % raster_uri)
+    try:
+        return computeBandStatistics(ds.GetRasterBand(band_index), window_bytes).toDict()
+    finally:
+        ds = None
+
+
+# ----------------------------------------------------------------------
+# Benchmark: streaming engine vs. GDAL ComputeStatistics.
+# usage: python rasterstats.py raster [raster ...]
+#        python rasterstats.py --synthetic GIGABYTES
+
+def _synthetic_bigtiff(path, gigabytes):
+    size = int(math.sqrt(gigabytes * (1 << 30) / 4.0))
+    ds = gdal.GetDriverByName('GTiff').Create(path, size, size, 1, gdal.GDT_Float32,
+                                              ['TILED=YES', 'BIGTIFF=YES'])
+    band = ds.GetRasterBand(1)
+    rows = max(1, (64 << 20) // (size * 4))
+    for yoff in range(0, size, rows):
+        nrows = min(rows, size - yoff)
+        band.WriteArray(numpy.random.standard_normal((nrows, size)).astype(numpy.float32), 0, yoff)
+    ds = None
+    return path
+
+
+def _benchmark(raster_uri):
+    ds = gdal.Open(raster_uri)
+    band = ds.GetRasterBand(1)
+    print('%s (%d x %d, %s)' % (raster_uri, ds.RasterXSize, ds.RasterYSize, gdal.GetDataTypeName(band.DataType)))
+
+    start = time.perf_counter()
+    gdal_stats = band.ComputeStatistics(False)
+    gdal_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    stream_stats = computeBandStatistics(band).toDict()
+    stream_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parallel = computeAllBandStatistics(raster_uri)
+    parallel_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    approximate = computeApproximateStatistics(band)
+    approximate_time = time.perf_counter() - start
+
+    print('  gdal    %9.2f s  min %s max %s mean %s std %s' % ((gdal_time,) + tuple(gdal_stats)))
+    print('  stream  %9.2f s  min %s max %s mean %s std %s' %
+          (stream_time, stream_stats['min'], stream_stats['max'], stream_stats['average'], stream_stats['st-dev']))
+    print('  threads %9.2f s  all %d bands' % (parallel_time, len(parallel)))
+    print('  approx  %9.2f s  min %s max %s mean %s std %s (level %s)' %
+          (approximate_time, approximate['min'], approximate['max'], approximate['average'],
+           approximate['st-dev'], approximate['sampling_level']))
+    ds = None
+
+
+if __name__ == "__main__":
+    gdal.UseExceptions()
+    # keep GDAL from writing statistics into a .aux.xml during the benchmark
+    gdal.SetConfigOption('GDAL_PAM_ENABLED', 'NO')
+    if len(sys.argv) == 3 and sys.argv[1] == '--synthetic':
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(), 'synthetic.tif')
+        try:
+            _benchmark(_synthetic_bigtiff(path, float(sys.argv[2])))
+        finally:
+            os.remove(path)
+            os.rmdir(os.path.dirname(path))
+    else:
+        for raster in sys.argv[1:]:
+            _benchmark(raster)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DIGEST_CHUNK = 1024 * 1024
+
+
+def cacheDir():
+    """Directory of the cache database; RESULT_CACHE_DIR='' disables the cache."""
+    return os.getenv('RESULT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'geo-result-cache'))
+
+
+def maxBytes():
+    return int(os.getenv('RESULT_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+
+
+def fileDigest(path):
+    """SHA-256 of the file contents, as hex."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Persistent SQLite cache of analysis results keyed by file content.
+
+    The same file uploaded to several datasets has the same SHA-256, so its
+    probe results (projection, extent, statistics, style, errors) are
+    computed once. Results are stored as JSON under a namespace that the
+    caller builds from its name and every setting that changes the result.
+    The total size of stored results is kept under max_bytes by evicting
+    the least recently used entries. Any database error disables the cache
+    for the call instead of failing the extraction.
+    """
+
+    def __init__(self, namespace, directory=None, max_bytes=None):
+        self.namespace = namespace
+        self.directory = cacheDir() if directory is None else directory
+        self.max_bytes = maxBytes() if max_bytes is None else max_bytes
+        self.logger = logging.getLogger('resultcache')
+        self.path = None
+        if self.directory and self.max_bytes > 0:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                self.path = os.path.join(self.directory, 'results.sqlite')
+                with self._connect() as db:
+                    db.execute('CREATE TABLE IF NOT EXISTS results ('
+                               'namespace TEXT NOT NULL, digest TEXT NOT NULL, value TEXT NOT NULL, '
+                               'size INTEGER NOT NULL, last_used REAL NOT NULL, '
+                               'PRIMARY KEY (namespace, digest))')
+                    db.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+            except (OSError, sqlite3.Error) as e:
+                self.logger.warning('result cache disabled: %s' % e)
+                self.path = None
+
+    @contextmanager
+    def _connect(self):
+        # several extractor processes may share the directory
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            db.execute('PRAGMA journal_mode=WAL')
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def get(self, digest):
+        """Cached result for digest, or None."""
+        if not self.enabled:
+            return None
+        try:
+            with self._connect() as db:
+                row = db.execute('SELECT value FROM results WHERE namespace = ? AND digest = ?',
+                                 (self.namespace, digest)).fetchone()
+                if row is None:
+                    return None
+                db.execute('UPDATE results SET last_used = ? WHERE namespace = ? AND digest = ?',
+                           (time.time(), self.namespace, digest))
+        except sqlite3.Error as e:
+            self.logger.warning('result cache lookup failed: %s' % e)
+            return None
+        self.logger.debug('result cache hit %s %s' % (self.namespace, digest))
+        return json.loads(row[0])
+
+    def put(self, digest, result):
+        if not self.enabled:
+            return
+        value = json.dumps(result)
+        if len(value) > self.max_bytes:
+            return
+        try:
+            with self._connect() as db:
+                db.execute('INSERT OR REPLACE INTO results (namespace, digest, value, size, last_used) '
+                           'VALUES (?, ?, ?, ?, ?)', (self.namespace, digest, value, len(value), time.time()))
+                self._evict(db)
+        except sqlite3.Error as e:
+            self.logger.warning('result cache store failed: %s' % e)
+
+    def _evict(self, db):
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        freed = 0
+        victims = []
+        for namespace, digest, size in db.execute('SELECT namespace, digest, size FROM results ORDER BY last_used'):
+            victims.append((namespace, digest))
+            freed += size
+            if total - freed <= self.max_bytes:
+                break
+        db.executemany('DELETE FROM results WHERE namespace = ? AND digest = ?', victims)
+        self.logger.debug('result cache evicted %d entries' % len(victims))
+
+
+if __name__ == "__main__":
+    # usage: python resultcache.py file [file ...]
+    cache = ResultCache('resultcache-demo', directory=tempfile.mkdtemp(), max_bytes=4096)
+    for source in sys.argv[1:]:
+        start = time.perf_counter()
+        key = fileDigest(source)
+        print('%s %s (%.2f ms)' % (key, source, (time.perf_counter() - start) * 1000.0))
+        print('  before put: %s' % cache.get(key))
+        cache.put(key, {'size': os.path.getsize(source)})
+        print('  after put: %s' % cache.get(key))
@@ -0,0 +1,47 @@
+import numpy
+import pytest
+
+pytest.importorskip('osgeo')
+
+import extentengine
+
+WORLD = numpy.pi * extentengine.EARTH_RADIUS
+
+
+def longitudeRange(*lon):
+    return tuple(float(value) for value in extentengine._longitudeRange(numpy.array(lon, dtype=float)))
+
+
+def test_longitude_range_without_crossing():
+    assert longitudeRange(10.0, -20.0, 35.0) == (-20.0, 35.0)
+    assert longitudeRange(42.0) == (42.0, 42.0)
+
+
+def test_longitude_range_across_the_antimeridian():
+    assert longitudeRange(170.0, 175.0, -175.0, -170.0) == (170.0, 190.0)
+    # longitudes outside -180..180 are wrapped first
+    assert longitudeRange(170.0, 185.0, 190.0) == (170.0, 190.0)
+    assert longitudeRange(-190.0, -170.0) == (170.0, 190.0)
+
+
+def test_longitude_range_prefers_the_smaller_interval():
+    # the gap across 0 is wider than the one across 180
+    assert longitudeRange(-100.0, 100.0) == (100.0, 260.0)
+    # exactly half the world is not a crossing
+    assert longitudeRange(-90.0, 90.0) == (-90.0, 90.0)
+
+
+def test_mercator_box():
+    assert extentengine.mercatorBox([-180.0, -90.0, 180.0, 90.0]) == pytest.approx([-WORLD, -WORLD, WORLD, WORLD])
+    assert extentengine.mercatorBox([0.0, 0.0, 0.0, 0.0]) == pytest.approx([0.0, 0.0, 0.0, 0.0], abs=1e-6)
+
+
+def test_mercator_box_keeps_a_crossing_box_past_the_edge():
+    box = extentengine.mercatorBox([170.0, -10.0, 190.0, 10.0])
+    assert box[0] < WORLD < box[2]
+    assert box[2] == pytest.approx(WORLD * 190.0 / 180.0)
+
+
+def test_geographic_box_inverts_mercator_box():
+    for box in ([-120.0, 30.0, -100.0, 50.0], [170.0, -60.0, 190.0, -40.0], [-180.0, -85.0, 180.0, 85.0]):
+        assert extentengine.geographicBox(extentengine.mercatorBox(box)) == pytest.approx(box)
@@ -0,0 +1,82 @@
+import pytest
+
+gdal = pytest.importorskip('osgeo.gdal')
+
+import overviewplanner
+
+
+@pytest.mark.parametrize('xsize,ysize,levels', [
+    (200, 200, []),
+    (256, 256, []),
+    (257, 257, [2]),
+    (512, 512, [2]),
+    (513, 513, [2, 4]),
+    (1000, 1000, [2, 4]),
+    (4096, 4096, [2, 4, 8, 16]),
+    (1000, 100, [2, 4]),
+    (100, 1000, [2, 4]),
+    (100000, 10, [2, 4, 8, 16, 32, 64, 128, 256, 512]),
+])
+def test_levels_stop_at_one_tile(xsize, ysize, levels):
+    assert overviewplanner.planLevels(xsize, ysize, 256) == levels
+
+
+def test_levels_follow_tile_size(monkeypatch):
+    assert overviewplanner.planLevels(1024, 1024, 512) == [2]
+    monkeypatch.setenv('OVERVIEW_TILE_SIZE', '128')
+    assert overviewplanner.planLevels(1024, 1024) == [2, 4, 8]
+
+
+def dataset(datatype, bands=1, interpretation=None):
+    ds = gdal.GetDriverByName('MEM').Create('', 600, 400, bands, datatype)
+    for i, value in enumerate(interpretation or [], 1):
+        ds.GetRasterBand(i).SetColorInterpretation(value)
+    return ds
+
+
+RGB = [gdal.GCI_RedBand, gdal.GCI_GreenBand, gdal.GCI_BlueBand]
+
+
+def test_rgb_uses_jpeg():
+    plan = overviewplanner.planOverviews(dataset(gdal.GDT_Byte, 3, RGB), 256)
+    assert plan['levels'] == [2, 4]
+    assert plan['resampling'] == 'AVERAGE'
+    assert plan['config']['COMPRESS_OVERVIEW'] == 'JPEG'
+    assert plan['config']['PHOTOMETRIC_OVERVIEW'] == 'YCBCR'
+
+
+def test_rgba_stays_lossless():
+    plan = overviewplanner.planOverviews(dataset(gdal.GDT_Byte, 4, RGB + [gdal.GCI_AlphaBand]), 256)
+    assert plan['resampling'] == 'AVERAGE'
+    assert plan['config']['COMPRESS_OVERVIEW'] == 'DEFLATE'
+    assert plan['config']['PREDICTOR_OVERVIEW'] == '2'
+
+
+@pytest.mark.parametrize('datatype,predictor', [
+    (gdal.GDT_Byte, '2'),
+    (gdal.GDT_UInt16, '2'),
+    (gdal.GDT_Int16, '2'),
+    (gdal.GDT_Float32, '3'),
+    (gdal.GDT_Float64, '3'),
+])
+def test_single_band_uses_deflate(datatype, predictor):
+    plan = overviewplanner.planOverviews(dataset(datatype), 256)
+    assert plan['resampling'] == 'AVERAGE'
+    assert plan['config']['COMPRESS_OVERVIEW'] == 'DEFLATE'
+    assert plan['config']['PREDICTOR_OVERVIEW'] == predictor
+
+
+def test_categorical_uses_nearest():
+    paletted = dataset(gdal.GDT_Byte)
+    table = gdal.ColorTable()
+    table.SetColorEntry(1, (255, 0, 0, 255))
+    paletted.GetRasterBand(1).SetColorTable(table)
+    assert overviewplanner.planOverviews(paletted, 256)['resampling'] == 'NEAREST'
+
+    classes = dataset(gdal.GDT_UInt16)
+    rat = gdal.RasterAttributeTable()
+    rat.CreateColumn('value', gdal.GFT_Integer, gdal.GFU_MinMax)
+    rat.SetRowCount(1)
+    rat.SetValueAsInt(0, 0, 1)
+    classes.GetRasterBand(1).SetDefaultRAT(rat)
+    assert overviewplanner.planOverviews(classes, 256)['resampling'] == 'NEAREST'
@@ -0,0 +1,74 @@
+import numpy
+
+from quantilesketch import KLLSketch
+
+FRACTIONS = numpy.linspace(0.01, 0.99, 99)
+
+
+def values(n=2000000, seed=1):
+    return numpy.random.default_rng(seed).lognormal(size=n)
+
+
+def sketchOf(data, blocks):
+    sketch = KLLSketch()
+    for block in numpy.array_split(data, blocks):
+        sketch.update(block)
+    return sketch
+
+
+def rankError(data, estimates):
+    """Largest distance between a fraction and the rank range of its estimate."""
+    ordered = numpy.sort(data)
+    low = numpy.searchsorted(ordered, estimates, side='left') / float(ordered.size)
+    high = numpy.searchsorted(ordered, estimates, side='right') / float(ordered.size)
+    return float(numpy.maximum(low - FRACTIONS, FRACTIONS - high).clip(0).max())
+
+
+def test_same_data_same_quantiles():
+    data = values()
+    runs = [sketchOf(data, 31).quantiles(FRACTIONS) for _ in range(3)]
+    assert numpy.array_equal(runs[0], runs[1])
+    assert numpy.array_equal(runs[0], runs[2])
+
+
+def test_merged_quantiles_are_repeatable():
+    data = values()
+
+    def merged():
+        parts = [KLLSketch() for _ in range(4)]
+        for i, block in enumerate(numpy.array_split(data, 64)):
+            parts[i % 4].update(block)
+        for part in parts[1:]:
+            parts[0].merge(part)
+        return parts[0].quantiles(FRACTIONS)
+
+    assert numpy.array_equal(merged(), merged())
+
+
+def test_rank_error_below_one_percent():
+    data = values()
+    for blocks in (1, 31, 500):
+        assert rankError(data, sketchOf(data, blocks).quantiles(FRACTIONS)) < 0.01
+
+
+def test_merged_rank_error_below_one_percent():
+    data = values()
+    parts = [KLLSketch() for _ in range(8)]
+    for i, block in enumerate(numpy.array_split(data, 248)):
+        parts[i % 8].update(block)
+    for part in parts[1:]:
+        parts[0].merge(part)
+    assert parts[0].count == data.size
+    assert rankError(data, parts[0].quantiles(FRACTIONS)) < 0.01
+
+
+def test_extremes_are_exact():
+    data = values(100000)
+    sketch = sketchOf(data, 7)
+    low, high = sketch.quantiles([0.0, 1.0])
+    assert low == data.min()
+    assert high == data.max()
+
+
+def test_empty_sketch():
+    assert numpy.isnan(KLLSketch().quantiles([0.5])).all()
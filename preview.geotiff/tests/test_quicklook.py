@@ -0,0 +1,100 @@
+import os
+
+import numpy
+import pytest
+
+pytest.importorskip('osgeo')
+
+import quicklook
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE = os.path.join(os.path.dirname(TESTS), 'rasterTemplate.xml')
+
+
+def style(entries):
+    """The style template with the ColorMapEntry lines that createStyle writes."""
+    with open(TEMPLATE) as f:
+        return f.read().replace('<<<colormap>>>', ''.join(entries))
+
+
+NODATA_FIRST = style([
+    '<ColorMapEntry color="#000000" quantity="-9999.0" label="nodata" opacity="0.0" />\n',
+    '<ColorMapEntry color="#000000" quantity="0.0" label="min" />\n',
+    '<ColorMapEntry color="#808080" quantity="5.0" />\n',
+    '<ColorMapEntry color="#FFFFFF" quantity="10.0" label="max" />\n',
+])
+
+
+def test_color_map_entries():
+    quantities, colors = quicklook.colorMap(NODATA_FIRST)
+    assert quantities.tolist() == [-9999.0, 0.0, 5.0, 10.0]
+    assert colors.tolist() == [[0, 0, 0, 0], [0, 0, 0, 255], [128, 128, 128, 255], [255, 255, 255, 255]]
+
+
+def test_apply_color_map_interpolates():
+    quantities, colors = quicklook.colorMap(NODATA_FIRST)
+    rgba = quicklook.applyColorMap(numpy.array([-9999.0, 0.0, 2.5, 5.0, 7.5, 10.0, 20.0]), quantities, colors)
+    assert rgba.dtype == numpy.uint8
+    assert rgba.tolist() == [[0, 0, 0, 0], [0, 0, 0, 255], [64, 64, 64, 255], [128, 128, 128, 255],
+                             [192, 192, 192, 255], [255, 255, 255, 255], [255, 255, 255, 255]]
+
+
+def test_apply_color_map_sorts_entries():
+    # createStyle puts a nodata value above the range after the ramp
+    quantities, colors = quicklook.colorMap(style([
+        '<ColorMapEntry color="#000000" quantity="0.0" label="min" />\n',
+        '<ColorMapEntry color="#FF0000" quantity="10.0" label="max" />\n',
+        '<ColorMapEntry color="#000000" quantity="255.0" label="nodata" opacity="0.0" />\n',
+    ]))
+    rgba = quicklook.applyColorMap(numpy.array([[5.0, 10.0, 255.0]]), quantities, colors)
+    assert rgba.shape == (1, 3, 4)
+    assert rgba[0].tolist() == [[128, 0, 0, 255], [255, 0, 0, 255], [0, 0, 0, 0]]
+
+
+def test_stretch_to_percentiles():
+    values = numpy.arange(101, dtype=numpy.float64)
+    valid = numpy.ones(values.shape, dtype=bool)
+    assert quicklook.stretchRange(values, valid) == (2.0, 98.0)
+    stretched = quicklook.stretch(values, valid)
+    assert stretched[:3].tolist() == [0, 0, 0]
+    assert stretched[50] == 128
+    assert stretched[-3:].tolist() == [255, 255, 255]
+
+
+def test_stretch_with_fixed_limits():
+    values = numpy.array([-5.0, 0.0, 5.0, 10.0, 15.0])
+    valid = numpy.ones(values.shape, dtype=bool)
+    assert quicklook.stretch(values, valid, (0.0, 10.0)).tolist() == [0, 0, 128, 255, 255]
+
+
+def test_stretch_ignores_invalid_values():
+    values = numpy.array([-9999.0] * 10 + [1.0, 2.0])
+    valid = values != -9999.0
+    low, high = quicklook.stretchRange(values, valid)
+    assert 1.0 <= low < high <= 2.0
+    assert quicklook.stretchRange(values, numpy.zeros(values.shape, dtype=bool)) is None
+    assert quicklook.stretch(values, numpy.zeros(values.shape, dtype=bool)).tolist() == [0] * 12
+
+
+def test_stretch_of_constant_values():
+    values = numpy.full(4, 3.0)
+    assert quicklook.stretchRange(values, numpy.ones(4, dtype=bool)) == (3.0, 4.0)
+
+
+def test_style_of_the_bundled_raster():
+    import geotiffutils
+    with geotiffutils.Utils(os.path.join(TESTS, 'inundation-500yr.tif'), TEMPLATE) as geo:
+        styleStr = geo.createStyle()
+    quantities, colors = quicklook.colorMap(styleStr)
+    # nodata (-9999) lies below the data, so its transparent entry comes first
+    assert quantities[0] == -9999.0
+    assert colors[0][3] == 0
+    assert (colors[1:, 3] == 255).all()
+    assert colors[1].tolist() == [0, 0, 0, 255]
+    assert colors[-1].tolist() == [255, 255, 255, 255]
+    rgba = quicklook.applyColorMap(numpy.array([-9999.0, quantities[1], quantities[-1]]), quantities, colors)
+    assert rgba.tolist() == [[0, 0, 0, 0], [0, 0, 0, 255], [255, 255, 255, 255]]
+    # halfway between the first two ramp entries, half way between their colors
+    middle = (quantities[1] + quantities[2]) / 2.0
+    rgba = quicklook.applyColorMap(numpy.array([middle]), quantities, colors)[0]
+    assert numpy.abs(rgba - (colors[1] + colors[2]) / 2.0).max() <= 0.5
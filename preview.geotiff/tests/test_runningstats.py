@@ -0,0 +1,151 @@
+import numpy
+import pytest
+
+import runningstats
+
+NODATA = -9999.0
+
+
+class Band:
+    """Just the geometry of a GDAL band, as used by splitRows."""
+
+    def __init__(self, ysize, block_y):
+        self.YSize = ysize
+        self.block_y = block_y
+
+    def GetBlockSize(self):
+        return [256, self.block_y]
+
+
+def randomBlocks(seed=0):
+    """Blocks of varied size and distribution, with a few windows that are all nodata."""
+    rng = numpy.random.default_rng(seed)
+    blocks = []
+    for i in range(40):
+        block = rng.normal(1000.0 * (i % 5), 1.0 + i, size=(rng.integers(1, 64), 97))
+        if i % 7 == 3:
+            block[...] = NODATA
+        else:
+            block[rng.random(block.shape) < 0.2] = NODATA
+        blocks.append(block)
+    return blocks
+
+
+def valid(block):
+    return block[block != NODATA]
+
+
+def assertMatches(stats, values, rel=1e-9):
+    result = stats.toDict()
+    assert result['count'] == values.size
+    assert result['min'] == values.min()
+    assert result['max'] == values.max()
+    assert result['average'] == pytest.approx(values.mean(), rel=1e-12)
+    assert result['st-dev'] == pytest.approx(values.std(), rel=rel)
+
+
+def test_streamed_matches_numpy():
+    blocks = randomBlocks()
+    stats = runningstats.RunningStats()
+    for block in blocks:
+        stats.update(valid(block))
+    assertMatches(stats, numpy.concatenate([valid(block) for block in blocks]))
+
+
+def test_merged_matches_numpy():
+    blocks = randomBlocks(1)
+    merged = runningstats.RunningStats()
+    for start in range(0, len(blocks), 6):
+        part = runningstats.RunningStats()
+        for block in blocks[start:start + 6]:
+            part.update(valid(block))
+        merged.merge(part)
+    assertMatches(merged, numpy.concatenate([valid(block) for block in blocks]))
+
+
+def test_large_offset_keeps_precision():
+    # a sum of squares would lose every digit of the variance here
+    values = 1e9 + numpy.random.default_rng(2).random(100000)
+    stats = runningstats.RunningStats()
+    for block in numpy.array_split(values, 13):
+        stats.update(block)
+    assertMatches(stats, values, rel=1e-6)
+
+
+def test_all_nodata():
+    stats = runningstats.RunningStats()
+    stats.update(valid(numpy.full((4, 4), NODATA)))
+    stats.merge(runningstats.RunningStats())
+    assert stats.toDict() == {'max': None, 'min': None, 'average': None, 'st-dev': None, 'count': 0}
+
+
+def test_merge_with_empty():
+    values = numpy.arange(10.0)
+    stats = runningstats.RunningStats()
+    stats.update(values)
+    stats.merge(runningstats.RunningStats())
+    assertMatches(stats, values)
+    empty = runningstats.RunningStats()
+    empty.merge(stats)
+    assertMatches(empty, values)
+
+
+def test_sketch_sees_every_value():
+    class Collect:
+        def __init__(self):
+            self.values = []
+
+        def update(self, values):
+            self.values.extend(values.tolist())
+
+        def merge(self, other):
+            self.values.extend(other.values)
+
+    first = runningstats.RunningStats(Collect())
+    second = runningstats.RunningStats(Collect())
+    first.update(numpy.arange(5.0))
+    second.update(numpy.arange(5.0, 8.0))
+    second.update(numpy.empty(0))
+    first.merge(second)
+    assert sorted(first.sketch.values) == list(range(8))
+
+
+@pytest.mark.parametrize('ysize,block_y,parts', [(416, 2, 4), (1000, 256, 8), (7, 16, 3), (100, 1, 100)])
+def test_split_rows(ysize, block_y, parts):
+    ranges = runningstats.splitRows(Band(ysize, block_y), parts)
+    assert 1 <= len(ranges) <= parts
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == ysize
+    for (start, end), (next_start, _) in zip(ranges, ranges[1:]):
+        assert start < end == next_start
+        assert end % block_y == 0
+
+
+def test_split_rows_merge_matches_numpy():
+    data = numpy.random.default_rng(3).normal(size=(416, 50))
+    data[100:140] = NODATA
+    merged = runningstats.RunningStats()
+    for start, end in runningstats.splitRows(Band(416, 16), 5):
+        part = runningstats.RunningStats()
+        part.update(valid(data[start:end]))
+        merged.merge(part)
+    assertMatches(merged, valid(data))
+
+
+def test_merge_order_does_not_matter():
+    data = numpy.random.default_rng(4).normal(50.0, 3.0, size=(300, 40))
+    parts = []
+    for start, end in runningstats.splitRows(Band(300, 8), 7):
+        part = runningstats.RunningStats()
+        part.update(data[start:end].ravel())
+        parts.append(part)
+    forward = runningstats.RunningStats()
+    backward = runningstats.RunningStats()
+    for part in parts:
+        forward.merge(part)
+    for part in reversed(parts):
+        backward.merge(part)
+    assert forward.count == backward.count == data.size
+    assert forward.mean == pytest.approx(backward.mean, rel=1e-12)
+    assert forward.m2 == pytest.approx(backward.m2, rel=1e-12)
+    assert (forward.min, forward.max) == (backward.min, backward.max)
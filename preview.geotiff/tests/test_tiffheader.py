@@ -0,0 +1,176 @@
+import os
+import struct
+
+import pytest
+
+import tiffheader
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+INUNDATION = os.path.join(TESTS, 'inundation-500yr.tif')
+
+# field type -> struct code of one value
+CODES = {2: 's', 3: 'H', 4: 'I', 12: 'd', 16: 'Q'}
+
+
+def writeTiff(path, entries, order='<', bigtiff=False):
+    """A TIFF with a single IFD holding entries, as (tag, field type, values); no pixel data."""
+    entry_format = order + ('HHQ' if bigtiff else 'HHI')
+    value_size = 8 if bigtiff else 4
+    offset_format = order + ('Q' if bigtiff else 'I')
+    if bigtiff:
+        head = (b'II' if order == '<' else b'MM') + struct.pack(order + 'HHHQ', 43, 8, 0, 16)
+        ifd = struct.pack(order + 'Q', len(entries))
+    else:
+        head = (b'II' if order == '<' else b'MM') + struct.pack(order + 'HI', 42, 8)
+        ifd = struct.pack(order + 'H', len(entries))
+    data_offset = len(head) + len(ifd) + len(entries) * (struct.calcsize(entry_format) + value_size) + value_size
+    data = b''
+    for tag, field_type, values in sorted(entries):
+        if field_type == 2:
+            payload = values.encode('latin-1') + b'\0'
+            count = len(payload)
+        else:
+            payload = struct.pack(order + CODES[field_type] * len(values), *values)
+            count = len(values)
+        ifd += struct.pack(entry_format, tag, field_type, count)
+        if len(payload) <= value_size:
+            ifd += payload.ljust(value_size, b'\0')
+        else:
+            ifd += struct.pack(offset_format, data_offset + len(data))
+            data += payload
+    ifd += struct.pack(offset_format, 0)
+    with open(path, 'wb') as f:
+        f.write(head + ifd + data)
+    return path
+
+
+def geographicEntries(raster_type=1):
+    geokeys = [1, 1, 0, 4,
+               tiffheader.GT_MODEL_TYPE, 0, 1, tiffheader.MODEL_TYPE_GEOGRAPHIC,
+               tiffheader.GT_RASTER_TYPE, 0, 1, raster_type,
+               tiffheader.GEOGRAPHIC_TYPE, 0, 1, 4326,
+               tiffheader.GEOG_CITATION, tiffheader.GEO_ASCII_PARAMS, 7, 0]
+    return [
+        (tiffheader.IMAGE_WIDTH, 4, [360]),
+        (tiffheader.IMAGE_LENGTH, 4, [180]),
+        (tiffheader.BITS_PER_SAMPLE, 3, [16]),
+        (tiffheader.SAMPLES_PER_PIXEL, 3, [1]),
+        (tiffheader.SAMPLE_FORMAT, 3, [2]),
+        (tiffheader.TILE_WIDTH, 3, [256]),
+        (tiffheader.TILE_LENGTH, 3, [256]),
+        (tiffheader.MODEL_PIXEL_SCALE, 12, [1.0, 1.0, 0.0]),
+        (tiffheader.MODEL_TIEPOINT, 12, [0.0, 0.0, 0.0, -180.0, 90.0, 0.0]),
+        (tiffheader.GEO_KEY_DIRECTORY, 3, geokeys),
+        (tiffheader.GEO_ASCII_PARAMS, 2, 'WGS 84|'),
+        (tiffheader.GDAL_NODATA, 2, '-32768'),
+    ]
+
+
+def test_bundled_geotiff():
+    header = tiffheader.GeoTiffHeader(INUNDATION)
+    assert not header.bigtiff
+    assert (header.width, header.height, header.bands) == (390, 416, 1)
+    assert tiffheader.GDAL_DATATYPE_NAMES[header.datatype] == 'Float64'
+    assert header.nodata == -9999.0
+    assert header.epsg == 32610
+    assert header.citation == 'WGS 84 / UTM zone 10N'
+    assert header.geotransform == (421364.63, 24.0, 0.0, 5099434.5, 0.0, -24.0)
+    assert header.boundingBox == [421364.63, 5089450.5, 430724.63, 5099434.5]
+    # a few small reads, whatever the size of the file
+    assert header.reads < 16
+
+
+@pytest.mark.parametrize('order', ['<', '>'])
+@pytest.mark.parametrize('bigtiff', [False, True])
+def test_byte_order_and_bigtiff(tmp_path, order, bigtiff):
+    header = tiffheader.GeoTiffHeader(writeTiff(str(tmp_path / 'geo.tif'), geographicEntries(), order, bigtiff))
+    assert header.bigtiff == bigtiff
+    assert header.order == order
+    assert (header.width, header.height, header.bands) == (360, 180, 1)
+    assert tiffheader.GDAL_DATATYPE_NAMES[header.datatype] == 'Int16'
+    assert header.blockSize == [256, 256]
+    assert header.nodata == -32768.0
+    assert header.epsg == 4326
+    assert header.citation == 'WGS 84'
+    assert header.geotransform == (-180.0, 1.0, 0.0, 90.0, 0.0, -1.0)
+    assert header.boundingBox == [-180.0, -90.0, 180.0, 90.0]
+
+
+def test_pixel_is_point_shifts_half_a_pixel(tmp_path):
+    entries = geographicEntries(raster_type=tiffheader.RASTER_PIXEL_IS_POINT)
+    header = tiffheader.GeoTiffHeader(writeTiff(str(tmp_path / 'point.tif'), entries))
+    assert header.geotransform == (-180.5, 1.0, 0.0, 90.5, 0.0, -1.0)
+
+
+def test_model_transformation(tmp_path):
+    entries = [entry for entry in geographicEntries()
+               if entry[0] not in (tiffheader.MODEL_PIXEL_SCALE, tiffheader.MODEL_TIEPOINT)]
+    matrix = [2.0, 0.5, 0.0, 100.0,
+              0.25, -2.0, 0.0, 200.0,
+              0.0, 0.0, 0.0, 0.0,
+              0.0, 0.0, 0.0, 1.0]
+    entries.append((tiffheader.MODEL_TRANSFORMATION, 12, matrix))
+    header = tiffheader.GeoTiffHeader(writeTiff(str(tmp_path / 'rotated.tif'), entries))
+    assert header.geotransform == (100.0, 2.0, 0.5, 200.0, 0.25, -2.0)
+
+
+def test_model_transformation_pixel_is_point(tmp_path):
+    entries = [entry for entry in geographicEntries(raster_type=tiffheader.RASTER_PIXEL_IS_POINT)
+               if entry[0] not in (tiffheader.MODEL_PIXEL_SCALE, tiffheader.MODEL_TIEPOINT)]
+    matrix = [2.0, 0.5, 0.0, 100.0,
+              0.25, -2.0, 0.0, 200.0,
+              0.0, 0.0, 0.0, 0.0,
+              0.0, 0.0, 0.0, 1.0]
+    entries.append((tiffheader.MODEL_TRANSFORMATION, 12, matrix))
+    header = tiffheader.GeoTiffHeader(writeTiff(str(tmp_path / 'point.tif'), entries))
+    assert header.geotransform == (98.75, 2.0, 0.5, 200.875, 0.25, -2.0)
+
+
+def test_pixel_is_point_agrees_between_tiepoint_and_transformation(tmp_path):
+    tiepoint = tiffheader.GeoTiffHeader(writeTiff(
+        str(tmp_path / 'tiepoint.tif'), geographicEntries(raster_type=tiffheader.RASTER_PIXEL_IS_POINT)))
+    entries = [entry for entry in geographicEntries(raster_type=tiffheader.RASTER_PIXEL_IS_POINT)
+               if entry[0] not in (tiffheader.MODEL_PIXEL_SCALE, tiffheader.MODEL_TIEPOINT)]
+    entries.append((tiffheader.MODEL_TRANSFORMATION, 12, [1.0, 0.0, 0.0, -180.0,
+                                                          0.0, -1.0, 0.0, 90.0,
+                                                          0.0, 0.0, 0.0, 0.0,
+                                                          0.0, 0.0, 0.0, 1.0]))
+    matrix = tiffheader.GeoTiffHeader(writeTiff(str(tmp_path / 'matrix.tif'), entries))
+    assert tiepoint.geotransform == matrix.geotransform
+    assert tiepoint.boundingBox == matrix.boundingBox
+
+
+def test_user_defined_crs_has_no_epsg(tmp_path):
+    entries = geographicEntries()
+    geokeys = list(entries[9][2])
+    geokeys[15] = tiffheader.USER_DEFINED
+    entries[9] = (tiffheader.GEO_KEY_DIRECTORY, 3, geokeys)
+    header = tiffheader.GeoTiffHeader(writeTiff(str(tmp_path / 'user.tif'), entries))
+    assert header.epsg is None
+
+
+def test_truncated_header(tmp_path):
+    with open(INUNDATION, 'rb') as f:
+        head = f.read(10)
+    path = str(tmp_path / 'truncated.tif')
+    with open(path, 'wb') as f:
+        f.write(head)
+    with pytest.raises(ValueError):
+        tiffheader.GeoTiffHeader(path)
+    assert tiffheader.readHeader(path) is None
+
+
+def test_truncated_tag_values(tmp_path):
+    path = writeTiff(str(tmp_path / 'geo.tif'), geographicEntries(), '>', True)
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:-8])
+    assert tiffheader.readHeader(path) is None
+
+
+def test_not_a_tiff(tmp_path):
+    path = str(tmp_path / 'not.tif')
+    with open(path, 'wb') as f:
+        f.write(b'GIF89a' + b'\0' * 32)
+    assert tiffheader.readHeader(path) is None
@@ -0,0 +1,81 @@
+import pytest
+
+pytest.importorskip('osgeo')
+
+import tilepyramid
+
+WORLD = tilepyramid.ORIGIN_SHIFT
+
+
+def test_zoom_zero_is_one_tile():
+    assert tilepyramid.tileBounds(0, 0, 0) == (-WORLD, -WORLD, WORLD, WORLD)
+    assert tilepyramid.tileRange((-1000.0, -1000.0, 1000.0, 1000.0), 0) == [(0, 0, 0)]
+    assert tilepyramid.tileRange((-WORLD, -WORLD, WORLD, WORLD), 0) == [(0, 0, 0)]
+
+
+def test_tile_bounds_top_left_origin():
+    minx, miny, maxx, maxy = tilepyramid.tileBounds(2, 1, 0)
+    assert (minx, maxx) == (-WORLD / 2, 0.0)
+    assert (miny, maxy) == (WORLD / 2, WORLD)
+    assert tilepyramid.tileBounds(2, 3, 3)[:2] == pytest.approx((WORLD / 2, -WORLD))
+
+
+def test_box_inside_one_tile():
+    box = (1000.0, 1000.0, 2000.0, 2000.0)
+    assert tilepyramid.tileRange(box, 1) == [(1, 1, 0)]
+    assert tilepyramid.tileRange(box, 4) == [(4, 8, 7)]
+
+
+def test_box_across_the_antimeridian_wraps():
+    # extents of rasters crossing 180 degrees end past the world edge
+    box = (WORLD - 1000.0, -1000.0, WORLD + 1000.0, 1000.0)
+    assert tilepyramid.tileRange(box, 1) == [(1, 0, 0), (1, 0, 1), (1, 1, 0), (1, 1, 1)]
+    assert [x for _, x, _ in tilepyramid.tileRange(box, 3)] == [0, 0, 7, 7]
+
+
+def test_box_wider_than_the_world_has_every_column_once():
+    box = (-WORLD, -1000.0, 3 * WORLD, 1000.0)
+    assert sorted(set(x for _, x, _ in tilepyramid.tileRange(box, 2))) == [0, 1, 2, 3]
+    assert len(tilepyramid.tileRange(box, 2)) == 8
+
+
+def test_rows_are_clamped_at_the_poles():
+    box = (-1000.0, -2 * WORLD, 1000.0, 2 * WORLD)
+    tiles = tilepyramid.tileRange(box, 2)
+    assert sorted(set(y for _, _, y in tiles)) == [0, 1, 2, 3]
+    assert sorted(set(x for _, x, _ in tiles)) == [1, 2]
+    top = (-1000.0, WORLD - 1.0, 1000.0, 2 * WORLD)
+    assert tilepyramid.tileRange(top, 3) == [(3, 3, 0), (3, 4, 0)]
+
+
+def test_tiles_cover_the_box():
+    box = (-5000000.0, 2000000.0, 3000000.0, 6000000.0)
+    for z in range(6):
+        tiles = tilepyramid.tileRange(box, z)
+        assert min(tilepyramid.tileBounds(*tile)[0] for tile in tiles) <= box[0]
+        assert min(tilepyramid.tileBounds(*tile)[1] for tile in tiles) <= box[1]
+        assert max(tilepyramid.tileBounds(*tile)[2] for tile in tiles) >= box[2]
+        assert max(tilepyramid.tileBounds(*tile)[3] for tile in tiles) >= box[3]
+
+
+@pytest.mark.parametrize('xsize,zoom', [(256, 0), (257, 1), (512, 1), (513, 2), (100, 0), (1 << 20, 12)])
+def test_native_zoom(xsize, zoom):
+    assert tilepyramid.nativeZoom((-WORLD, -WORLD, WORLD, WORLD), xsize) == zoom
+
+
+def test_native_zoom_of_empty_box():
+    assert tilepyramid.nativeZoom((5.0, 5.0, 5.0, 5.0), 100) == 0
+
+
+def test_rows_are_stored_bottom_up(tmp_path):
+    plan = {'bounds': [-10.0, -5.0, 10.0, 5.0], 'minzoom': 0, 'maxzoom': 2}
+    db = tilepyramid.openMBTiles(str(tmp_path / 'tiles.mbtiles'), plan, 'layer')
+    try:
+        tilepyramid.insertTiles(db, [(0, 0, 0, b'a'), (2, 1, 0, b'b'), (2, 3, 3, b'c')])
+        rows = db.execute('SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles ORDER BY tile_data').fetchall()
+        assert rows == [(0, 0, 0, b'a'), (2, 1, 3, b'b'), (2, 3, 0, b'c')]
+        metadata = dict(db.execute('SELECT name, value FROM metadata'))
+        assert metadata['bounds'] == '-10.0,-5.0,10.0,5.0'
+        assert (metadata['minzoom'], metadata['maxzoom']) == ('0', '2')
+    finally:
+        db.close()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+import math
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+from osgeo import gdal
+
+import extentengine
+import quicklook
+
+DEFAULT_MAX_ZOOM = 8
+DEFAULT_BATCH = 32
+
+TILE_SIZE = 256
+
+# half the width of the web mercator world, in meters
+ORIGIN_SHIFT = math.pi * extentengine.EARTH_RADIUS
+
+
+def pyramidEnabled():
+    return os.getenv('TILE_PYRAMID_ENABLED', 'false').lower() == 'true'
+
+
+def maxZoom():
+    return int(os.getenv('TILE_MAX_ZOOM', DEFAULT_MAX_ZOOM))
+
+
+def tileWorkers():
+    return int(os.getenv('TILE_WORKERS', os.cpu_count() or 1))
+
+
+def tileBounds(z, x, y):
+    """EPSG:3857 bounds (minx, miny, maxx, maxy) of XYZ tile z/x/y."""
+    size = 2.0 * ORIGIN_SHIFT / (1 << z)
+    minx = -ORIGIN_SHIFT + x * size
+    maxy = ORIGIN_SHIFT - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def tileRange(box, z):
+    """XYZ tiles at zoom z covering an EPSG:3857 box; x wraps at the antimeridian."""
+    size = 2.0 * ORIGIN_SHIFT / (1 << z)
+    last = (1 << z) - 1
+    x0 = int(math.floor((box[0] + ORIGIN_SHIFT) / size))
+    x1 = int(math.floor((box[2] + ORIGIN_SHIFT) / size))
+    y0 = min(last, max(0, int(math.floor((ORIGIN_SHIFT - box[3]) / size))))
+    y1 = min(last, max(0, int(math.floor((ORIGIN_SHIFT - box[1]) / size))))
+    columns = sorted(set(x % (1 << z) for x in range(x0, min(x1, x0 + last) + 1)))
+    return [(z, x, y) for x in columns for y in range(y0, y1 + 1)]
+
+
+def nativeZoom(box, xsize):
+    """Zoom level at which a tile pixel is about the size of a raster pixel."""
+    resolution = (box[2] - box[0]) / float(xsize)
+    if resolution <= 0:
+        return 0
+    return max(0, int(math.ceil(math.log(2.0 * ORIGIN_SHIFT / (TILE_SIZE * resolution), 2))))
+
+
+def planTiles(source, max_zoom=None):
+    """Tiles from zoom 0 to max_zoom (or the native zoom if lower), the lon/lat bounds and the stretch."""
+    if max_zoom is None:
+        max_zoom = maxZoom()
+    ds = gdal.Open(source)
+    if ds is None:
+        raise ValueError("could not open raster %s" % source)
+    extent = extentengine.rasterExtent(ds.GetProjectionRef(), ds.GetGeoTransform(), ds.RasterXSize, ds.RasterYSize)
+    if extent is None:
+        raise ValueError("could not reproject the extent of %s" % source)
+    box = extent['3857']
+    top = min(max_zoom, nativeZoom(box, ds.RasterXSize))
+    tiles = []
+    for z in range(top + 1):
+        tiles.extend(tileRange(box, z))
+    # one stretch for the whole raster, or the tiles would not match
+    limits = quicklook.stretchLimits(ds)
+    return {'tiles': tiles, 'bounds': extent['4326'], 'minzoom': 0, 'maxzoom': top, 'limits': limits}
+
+
+def _pngBytes(rgba):
+    path = '/vsimem/tile-%d.png' % os.getpid()
+    quicklook.writePng(rgba, path)
+    f = gdal.VSIFOpenL(path, 'rb')
+    try:
+        gdal.VSIFSeekL(f, 0, 2)
+        size = gdal.VSIFTellL(f)
+        gdal.VSIFSeekL(f, 0, 0)
+        data = gdal.VSIFReadL(1, size, f)
+    finally:
+        gdal.VSIFCloseL(f)
+        gdal.Unlink(path)
+    return data
+
+
+def renderTiles(source, styleStr, tiles, limits=None):
+    """Analysis job: PNG bytes of each (z, x, y) in tiles, empty tiles left out.
+
+    Each tile is warped to web mercator with an alpha band; GDAL reads the
+    overview matching the zoom level. It is colored like the quicklook,
+    stretched with the limits of the whole raster (see planTiles).
+    """
+    src = gdal.Open(source)
+    nearest = src.GetRasterBand(1).GetColorTable() is not None
+    rendered = []
+    for z, x, y in tiles:
+        minx, miny, maxx, maxy = tileBounds(z, x, y)
+        ds = gdal.Warp('', src, format='MEM', dstSRS='EPSG:3857', outputBounds=(minx, miny, maxx, maxy),
+                       width=TILE_SIZE, height=TILE_SIZE, dstAlpha=True,
+                       resampleAlg='near' if nearest else 'bilinear')
+        alpha = ds.GetRasterBand(ds.RasterCount).ReadAsArray()
+        if not alpha.any():
+            continue
+        rgba = quicklook.render(ds, styleStr, TILE_SIZE, TILE_SIZE, limits)
+        rgba[..., 3] = numpy.minimum(rgba[..., 3], alpha)
+        if rgba[..., 3].any():
+            rendered.append((z, x, y, _pngBytes(rgba)))
+        ds = None
+    src = None
+    return rendered
+
+
+def openMBTiles(destination, plan, name):
+    """A new MBTiles database with the metadata of plan and an empty tiles table."""
+    db = sqlite3.connect(destination)
+    with db:
+        db.execute('CREATE TABLE metadata (name TEXT, value TEXT)')
+        db.execute('CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)')
+        db.execute('CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)')
+        metadata = {'name': name, 'format': 'png', 'type': 'overlay', 'version': '1.1',
+                    'bounds': ','.join(map(str, plan['bounds'])),
+                    'minzoom': str(plan['minzoom']), 'maxzoom': str(plan['maxzoom'])}
+        db.executemany('INSERT INTO metadata VALUES (?, ?)', metadata.items())
+    return db
+
+
+def insertTiles(db, tiles):
+    with db:
+        # mbtiles rows count from the bottom (TMS)
+        db.executemany('INSERT INTO tiles VALUES (?, ?, ?, ?)',
+                       [(z, x, (1 << z) - 1 - y, sqlite3.Binary(data)) for z, x, y, data in tiles])
+
+
+def buildPyramid(pool, source, destination, styleStr, name, max_zoom=None, workers=None, batch=DEFAULT_BATCH):
+    """Render the tile pyramid of source into the MBTiles file destination.
+
+    Planning and rendering run in pool (an analysispool.AnalysisPool);
+    batches of tiles are handed to its workers from several threads, so
+    they render in parallel. Returns the plan with the tile count, the
+    file size and the time taken.
+    """
+    if workers is None:
+        workers = tileWorkers()
+    start = time.perf_counter()
+    plan = pool.run(planTiles, source, max_zoom)
+    batches = [plan['tiles'][i:i + batch] for i in range(0, len(plan['tiles']), batch)]
+    count = 0
+    # each batch is written as it arrives, so only the batches in flight
+    # are held in memory
+    db = openMBTiles(destination, plan, name)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for rendered in executor.map(lambda tiles: pool.run(renderTiles, source, styleStr, tiles, plan['limits']), batches):
+                insertTiles(db, rendered)
+                count += len(rendered)
+    finally:
+        db.close()
+    report = {'maxzoom': plan['maxzoom'], 'planned': len(plan['tiles']), 'tiles': count,
+              'bytes': os.path.getsize(destination), 'seconds': time.perf_counter() - start}
+    return report
+
+
+if __name__ == "__main__":
+    # usage: python tilepyramid.py raster.tif output.mbtiles [max_zoom]
+    import analysispool
+    gdal.UseExceptions()
+    workers = tileWorkers()
+    pool = analysispool.AnalysisPool(workers=workers)
+    try:
+        print(buildPyramid(pool, sys.argv[1], sys.argv[2], None, os.path.basename(sys.argv[1]),
+                           int(sys.argv[3]) if len(sys.argv) > 3 else None, workers))
+    finally:
+        pool.close()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+import math
+import sys
+import time
+
+import numpy
+
+import crstransform
+
+# points per edge of the outline that is reprojected
+DEFAULT_SAMPLES = 21
+
+# latitude where web mercator is cut off, a square world
+MERCATOR_MAX_LATITUDE = 85.0511287798066
+
+EARTH_RADIUS = 6378137.0
+
+
+def _edges(x0, y0, x1, y1, samples):
+    """samples points along each edge of the box (x0, y0) - (x1, y1), corners included."""
+    t = numpy.linspace(0.0, 1.0, samples)
+    xs = x0 + (x1 - x0) * t
+    ys = y0 + (y1 - y0) * t
+    top = numpy.column_stack((xs, numpy.full(samples, y0)))
+    right = numpy.column_stack((numpy.full(samples, x1), ys))
+    bottom = numpy.column_stack((xs[::-1], numpy.full(samples, y1)))
+    left = numpy.column_stack((numpy.full(samples, x0), ys[::-1]))
+    return numpy.concatenate((top, right, bottom, left))
+
+
+def _applyGeotransform(gt, pixels):
+    x = gt[0] + pixels[:, 0] * gt[1] + pixels[:, 1] * gt[2]
+    y = gt[3] + pixels[:, 0] * gt[4] + pixels[:, 1] * gt[5]
+    return numpy.column_stack((x, y))
+
+
+def _longitudeRange(lon):
+    """Smallest longitude interval holding all of lon, as (min, max) with max up to 540.
+
+    An outline crossing the antimeridian leaves a gap of more than half the
+    world between its eastern and western points; the interval then starts
+    after that gap and ends past 180.
+    """
+    lon = numpy.where(lon > 180.0, lon - 360.0, lon)
+    lon = numpy.sort(numpy.where(lon < -180.0, lon + 360.0, lon))
+    if len(lon) < 2:
+        return lon[0], lon[0]
+    gaps = numpy.diff(lon)
+    i = int(numpy.argmax(gaps))
+    if gaps[i] > 180.0:
+        return lon[i + 1], lon[i] + 360.0
+    return lon[0], lon[-1]
+
+
+def _extent(crs, outline, inside):
+    to_lonlat = crstransform.getTransformer(crs, crstransform.WGS84)
+    lonlat = to_lonlat.transform_points(outline)
+    lonlat = lonlat[numpy.isfinite(lonlat).all(axis=1)]
+    if len(lonlat) == 0:
+        return None
+    minx, maxx = _longitudeRange(lonlat[:, 0])
+    miny = max(-90.0, float(lonlat[:, 1].min()))
+    maxy = min(90.0, float(lonlat[:, 1].max()))
+
+    # a pole inside the outline is not on any edge
+    from_lonlat = crstransform.getTransformer(crstransform.WGS84, crs)
+    poles = from_lonlat.transform_points([[0.0, 90.0], [0.0, -90.0]])
+    with numpy.errstate(invalid='ignore'):
+        pole = inside(poles) & numpy.isfinite(poles).all(axis=1)
+    if pole.any():
+        minx, maxx = -180.0, 180.0
+    if pole[0]:
+        maxy = 90.0
+    if pole[1]:
+        miny = -90.0
+
+    geographic = [float(minx), miny, float(maxx), maxy]
+    return {'4326': geographic, '3857': mercatorBox(geographic)}
+
+
+def mercatorBox(box):
+    """EPSG:3857 box of a lon/lat box, latitudes clamped to the mercator limit.
+
+    Longitudes are not wrapped: the box of an extent crossing the
+    antimeridian (maximum longitude above 180) ends east of the world edge
+    at 20037508 m, which tile ranges rely on. Consumers that need a box
+    inside the world, such as CSW records, use geographicBox.
+    """
+    minx, miny, maxx, maxy = box
+    miny = max(miny, -MERCATOR_MAX_LATITUDE)
+    maxy = min(maxy, MERCATOR_MAX_LATITUDE)
+
+    def y(lat):
+        return EARTH_RADIUS * math.log(math.tan(math.pi / 4.0 + math.radians(lat) / 2.0))
+
+    return [EARTH_RADIUS * math.radians(minx), y(miny), EARTH_RADIUS * math.radians(maxx), y(maxy)]
+
+
+def geographicBox(box):
+    """Lon/lat box of an EPSG:3857 box; the inverse of mercatorBox."""
+    minx, miny, maxx, maxy = box
+
+    def lat(y):
+        return math.degrees(2.0 * math.atan(math.exp(y / EARTH_RADIUS)) - math.pi / 2.0)
+
+    return [math.degrees(minx / EARTH_RADIUS), lat(miny), math.degrees(maxx / EARTH_RADIUS), lat(maxy)]
+
+
+def rasterExtent(crs, geotransform, xsize, ysize, samples=DEFAULT_SAMPLES):
+    """Bounding boxes in EPSG:4326 and EPSG:3857 of a raster, or None.
+
+    crs is anything crstransform accepts. The outline is sampled in pixel
+    space, so rotated and sheared geotransforms are handled, and all
+    samples are reprojected in one call. Returns
+    {'4326': [minx, miny, maxx, maxy], '3857': [...]}; a raster crossing
+    the antimeridian has a maximum longitude above 180.
+    """
+    outline = _applyGeotransform(geotransform, _edges(0.0, 0.0, float(xsize), float(ysize), samples))
+    gt = geotransform
+    inverse = numpy.linalg.inv(numpy.array([[gt[1], gt[2]], [gt[4], gt[5]]]))
+
+    def inside(points):
+        pixels = (points - numpy.array([gt[0], gt[3]])).dot(inverse.T)
+        return (pixels[:, 0] >= 0) & (pixels[:, 0] <= xsize) & (pixels[:, 1] >= 0) & (pixels[:, 1] <= ysize)
+
+    return _extent(crs, outline, inside)
+
+
+def boxExtent(crs, minx, miny, maxx, maxy, samples=DEFAULT_SAMPLES):
+    """Like rasterExtent for an axis aligned box in crs, such as an OGR layer extent."""
+    outline = _edges(minx, miny, maxx, maxy, samples)
+
+    def inside(points):
+        return (points[:, 0] >= minx) & (points[:, 0] <= maxx) & (points[:, 1] >= miny) & (points[:, 1] <= maxy)
+
+    return _extent(crs, outline, inside)
+
+
+if __name__ == "__main__":
+    # usage: python extentengine.py [epsg minx miny maxx maxy]
+    # UTM, a rotated grid, a raster across the antimeridian, a polar grid
+    # and the whole world, with the time per extent
+    cases = [
+        (32610, (421364.63, 24.0, 0.0, 5099434.5, 0.0, -24.0), 390, 416),
+        (32610, (421364.63, 20.0, 10.0, 5099434.5, 10.0, -20.0), 390, 416),
+        (4326, (170.0, 0.1, 0.0, 10.0, 0.0, -0.1), 200, 100),
+        (3413, (-3000000.0, 5000.0, 0.0, 3000000.0, 0.0, -5000.0), 1200, 1200),
+        (4326, (-180.0, 1.0, 0.0, 90.0, 0.0, -1.0), 360, 180),
+    ]
+    repeat = 1000
+    for crs, gt, xsize, ysize in cases:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            extent = rasterExtent(crs, gt, xsize, ysize)
+        seconds = (time.perf_counter() - start) / repeat
+        print('EPSG:%d %s: %s (%.1f us)' % (crs, gt, extent, seconds * 1e6))
+    if len(sys.argv) > 1:
+        print(boxExtent(int(sys.argv[1]), *map(float, sys.argv[2:6])))
@@ -1,20 +1,27 @@
 #!/usr/bin/python
-import json
 import logging
-import urllib
 
-from osgeo import osr, gdal
+from osgeo import gdal
+
+import epsgresolver
+import extentengine
 
 
 class Utils:
 
-    def __init__(self, geotifffile, rasterStyleTemplate):
+    def __init__(self, geotifffile, rasterStyleTemplate, cached=None):
         self.geotiff = geotifffile
         self.rasterStyleTemplate = rasterStyleTemplate
         self.epsg = 'UNKNOWN'
         self.extent = 'UNKNOWN'
-        self.isGeotiff = self.checkGeotiff()
         self.logger = logging.getLogger('geotiff')
+        if cached is not None:
+            # probe results of a file with the same contents, see resultcache
+            self.isGeotiff = cached['isGeotiff']
+            self.epsg = cached['epsg']
+            self.extent = cached['extent']
+            return
+        self.isGeotiff = self.checkGeotiff()
         
         if self.isGeotiff:
             tmpEpsg = self.findProjection()
@@ -42,6 +49,9 @@ class Utils:
     def getExtent(self):
         return self.extent
 
+    def cacheEntry(self):
+        return {'isGeotiff': self.isGeotiff, 'epsg': self.epsg, 'extent': self.extent}
+
 
     def checkGeotiff(self):
         isGeo = True
@@ -59,35 +69,18 @@ class Utils:
             self.logger.debug('findProjection: it is not a geotiff')
             return 'None'
         prj_txt=''
-        prj_code=''
         try:
             ds = gdal.Open(self.geotiff)
             prj_txt = ds.GetProjectionRef()
-            srs = osr.SpatialReference()
-            srs.ImportFromWkt(prj_txt)
-            srs.AutoIdentifyEPSG()
-            prj_code=srs.GetAuthorityCode(None)
         except:
-            prj_code='None'
+            prj_txt=''
 
         # close geotiff file
         ds = None
 
-        if str(prj_code).strip() != 'None':
-            return prj_code
-
-        query = urllib.urlencode({'exact':True,'error':True,'mode':'wkt','terms':prj_txt})
-
-        try:
-            webres = urllib.urlopen('http://prj2epsg.org/search.json', query.encode())
-            jres = json.loads(webres.read().decode())
-            if len(jres['codes']) > 0:
-                self.logger.debug(jres['codes'][0]['code'])
-            else:
-                self.logger.debug('None')
-        except:
-            self.logger.debug('None')
-        
+        prj_code = epsgresolver.resolveEpsg(prj_txt)
+        if prj_code is None:
+            return 'None'
         return prj_code
 
     def findExtent(self):
@@ -98,33 +91,13 @@ class Utils:
             self.logger.debug('findExtent: unknown projection; could not calculate extent')
             return 'None'
 
-        GOOGLE = 3857
         ds = gdal.Open(self.geotiff)
-
-        dsGtrn = ds.GetGeoTransform()
-        osrs = osr.SpatialReference()
-        osrs.ImportFromWkt(ds.GetProjectionRef())
-        dsrs = osr.SpatialReference()
-        dsrs.ImportFromEPSG(GOOGLE)
-        ct = osr.CoordinateTransformation(osrs, dsrs)
-        ll = ct.TransformPoint(dsGtrn[0], dsGtrn[3])
-        ur = ct.TransformPoint(dsGtrn[0] + dsGtrn[1] * ds.RasterXSize + dsGtrn[2] * ds.RasterYSize,  dsGtrn[3] + dsGtrn[4] * ds.RasterXSize + dsGtrn[5] *ds.RasterYSize)
-        r = [0. for x in range(4)]
-        if ll[0] < ur[0]:
-            r[0] = ll[0]
-            r[2] = ur[0]
-        else: 
-            r[0] = ur[0]
-            r[2] = ll[0]
-        if ll[1] < ur[1]:
-            r[1] = ll[1]
-            r[3] = ur[1]
-        else: 
-            r[1] = ur[1]
-            r[3] = ll[1]
-
+        extent = extentengine.rasterExtent(ds.GetProjectionRef(), ds.GetGeoTransform(), ds.RasterXSize, ds.RasterYSize)
         ds = None
-        return ','.join(map(str, r))
+        if extent is None:
+            self.logger.debug('findExtent: the outline could not be reprojected')
+            return 'None'
+        return ','.join(map(str, extent['3857']))
 
     def createStyle(self):
         if not self.isGeotiff:
@@ -176,6 +149,11 @@ class Utils:
         return style
             
 
+def probeGeotiff(geotifffile, rasterStyleTemplate):
+    """Analysis job (see analysispool): projection and extent as Utils.cacheEntry."""
+    return Utils(geotifffile, rasterStyleTemplate).cacheEntry()
+
+
 if __name__ == "__main__":
     source = "jong.tif"
     geo = Utils(source)
@@ -17,9 +17,14 @@ import pyclowder.files
 
 from osgeo import gdal
 
+import analysispool
 import zipshputils as zs
 import geotiffutils as gu
 import pycswutils as pu
+import resultcache
+
+# bump when the cached shapefile or GeoTIFF probe changes shape
+CACHE_VERSION = 1
 
 # to post layer to pycsw
 import os, sys, inspect
@@ -35,6 +40,9 @@ class PycswExtractor(Extractor):
         # parse command line and load default logging configuration
         self.setup()
 
+        # GDAL/OGR runs in worker processes with a time and memory budget
+        self.analysis = analysispool.AnalysisPool()
+
         # setup logging for the exctractor
         logging.getLogger('pyclowder').setLevel(logging.DEBUG)
         logging.getLogger('__main__').setLevel(logging.DEBUG)
@@ -262,7 +270,19 @@ class PycswExtractor(Extractor):
         msg['isZipShp'] = False
         combined_name = filename + "_" + storename
 
-        zipshp = zs.Utils(inputfile)
+        # projection and extent of a file with the same contents are reused
+        cache = resultcache.ResultCache('%s:v%d:shp' % (self.extractorName, CACHE_VERSION))
+        digest = resultcache.fileDigest(inputfile)
+        cached = cache.get(digest)
+        if cached is None:
+            try:
+                cached = self.analysis.run(zs.probeZipShp, inputfile)
+            except analysispool.JobError as e:
+                msg['errorMsg'].append(str(e))
+                return msg
+            cache.put(digest, cached)
+
+        zipshp = zs.Utils(inputfile, cached=cached)
         if not zipshp.hasError():
             msg['isZipShp'] = True
             if self.proxy_on.lower() == 'true':
@@ -343,7 +363,19 @@ class PycswExtractor(Extractor):
 
         uploadfile = inputfile
 
-        geotiffUtil = gu.Utils(uploadfile, self.raster_style)
+        # projection and extent of a file with the same contents are reused
+        cache = resultcache.ResultCache('%s:v%d:geotiff' % (self.extractorName, CACHE_VERSION))
+        digest = resultcache.fileDigest(uploadfile)
+        cached = cache.get(digest)
+        if cached is None:
+            try:
+                cached = self.analysis.run(gu.probeGeotiff, uploadfile, self.raster_style)
+            except analysispool.JobError as e:
+                msg['errorMsg'].append(str(e))
+                return msg
+            cache.put(digest, cached)
+
+        geotiffUtil = gu.Utils(uploadfile, self.raster_style, cached)
 
         if not geotiffUtil.hasError():
             msg['isGeotiff'] = True
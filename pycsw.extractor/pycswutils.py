@@ -9,9 +9,10 @@
 import requests
 import os, inspect, logging
 
-from pyproj import Proj, transform
 from urllib.parse import urlparse
 
+import extentengine
+
 
 class Utils:
 
@@ -126,12 +127,15 @@ class Utils:
 
     """
     convert EPSG 3857 bounding box to 4326 bounding box
+    a box crossing the antimeridian ends past the world edge (see
+    extentengine.mercatorBox); a record holds a single box, so it is
+    widened to all longitudes rather than given a minx above its maxx
     """
     def convert_bounding_box_3857_4326(self, bbox):
-        inProj = Proj(init='epsg:3857')
-        outProj = Proj(init='epsg:4326')
-        bbox[0], bbox[1] = transform(inProj,outProj, bbox[0], bbox[1])
-        bbox[2], bbox[3] = transform(inProj, outProj, bbox[2], bbox[3])
+        box = extentengine.geographicBox([float(value) for value in bbox])
+        if box[2] > 180.0:
+            box[0], box[2] = -180.0, 180.0
+        bbox[0], bbox[1], bbox[2], bbox[3] = box
 
         return bbox
 
@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip('osgeo')
+pytest.importorskip('requests')
+
+import extentengine
+import pycswutils
+
+
+def converted(box):
+    return pycswutils.Utils().convert_bounding_box_3857_4326([str(value) for value in extentengine.mercatorBox(box)])
+
+
+def test_convert_bounding_box():
+    assert converted([-120.0, 30.0, -100.0, 50.0]) == pytest.approx([-120.0, 30.0, -100.0, 50.0])
+
+
+def test_box_across_the_antimeridian_covers_all_longitudes():
+    minx, miny, maxx, maxy = converted([170.0, -20.0, 190.0, 10.0])
+    assert (minx, maxx) == (-180.0, 180.0)
+    assert (miny, maxy) == pytest.approx((-20.0, 10.0))
+
+
+def test_bbox_from_layer_url_is_lat_lon():
+    box = ','.join(str(value) for value in extentengine.mercatorBox([-120.0, 30.0, -100.0, 50.0]))
+    url = 'http://localhost/geoserver/wms?request=GetMap&layers=a:b&bbox=%s&width=640&srs=EPSG:3857' % box
+    assert pycswutils.Utils().parse_bbox_from_url(url) == pytest.approx([30.0, -120.0, 50.0, -100.0])